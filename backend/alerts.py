@@ -0,0 +1,233 @@
+"""Mention spike detector.
+
+Every ticker keeps a rolling baseline of its hourly activity: EWMA mean and
+variance of mentions per hour (hours without mentions count as zero) and of
+mean sentiment (over hours with at least a few mentions). After each pipeline
+write, observe() reads the current totals of only the (hour, ticker) pairs
+the batch touched from ticker_rollups, folds the hours that closed since each
+ticker was last seen into its baseline, and scores the open hour against it.
+Cost is O(tickers in the batch); history is never rescanned.
+
+An alert is raised the first time in an hour that a ticker with at least
+WSB_ALERT_MIN_COUNT mentions has
+  mentions   z >= WSB_ALERT_Z or count / baseline mean >= WSB_ALERT_RATIO
+  sentiment  mean sentiment WSB_ALERT_Z or more standard deviations off its baseline
+and lands in the alerts table (/api/alerts, /api/alerts/stream).
+
+The baselines live in memory and are written back to alert_baselines after
+each update, so they survive restarts and a move of the scraper lease to
+another worker (see leader.py); the first run against a database that
+already has history seeds them from ticker_rollups. Replay backfills don't
+feed the detector: their hours are long closed.
+
+WSB_ALERT_HALFLIFE_HOURS  baseline half-life
+WSB_ALERT_MIN_HOURS       hours of baseline a ticker needs before it can alert
+WSB_ALERT_MIN_COUNT       mentions in the hour before it can alert
+WSB_ALERT_Z, WSB_ALERT_RATIO  thresholds above
+"""
+
+import math
+import os
+import threading
+import time
+
+import leader
+import metrics
+from db import ROLLUP_BUCKET_SECONDS, store
+
+HALFLIFE_HOURS = float(os.environ.get("WSB_ALERT_HALFLIFE_HOURS", "24"))
+MIN_HOURS = int(os.environ.get("WSB_ALERT_MIN_HOURS", "6"))
+MIN_COUNT = int(os.environ.get("WSB_ALERT_MIN_COUNT", "10"))
+Z_THRESHOLD = float(os.environ.get("WSB_ALERT_Z", "4"))
+RATIO_THRESHOLD = float(os.environ.get("WSB_ALERT_RATIO", "5"))
+
+ALPHA = 1 - 0.5 ** (1 / HALFLIFE_HOURS)
+# Hours needed before a sentiment mean goes into the baseline; one-comment hours are noise
+_SENTIMENT_MIN_COUNT = 3
+# A steady ticker's EWMA variance can get close to 0; this keeps one odd hour from
+# becoming an enormous z
+_SENTIMENT_STD_FLOOR = 0.05
+# Zero hours folded one by one up to this many; past it the old mean is < 1e-4 of itself
+_MAX_GAP_HOURS = 14 * 24
+_EMPTY = (0, 0.0, 0.0, 0.0)
+
+metrics.describe("wsb_alerts_total", "Spike alerts raised, by kind")
+metrics.describe("wsb_alert_update_seconds", "Time per spike detector update (one pipeline batch)")
+metrics.describe("wsb_alert_tickers", "Tickers with a spike detector baseline")
+
+_lock = threading.Lock()
+_states = None  # ticker → _Baseline, loaded on first use
+_origin = None  # first hour the detector saw; unseen tickers had zero mentions since
+
+
+def _ewma(mean, var, x):
+    diff = x - mean
+    incr = ALPHA * diff
+    return mean + incr, (1 - ALPHA) * (var + diff * incr)
+
+
+class _Baseline:
+    __slots__ = ("bucket", "hours", "mean", "var", "s_hours", "s_mean", "s_var")
+
+    def __init__(self, bucket, hours=0, mean=0.0, var=0.0, s_hours=0, s_mean=0.0, s_var=0.0):
+        self.bucket = bucket  # the open hour, not yet in the baseline
+        self.hours = hours
+        self.mean = mean
+        self.var = var
+        self.s_hours = s_hours
+        self.s_mean = s_mean
+        self.s_var = s_var
+
+    def close(self, n, w, ws, wss):
+        """Fold the open hour's final totals into the baseline."""
+        if self.hours:
+            self.mean, self.var = _ewma(self.mean, self.var, n)
+        else:
+            self.mean = n  # an EWMA started at 0 would read every early hour as a spike
+        self.hours += 1
+        if n >= _SENTIMENT_MIN_COUNT and w > 0:
+            if self.s_hours:
+                self.s_mean, self.s_var = _ewma(self.s_mean, self.s_var, ws / w)
+            else:
+                self.s_mean = ws / w
+            self.s_hours += 1
+
+    def advance(self, bucket):
+        """Make `bucket` the open hour, folding the empty hours in between as zeros."""
+        gap = bucket - self.bucket - 1
+        for _ in range(min(gap, _MAX_GAP_HOURS)):
+            self.mean, self.var = _ewma(self.mean, self.var, 0)
+        self.hours += max(gap, 0)
+        self.bucket = bucket
+
+    def score(self, ticker, n, w, ws, wss, now):
+        """Alerts for the open hour at totals (n, w, ws, wss)."""
+        if n < MIN_COUNT:
+            return []
+        out = []
+        if self.hours >= MIN_HOURS:
+            # Counts are compared on the square-root scale, where Poisson noise is ~N(0, 1/4)
+            # at any rate (a normal z overstates small-count tails); spread beyond Poisson
+            # seen in the baseline widens it
+            dispersion = max(self.var / self.mean, 1.0) if self.mean > 0 else 1.0
+            z = 2 * (math.sqrt(n) - math.sqrt(self.mean)) / math.sqrt(dispersion)
+            ratio = n / self.mean if self.mean > 0 else None
+            if z >= Z_THRESHOLD or (ratio is not None and ratio >= RATIO_THRESHOLD):
+                out.append(self._alert(ticker, "mentions", n, n, self.mean, z, ratio, now))
+        if self.s_hours >= MIN_HOURS and w > 0:
+            value = ws / w
+            # The hour's own sampling noise counts too: a mean of 10 comments swings more than one of 500
+            sampling = max(wss / w - value * value, 0.0) / n
+            z = (value - self.s_mean) / max(math.sqrt(self.s_var + sampling), _SENTIMENT_STD_FLOOR)
+            if abs(z) >= Z_THRESHOLD:
+                out.append(self._alert(ticker, "sentiment", n, value, self.s_mean, z, None, now))
+        return out
+
+    def _alert(self, ticker, kind, n, value, baseline, z, ratio, now):
+        return {"ticker": ticker, "bucket": self.bucket, "kind": kind, "count": n,
+                "value": round(value, 4), "baseline": round(baseline, 4), "z": round(z, 2),
+                "ratio": round(ratio, 2) if ratio is not None else None, "created_at": now}
+
+    def row(self, ticker):
+        return (ticker, self.bucket, self.hours, self.mean, self.var, self.s_hours, self.s_mean, self.s_var)
+
+
+def _seed():
+    """Baselines for every ticker from the hourly history in ticker_rollups,
+    as if update() had seen every hour since the first one."""
+    states, last, origin = {}, None, store.get_first_bucket()
+    for ticker, bucket, *totals in store.iter_hour_totals():
+        state = states.get(ticker)
+        if state is None:
+            states[ticker] = _Baseline(bucket, bucket - origin)
+        else:
+            state.close(*last)
+            state.advance(bucket)
+        last = totals
+    return states
+
+
+def _load():
+    global _states, _origin
+    if _states is None:
+        rows = store.load_alert_baselines()
+        if rows:
+            _states = {r[0]: _Baseline(*r[1:]) for r in rows}
+        else:
+            start = time.perf_counter()
+            _states = _seed()
+            if _states:
+                store.save_alert_baselines(state.row(ticker) for ticker, state in _states.items())
+                print(f"[alerts] Seeded {len(_states)} baselines from rollups in "
+                      f"{time.perf_counter() - start:.1f}s")
+        if _states:
+            _origin = min(s.bucket - s.hours for s in _states.values())
+    return _states
+
+
+def update(keys, now=None):
+    """Fold in and score the (bucket, ticker) pairs a committed batch touched.
+    Returns the alerts newly raised."""
+    start = time.perf_counter()
+    now = int(now or time.time())
+    by_ticker = {}
+    for bucket, ticker in keys:
+        by_ticker.setdefault(ticker, set()).add(bucket)
+    if not by_ticker:
+        return []
+
+    global _origin
+    with _lock:
+        states = _load()
+        if _origin is None:
+            _origin = min(min(buckets) for buckets in by_ticker.values())
+        # The batch's hours, plus each known ticker's open hour if it's about to close
+        wanted = {(b, t) for t, buckets in by_ticker.items() for b in buckets}
+        for ticker, buckets in by_ticker.items():
+            state = states.get(ticker)
+            if state is not None and max(buckets) > state.bucket:
+                wanted.add((state.bucket, ticker))
+        totals = store.get_hour_totals(wanted)
+
+        alerts, touched = [], []
+        live = now // ROLLUP_BUCKET_SECONDS - 1
+        for ticker, buckets in by_ticker.items():
+            newest = max(buckets)
+            state = states.get(ticker)
+            if state is None:
+                # Never seen: zero mentions every hour since the detector started
+                state = states[ticker] = _Baseline(newest, max(newest - _origin, 0))
+            elif newest > state.bucket:
+                for bucket in sorted(b for b in buckets if b > state.bucket):
+                    state.close(*totals.get((state.bucket, ticker), _EMPTY))
+                    state.advance(bucket)
+            elif newest < state.bucket:
+                continue  # late rows for hours already folded in
+            touched.append(ticker)
+            if newest >= live:
+                alerts += state.score(ticker, *totals.get((newest, ticker), _EMPTY), now)
+
+        store.save_alert_baselines(states[t].row(t) for t in touched)
+        raised = store.insert_alerts(alerts)
+
+    for alert in raised:
+        metrics.inc("wsb_alerts_total", kind=alert["kind"])
+        print(f"[alerts] {alert['ticker']} {alert['kind']} spike: {alert['value']} "
+              f"vs baseline {alert['baseline']} (z={alert['z']})")
+    metrics.set_gauge("wsb_alert_tickers", len(states))
+    metrics.observe("wsb_alert_update_seconds", time.perf_counter() - start)
+    return raised
+
+
+def observe(mention_rows, now=None):
+    """update() for freshly written mention rows (tuples in MENTION_COLUMNS order)."""
+    return update({(row[3] // ROLLUP_BUCKET_SECONDS, row[0]) for row in mention_rows}, now)
+
+
+@leader.on_takeover
+def reset():
+    """Forget the in-memory baselines; the next update reloads them from the DB.
+    Runs when another worker scraped since this one last did."""
+    global _states, _origin
+    with _lock:
+        _states = _origin = None
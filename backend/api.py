@@ -1,14 +1,66 @@
+import time
+
+_IMPORT_START = time.perf_counter()
+
+import asyncio
+import json
 import os
-from fastapi import FastAPI, Query
+import resource
+from contextlib import asynccontextmanager
+from typing import Literal
+from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-import json
-from db import init_db, get_top_tickers, get_ticker_detail, get_db_stats, get_options_flow, get_options_summary, get_earnings_cache, set_earnings_cache
-from run_scraper import run_pipeline
-from earnings import fetch_earnings_data
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import leader
+import metrics
+from sources import enabled_sources
+from db import STORAGE, store, init_db, get_earnings_response, get_earnings_summaries, save_earnings
+
+# Heavy modules are imported on first use, not here:
+#   earnings    → yfinance + pandas (only /api/earnings needs them)
+#   run_scraper → scraper + VADER (only /api/scrape needs them)
+#   export      → pyarrow, when installed (only /api/export?format=arrow|parquet)
+#   storage     → duckdb / psycopg, only under WSB_STORAGE=duckdb|postgres, connected on first query
+# so a cold start can serve /api/tickers without paying for either.
+
+# /api/alerts/stream checks for new alerts this often (the pipeline may run in another process)
+ALERT_POLL_SECONDS = float(os.environ.get("WSB_ALERT_POLL_SECONDS", "2"))
+_SSE_KEEPALIVE_SECONDS = 15
+
+metrics.describe("wsb_startup_seconds", "Cold start timings: module import, lifespan init, first response")
+metrics.describe("wsb_process_rss_bytes", "Resident set size sampled at startup and on /api/metrics")
 
-app = FastAPI(title="WSB Sentiment Tracker")
+_first_response_seen = False
+
+
+def _rss_bytes():
+    """Current RSS from /proc, falling back to peak RSS where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@asynccontextmanager
+async def lifespan(app):
+    import_seconds = time.perf_counter() - _IMPORT_START
+    start = time.perf_counter()
+    init_db()
+    init_seconds = time.perf_counter() - start
+    rss = _rss_bytes()
+    metrics.set_gauge("wsb_startup_seconds", round(import_seconds, 4), phase="import")
+    metrics.set_gauge("wsb_startup_seconds", round(init_seconds, 4), phase="init")
+    metrics.set_gauge("wsb_process_rss_bytes", rss, at="startup")
+    print(f"[api] Startup: import {import_seconds * 1000:.0f}ms, init_db {init_seconds * 1000:.0f}ms, "
+          f"RSS {rss / 1e6:.0f}MB")
+    yield
+
+
+app = FastAPI(title="WSB Sentiment Tracker", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,39 +69,248 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-init_db()
+# Streamed responses skip compression: SSE events would sit in the compressor
+# until it filled, and arrow/parquet exports are compressed already
+_UNCOMPRESSED_PATHS = ("/api/alerts/stream", "/api/export")
+
+
+class _GZipMiddleware(GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in _UNCOMPRESSED_PATHS:
+            await self.app(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+
+# Level 6: nearly level 9's ratio on JSON for a fraction of the CPU
+app.add_middleware(_GZipMiddleware, minimum_size=1000, compresslevel=6)
+
+
+metrics.describe("wsb_http_request_seconds", "Request latency per route template")
+metrics.describe("wsb_http_requests_total", "Requests per route template and status code")
+metrics.describe("wsb_earnings_requests_total", "/api/earnings/{symbol} requests: stored hit, live fetch, or error")
+metrics.describe("wsb_earnings_cache_hit_ratio", "Share of /api/earnings/{symbol} requests served from stored results")
+metrics.describe("wsb_earnings_latency_p95_seconds", "p95 latency of /api/earnings/{symbol}")
+
+
+class _TimingMiddleware:
+    """Record per-route latency up to the last body chunk, so streamed responses
+    (/api/alerts/stream, /api/export) count their whole transfer, not just the
+    headers. Labels use the route template, not the raw path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+        done = False
+
+        def record():
+            global _first_response_seen
+            if not _first_response_seen:
+                _first_response_seen = True
+                first = time.perf_counter() - _IMPORT_START
+                metrics.set_gauge("wsb_startup_seconds", round(first, 4), phase="first_response")
+                print(f"[api] First response {first * 1000:.0f}ms after import")
+            path = getattr(scope.get("route"), "path", None) or "unmatched"
+            metrics.observe("wsb_http_request_seconds", time.perf_counter() - start,
+                            method=scope["method"], route=path)
+            metrics.inc("wsb_http_requests_total", method=scope["method"], route=path, status=status)
+
+        async def timed_send(message):
+            nonlocal status, done
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not done:
+                done = True
+                record()
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            # Errors and client disconnects mid-stream end the request without a final body
+            if not done:
+                done = True
+                record()
+
+
+app.add_middleware(_TimingMiddleware)
+
 
 # Serve built frontend in production
 STATIC_DIR = os.path.join(os.path.dirname(__file__), "..", "frontend", "dist")
 
 
 @app.get("/api/tickers")
-def api_tickers(hours: int = Query(24, ge=1, le=168), limit: int = Query(25, ge=1, le=100)):
-    """Get top mentioned tickers with aggregated sentiment."""
-    tickers = get_top_tickers(hours=hours, limit=limit)
-    return {"tickers": tickers, "hours": hours, "count": len(tickers)}
+def api_tickers(hours: int = Query(24, ge=1, le=168), limit: int = Query(25, ge=1, le=100),
+                exact: bool = False, weight: Literal["none", "upvotes", "authors"] = "none",
+                source: str = None):
+    """Get top mentioned tickers with aggregated sentiment.
+    weight: how avg_sentiment and its 95% CI weight mentions — none, upvotes
+    (log-scaled) or authors (first mention per author per hour).
+    source: one subreddit (e.g. options); default is every source.
+    unique_authors is a HyperLogLog estimate unless exact=true or source is set."""
+    source = source.lower() if source else None
+    tickers = store.get_top_tickers(hours=hours, limit=limit, exact=exact, weight=weight, source=source)
+    return {"tickers": tickers, "hours": hours, "weight": weight, "source": source, "count": len(tickers)}
 
 
 @app.get("/api/ticker/{symbol}")
-def api_ticker_detail(symbol: str, hours: int = Query(24, ge=1, le=168)):
+def api_ticker_detail(symbol: str, hours: int = Query(24, ge=1, le=168), source: str = None):
     """Get individual mentions for a specific ticker."""
-    mentions = get_ticker_detail(symbol, hours=hours)
-    return {"symbol": symbol.upper(), "mentions": mentions, "hours": hours, "count": len(mentions)}
+    source = source.lower() if source else None
+    mentions = store.get_ticker_detail(symbol, hours=hours, source=source)
+    return {"symbol": symbol.upper(), "mentions": mentions, "hours": hours, "source": source,
+            "count": len(mentions)}
+
+
+@app.get("/api/ticker/{symbol}/related")
+def api_related(symbol: str, hours: int = Query(24, ge=1, le=168), limit: int = Query(10, ge=1, le=50)):
+    """Tickers most often mentioned alongside `symbol` in the same post or comment."""
+    related = store.get_related_tickers(symbol, hours=hours, limit=limit)
+    return {"symbol": symbol.upper(), "related": related, "hours": hours, "count": len(related)}
+
+
+@app.get("/api/graph")
+def api_graph(hours: int = Query(24, ge=1, le=168), limit: int = Query(25, ge=2, le=100),
+              min_together: int = Query(2, ge=1)):
+    """Co-mention graph of the current leaderboard: the top `limit` tickers as
+    nodes, an edge for every pair mentioned together at least `min_together` times."""
+    nodes = [{"ticker": t["ticker"], "mention_count": t["mention_count"]}
+             for t in store.get_top_tickers(hours=hours, limit=limit)]
+    edges = store.get_comention_graph({n["ticker"]: n["mention_count"] for n in nodes}, hours=hours,
+                                min_together=min_together)
+    return {"nodes": nodes, "edges": edges, "hours": hours}
+
+
+@app.get("/api/alerts")
+def api_alerts(hours: int = Query(24, ge=1, le=168), limit: int = Query(50, ge=1, le=500),
+               ticker: str = None, since_id: int = Query(0, ge=0)):
+    """Mention and sentiment spikes raised by the spike detector, newest first."""
+    alerts = store.get_alerts(since_id=since_id, hours=hours, limit=limit, ticker=ticker)
+    return {"alerts": alerts, "hours": hours, "count": len(alerts)}
+
+
+@app.get("/api/alerts/stream")
+async def api_alerts_stream(request: Request, since_id: int = Query(None, ge=0)):
+    """Server-sent events: one `alert` event per new alert, id = alert id.
+    Starts after `since_id` (or the Last-Event-ID a reconnecting EventSource
+    sends), else with the next alert raised."""
+    last_id = since_id
+    if last_id is None and request.headers.get("last-event-id", "").isdigit():
+        last_id = int(request.headers["last-event-id"])
+    if last_id is None:
+        newest = await run_in_threadpool(store.get_alerts, 0, 168, 1)
+        last_id = newest[0]["id"] if newest else 0
+
+    async def events():
+        nonlocal last_id
+        quiet = 0.0
+        yield "retry: 5000\n\n"
+        while not await request.is_disconnected():
+            alerts = await run_in_threadpool(store.get_alerts, last_id, 168, 100, None, True)
+            for alert in alerts:
+                last_id = alert["id"]
+                yield f"id: {last_id}\nevent: alert\ndata: {json.dumps(alert)}\n\n"
+            quiet = 0.0 if alerts else quiet + ALERT_POLL_SECONDS
+            if quiet >= _SSE_KEEPALIVE_SECONDS:
+                quiet = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(ALERT_POLL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _status(stats):
+    stats["sources"] = [{"name": s.name, "priority": s.priority, "listings": s.listings} for s in enabled_sources()]
+    stats["scraper"] = leader.status()
+    stats["storage"] = STORAGE
+    return stats
 
 
 @app.get("/api/status")
 def api_status():
     """Get database stats and last scrape info."""
-    stats = get_db_stats()
-    return stats
+    return _status(store.get_db_stats())
+
+
+def _columns(rows):
+    """A list of dicts as {key: [value per row]}: each key sent once instead of once per row."""
+    return {key: [r[key] for r in rows] for key in rows[0]} if rows else {}
+
+
+@app.get("/api/dashboard")
+def api_dashboard(hours: int = Query(24, ge=1, le=168), limit: int = Query(50, ge=1, le=100)):
+    """Everything the dashboard's first view needs in one response: what
+    /api/tickers, /api/options and /api/status return, read from one DB
+    snapshot, with every list encoded column-wise (_columns)."""
+    data = store.get_dashboard(hours=hours, limit=limit)
+    options, summary = data["options"], data["options"]["summary"]
+    return JSONResponse({
+        "hours": hours,
+        "tickers": _columns(data["tickers"]),
+        "options": {
+            "summary": {**summary, "top_calls": _columns(summary["top_calls"]),
+                        "top_puts": _columns(summary["top_puts"])},
+            "flow": _columns(options["flow"]),
+            "buckets": {name: _columns(rows) for name, rows in options["buckets"].items()},
+        },
+        "status": _status(data["stats"]),
+    })
 
 
 @app.get("/api/options")
-def api_options(hours: int = Query(24, ge=1, le=168)):
-    """Get options flow summary + top plays."""
-    summary = get_options_summary(hours=hours)
-    flow = get_options_flow(hours=hours)
-    return {"summary": summary, "flow": flow, "hours": hours}
+def api_options(hours: int = Query(24, ge=1, le=168), exact: bool = False, source: str = None):
+    """Get options flow summary + top plays, and the window by days to expiry and moneyness."""
+    source = source.lower() if source else None
+    summary = store.get_options_summary(hours=hours, source=source)
+    flow = store.get_options_flow(hours=hours, exact=exact, source=source)
+    buckets = store.get_options_buckets(hours=hours, source=source)
+    return {"summary": summary, "flow": flow, "buckets": buckets, "hours": hours, "source": source}
+
+
+@app.get("/api/export")
+def api_export(table: Literal["mentions", "options_flow"] = "mentions",
+               format: Literal["ndjson", "arrow", "parquet"] = "ndjson",
+               since: int = Query(None, description="unix seconds; default: 24h before `until`"),
+               until: int = Query(None, description="unix seconds, exclusive; default: now"),
+               tickers: str = Query(None, description="comma-separated; default: all"),
+               source: str = None):
+    """Stream every row of `table` in [since, until), oldest first, as NDJSON,
+    an Arrow IPC stream or Parquet. Memory stays bounded by one batch whatever
+    the range; arrow and parquet need pyarrow installed."""
+    import export
+    if format != "ndjson" and not export.have_pyarrow():
+        return PlainTextResponse(f"format={format} needs pyarrow (pip install pyarrow); use format=ndjson",
+                                 status_code=501)
+    until = until if until is not None else int(time.time()) + 1
+    since = since if since is not None else until - 24 * 3600
+    wanted = [t.strip().upper() for t in tickers.split(",") if t.strip()] if tickers else None
+    media_type, ext = export.FORMATS[format]
+    chunks = export.stream_export(table, format, since, until, wanted, source.lower() if source else None)
+    return StreamingResponse(chunks, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{table}-{since}-{until}.{ext}"'})
+
+
+@app.get("/api/earnings")
+def api_earnings_batch(symbols: str = Query(None, description="comma-separated; default: the 24h leaderboard")):
+    """Stored earnings summaries (no event history) for many symbols in one query,
+    highest GUH score first. Never calls Yahoo — symbols without a fresh stored
+    result are listed under `missing`; /api/earnings/{symbol} fetches them."""
+    if symbols:
+        wanted = [s.strip().upper() for s in symbols.split(",") if s.strip()]
+    else:
+        wanted = [t["ticker"] for t in store.get_top_tickers(hours=24, limit=25)]
+    results = get_earnings_summaries(wanted)
+    found = {r["symbol"] for r in results}
+    return {"results": results, "missing": [s for s in dict.fromkeys(wanted) if s not in found],
+            "count": len(results)}
 
 
 @app.get("/api/earnings/{symbol}")
@@ -57,28 +318,60 @@ def api_earnings(symbol: str):
     """Get historical post-earnings stock performance — moon or tank predictor."""
     symbol = symbol.upper()
 
-    # Check cache first
-    cached = get_earnings_cache(symbol)
-    if cached:
-        data = json.loads(cached)
-        data["cached"] = True
-        return data
+    # Stored results are returned as the bytes serialized when they were saved
+    cached = get_earnings_response(symbol)
+    if cached is not None:
+        metrics.inc("wsb_earnings_requests_total", result="hit")
+        return Response(cached, media_type="application/json")
 
     # Fetch fresh data
+    from earnings import fetch_earnings_data
     data = fetch_earnings_data(symbol)
     data["cached"] = False
 
-    # Cache successful results
+    # Store successful results
     if data.get("error") is None:
-        set_earnings_cache(symbol, json.dumps(data))
+        save_earnings(data)
+        metrics.inc("wsb_earnings_requests_total", result="miss")
+    else:
+        metrics.inc("wsb_earnings_requests_total", result="error")
 
     return data
 
 
+def _earnings_gauges():
+    """Derived /api/earnings/{symbol} gauges: stored-result hit ratio and p95 latency."""
+    counts = {r: metrics.get_counter("wsb_earnings_requests_total", result=r) for r in ("hit", "miss", "error")}
+    total = sum(counts.values())
+    if total:
+        metrics.set_gauge("wsb_earnings_cache_hit_ratio", round(counts["hit"] / total, 4))
+    hist = metrics.histogram_snapshot("wsb_http_request_seconds", method="GET", route="/api/earnings/{symbol}")
+    p95 = metrics.quantile(hist, 0.95)
+    if p95 is not None:
+        metrics.set_gauge("wsb_earnings_latency_p95_seconds", p95)
+
+
+@app.get("/api/metrics")
+def api_metrics():
+    """Prometheus text-format metrics (pipeline stages, fetch/request/query latency)."""
+    metrics.set_gauge("wsb_process_rss_bytes", _rss_bytes(), at="now")
+    _earnings_gauges()
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/api/scrape")
 def api_scrape():
-    """Trigger a scrape run. Returns pipeline stats."""
-    stats = run_pipeline()
+    """Trigger a scrape run. Returns pipeline stats.
+
+    Earnings for the new leaderboard are warmed in the background afterwards.
+    409 if a scrape is already running in this or another worker."""
+    from run_scraper import run_pipeline
+    from warmer import schedule_warm
+    try:
+        stats = run_pipeline()
+    except leader.NotLeader as e:
+        return JSONResponse({"detail": str(e), "leader": e.holder}, status_code=409)
+    stats["earnings_warm_started"] = schedule_warm()
     return stats
 
 
@@ -0,0 +1,64 @@
+"""Append-only archive of raw Reddit payloads for offline replay.
+
+When WSB_ARCHIVE_RAW=1, every listing page and comment payload the scraper
+fetches is appended to data/raw/YYYY-MM-DD.jsonl.gz as one JSON record per
+line: {"t": fetched_at, "kind": "listing" | "comments" | "morechildren", "url": ...,
+"payload": ...}.
+Each append writes its own gzip member, so files are never rewritten and a
+crash mid-write loses at most the last record.
+"""
+
+import glob
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), "data", "raw")
+ARCHIVE_RAW = os.environ.get("WSB_ARCHIVE_RAW", "0") == "1"
+
+_lock = threading.Lock()
+
+
+def _path_for(ts):
+    day = datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d")
+    return os.path.join(ARCHIVE_DIR, f"{day}.jsonl.gz")
+
+
+def archive_payload(kind, url, payload, fetched_at=None):
+    """Append one raw payload to today's archive file."""
+    ts = int(fetched_at if fetched_at is not None else datetime.now(timezone.utc).timestamp())
+    line = json.dumps({"t": ts, "kind": kind, "url": url, "payload": payload},
+                      separators=(",", ":")).encode() + b"\n"
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with _lock:
+        with gzip.open(_path_for(ts), "ab", compresslevel=6) as f:
+            f.write(line)
+
+
+def archive_files(since=None, until=None):
+    """Archive files in chronological order, optionally bounded by YYYY-MM-DD dates (inclusive)."""
+    files = sorted(glob.glob(os.path.join(ARCHIVE_DIR, "*.jsonl.gz")))
+    out = []
+    for path in files:
+        day = os.path.basename(path).split(".")[0]
+        if since and day < since:
+            continue
+        if until and day > until:
+            continue
+        out.append(path)
+    return out
+
+
+def iter_archive(since=None, until=None):
+    """Stream archived records oldest-first without loading whole files."""
+    for path in archive_files(since, until):
+        try:
+            with gzip.open(path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        except (EOFError, OSError) as e:
+            # Truncated trailing member from an interrupted write — keep what we read
+            print(f"[archive] Stopped reading {os.path.basename(path)}: {e}")
@@ -0,0 +1,268 @@
+"""Seeded synthetic WSB corpus — posts, nested comment trees, emoji, option strings.
+
+Everything is generated from a `random.Random(seed)`, so the same seed gives
+byte-identical payloads across machines and commits. Payloads follow the shape
+of Reddit's public JSON (listing → children → {kind, data}) so they can be fed
+straight to the scraper's parsers or served by the fake Reddit server.
+"""
+
+import random
+import time
+
+# Ticker universe — doubles as the stubbed SEC list so no download is needed
+TICKERS = [
+    "NVDA", "TSLA", "AAPL", "AMD", "SPY", "QQQ", "GME", "AMC", "PLTR", "MSFT",
+    "META", "AMZN", "GOOGL", "NFLX", "INTC", "MU", "SOFI", "RIVN", "COIN", "HOOD",
+    "SMCI", "ARM", "AVGO", "TSM", "BABA", "DIS", "BA", "UNH", "JPM", "XOM",
+    "MSTR", "RKLB", "IONQ", "CVNA", "UPST", "AFRM", "SNOW", "CRWD", "SHOP", "ROKU",
+]
+
+EMOJI = ["🚀", "🌙", "💎", "🙌", "🦍", "📈", "💰", "🤑", "🔥", "📉", "💀", "🤡", "😭", "🐻", "🐂"]
+
+_PHRASES = [
+    "to the moon", "this is the way", "bought the dip", "guh", "wife's boyfriend approves",
+    "tendies incoming", "bagholding since January", "IV crush got me", "loading up",
+    "diamond hands", "rugpull incoming", "printer goes brrr", "short squeeze soon",
+    "puts are free money", "calls are free money", "I'm down 90%", "theta gang wins",
+    "sir this is a Wendy's", "earnings will moon", "bearish af", "bullish af",
+    "literally can't go tits up", "my portfolio is dead", "breakout confirmed",
+]
+
+_FILLER = [
+    "what", "do", "you", "think", "about", "the", "market", "today", "honestly", "lol",
+    "idk", "maybe", "going", "to", "hold", "until", "friday", "it", "is", "over",
+    "again", "yesterday", "tomorrow", "nobody", "knows", "anything", "really",
+]
+
+_TITLES = [
+    "Daily Discussion Thread for {date}",
+    "What Are Your Moves Tomorrow, {date}",
+    "{t} DD: why it's going to {p}",
+    "{t} YOLO update — {p}",
+    "Gain porn: {t} calls paid off",
+    "Loss porn: {t} puts {p}",
+    "Is {t} the next GME?",
+    "{t} earnings thread",
+]
+
+_EXPIRIES = ["0DTE", "weeklies", "FDs", "leaps", "friday", "3/27", "4/17", "12/19/2025", "monthly", ""]
+
+
+def _row_source(i):
+    """Source for generated row i: mostly r/wallstreetbets, every 4th from r/options.
+    Derived from the index so adding the column doesn't shift the rng stream."""
+    return "options" if i % 4 == 0 else "wallstreetbets"
+
+
+class CorpusGenerator:
+    """Deterministic generator of WSB-shaped text and Reddit JSON payloads."""
+
+    def __init__(self, seed=42, now=1_750_000_000):
+        self.rng = random.Random(seed)
+        self.now = now
+        self._next_id = 0
+
+    def _id(self):
+        self._next_id += 1
+        return format(self._next_id, "x").rjust(7, "a")
+
+    def option_string(self):
+        r = self.rng
+        t = r.choice(TICKERS)
+        strike = r.choice([5, 10, 25, 50, 100, 150, 200, 250, 300, 420, 500, 600, 680])
+        style = r.random()
+        if style < 0.5:
+            return f"{'$' if r.random() < 0.3 else ''}{t} {strike}{r.choice('cp')} {r.choice(_EXPIRIES)}".strip()
+        if style < 0.8:
+            return f"{t} {strike} {r.choice(['calls', 'puts', 'call', 'put'])} {r.choice(_EXPIRIES)}".strip()
+        return f"{t} {r.choice(['0DTE', 'weeklies', 'leaps', 'FDs'])}"
+
+    def text(self, min_words=4, max_words=40, ticker_rate=0.5, option_rate=0.15, emoji_rate=0.3):
+        """A comment-like body mixing filler, slang, tickers, options and emoji."""
+        r = self.rng
+        parts = []
+        for _ in range(r.randint(min_words, max_words)):
+            x = r.random()
+            if x < 0.08:
+                parts.append(r.choice(_PHRASES))
+            else:
+                parts.append(r.choice(_FILLER))
+        if r.random() < ticker_rate:
+            for _ in range(r.randint(1, 3)):
+                t = r.choice(TICKERS)
+                parts.insert(r.randrange(len(parts) + 1), f"${t}" if r.random() < 0.3 else t)
+        if r.random() < option_rate:
+            parts.append(self.option_string())
+        if r.random() < emoji_rate:
+            parts.append(r.choice(EMOJI) * r.randint(1, 4))
+        return " ".join(parts)
+
+    def title(self):
+        r = self.rng
+        return r.choice(_TITLES).format(
+            date="June 15, 2025", t=r.choice(TICKERS), p=r.choice(_PHRASES))
+
+    def post(self):
+        """One post in Reddit's t3 `data` shape."""
+        r = self.rng
+        return {
+            "id": self._id(),
+            "title": self.title(),
+            "selftext": self.text(0, 120) if r.random() < 0.6 else "",
+            "author": f"ape{r.randint(1, 5000)}",
+            "score": int(r.paretovariate(1.2) * 3),
+            "created_utc": float(self.now - r.randint(0, 24 * 3600)),
+            "num_comments": r.randint(0, 3000),
+        }
+
+    def comment(self, created_after, ticker_rate=0.5):
+        r = self.rng
+        body = self.text(ticker_rate=ticker_rate)
+        if r.random() < 0.03:
+            body = r.choice(["[deleted]", "[removed]"])
+        return {
+            "id": self._id(),
+            "body": body,
+            "author": f"ape{r.randint(1, 5000)}",
+            "score": int(r.paretovariate(1.5)),
+            "created_utc": float(created_after + r.randint(0, 6 * 3600)),
+        }
+
+    def comment_tree(self, n_comments, max_depth=6, branching=0.45, more_rate=0.0, ticker_rate=0.5):
+        """Return a list of t1 children (with nested `replies`) holding ~n_comments comments.
+
+        branching: probability that each new comment is a reply rather than top-level.
+        more_rate: probability of appending a `more` stub to a reply list.
+        ticker_rate: probability that a comment mentions at least one ticker.
+        """
+        r = self.rng
+        top = []
+        # (children_list, depth) slots a new comment can be attached to
+        slots = [(top, 0)]
+        for _ in range(n_comments):
+            if len(slots) > 1 and r.random() < branching:
+                children, depth = slots[r.randrange(1, len(slots))]
+            else:
+                children, depth = top, 0
+            data = self.comment(self.now - 24 * 3600, ticker_rate=ticker_rate)
+            node = {"kind": "t1", "data": data}
+            children.append(node)
+            if depth + 1 <= max_depth:
+                replies = []
+                data["replies"] = {"kind": "Listing", "data": {"children": replies}}
+                slots.append((replies, depth + 1))
+            else:
+                data["replies"] = ""
+        if more_rate:
+            for children, _ in slots:
+                if children and r.random() < more_rate:
+                    children.append({"kind": "more", "data": {
+                        "count": r.randint(1, 50), "children": [self._id() for _ in range(r.randint(1, 5))]}})
+        # Reddit sends "" for comments without replies
+        for children, _ in slots:
+            for node in children:
+                if node["kind"] == "t1" and node["data"].get("replies") == {"kind": "Listing", "data": {"children": []}}:
+                    node["data"]["replies"] = ""
+        return top
+
+    def listing(self, posts, after=None):
+        return {"kind": "Listing", "data": {
+            "children": [{"kind": "t3", "data": p} for p in posts], "after": after}}
+
+    def comments_payload(self, post, n_comments, **tree_kwargs):
+        """The [post listing, comment listing] pair Reddit returns for /comments/{id}.json."""
+        return [
+            self.listing([post]),
+            {"kind": "Listing", "data": {"children": self.comment_tree(n_comments, **tree_kwargs), "after": None}},
+        ]
+
+    def spam(self, recent):
+        """A bot/copypasta comment body: a canned line, a verbatim repeat of a
+        recent body, or a recent body with one word swapped."""
+        r = self.rng
+        x = r.random()
+        if x < 0.4 or not recent:
+            t = r.choice(TICKERS[:8])
+            return r.choice([f"{t} 0DTE {'🚀' * r.randint(1, 4)}", f"{t} to the moon",
+                             f"{t} calls {r.choice(EMOJI)}", "this is the way", "guh"])
+        body = r.choice(recent)
+        if x < 0.75:
+            return body
+        words = body.split(" ")
+        words[r.randrange(len(words))] = r.choice(_FILLER)
+        return " ".join(words)
+
+    def items(self, n, comment_ratio=0.9, spam_rate=0.0):
+        """Flat pipeline items (the dicts fetch_posts/expand_comments produce).
+
+        spam_rate: fraction of comments that are bot/copypasta repeats (see spam()).
+        """
+        r = self.rng
+        out = []
+        recent = []
+        for _ in range(n):
+            if r.random() < comment_ratio:
+                c = self.comment(self.now - 24 * 3600)
+                if spam_rate and r.random() < spam_rate:
+                    c["body"] = self.spam(recent)
+                else:
+                    recent.append(c["body"])
+                    if len(recent) > 200:
+                        recent.pop(0)
+                out.append({
+                    "id": f"p{self._id()}_{c['id']}",
+                    "title": c["body"][:500],
+                    "selftext": "",
+                    "author": c["author"],
+                    "upvotes": c["score"],
+                    "created_utc": int(c["created_utc"]),
+                    "source_type": "comment",
+                })
+            else:
+                p = self.post()
+                out.append({
+                    "id": p["id"],
+                    "title": p["title"],
+                    "selftext": p["selftext"],
+                    "author": p["author"],
+                    "upvotes": p["score"],
+                    "created_utc": int(p["created_utc"]),
+                    "num_comments": p["num_comments"],
+                    "source_type": "post",
+                })
+        return out
+
+    def mention_rows(self, n, hours=168):
+        """Rows in insert_mentions_batch shape, spread over the last `hours`."""
+        r = self.rng
+        rows = []
+        for i in range(n):
+            ts = self.now - r.randint(0, hours * 3600)
+            rows.append((
+                r.choice(TICKERS), f"b{i}", round(r.uniform(-1, 1), 4), ts,
+                r.choice(["post", "comment"]), self.text(3, 12)[:200],
+                f"ape{r.randint(1, 20000)}", int(r.paretovariate(1.5)), 1.0, _row_source(i),
+            ))
+        return rows
+
+    def option_rows(self, n, hours=168):
+        """Rows in insert_options_batch shape, spread over the last `hours`."""
+        r = self.rng
+        rows = []
+        for i in range(n):
+            ts = self.now - r.randint(0, hours * 3600)
+            t = r.choice(TICKERS)
+            strike = float(r.choice([5, 10, 50, 100, 200, 300, 500]))
+            kind = r.choice(["call", "put"])
+            category = r.choice(["0DTE", "weekly", "monthly", "LEAPS", None])
+            dte = {"0DTE": 0, "weekly": r.randint(0, 6), "monthly": r.randint(3, 35),
+                   "LEAPS": r.randint(366, 700), None: None}[category]
+            underlying = round(strike * r.uniform(0.7, 1.3), 2) if r.random() < 0.8 else None
+            otm = None if underlying is None else round((strike / underlying - 1) * (100 if kind == "call" else -100), 2)
+            rows.append((
+                t, strike, kind, None, category,
+                f"{t} {int(strike)}{kind[0]}", f"o{i}", round(r.uniform(-1, 1), 4), ts,
+                f"ape{r.randint(1, 20000)}", int(r.paretovariate(1.5)), 1.0, _row_source(i),
+                None if dte is None else time.strftime("%Y-%m-%d", time.gmtime(ts + dte * 86400)), dte, underlying, otm,
+            ))
+        return rows
@@ -0,0 +1,295 @@
+"""Local fake of Reddit's public JSON endpoints, backed by the synthetic corpus.
+
+Serves /r/<sub>/{hot,new,rising}.json with `limit`/`after` pagination and
+/r/<sub>/comments/<id>.json. Point `scraper.BASE` at `server.base` to run the
+real scraper against it.
+
+With subreddits=[...] it hosts several subs, each with its own listings.
+Multireddit listings (/r/a+b/hot.json) interleave the subs' listings, and a
+thread's comments are only served under its own sub.
+
+With deep_trees=True every post gets a full comment tree sized to its
+num_comments (heavy-tailed, megathreads in the thousands) with its own ticker
+density. /comments/<id>.json then honours `limit`, collapsing the rest into
+`more` stubs, and /api/morechildren.json expands them, like Reddit does.
+
+Like Reddit it keeps connections alive, gzips responses for clients that send
+Accept-Encoding: gzip, and tags 200s with an ETag, answering a matching
+If-None-Match with an empty 304.
+"""
+
+import hashlib
+import json
+import random
+import socket
+import zlib
+import threading
+from itertools import zip_longest
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from bench.corpus import CorpusGenerator
+
+
+class FakeReddit:
+    """Pre-generated listings + lazily generated (but seeded) comment payloads."""
+
+    def __init__(self, seed=42, posts_per_listing=200, comments_per_post=150, subreddit="wallstreetbets",
+                 deep_trees=False, subreddits=None):
+        self.seed = seed
+        self.gen = CorpusGenerator(seed)
+        self.subreddits = list(subreddits or [subreddit])
+        self.subreddit = self.subreddits[0]
+        self.comments_per_post = comments_per_post
+        self.listings = {}  # (sub, listing) → posts
+        for sub in self.subreddits:
+            for name, n in (("hot", posts_per_listing), ("new", posts_per_listing), ("rising", posts_per_listing // 4)):
+                posts = [self.gen.post() for _ in range(n)]
+                for p in posts:
+                    p["subreddit"] = sub
+                self.listings[(sub, name)] = posts
+        self._multi = {}
+        self.posts = {p["id"]: p for posts in self.listings.values() for p in posts}
+        self._comments = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.connections = 0
+        self.not_modified = 0
+        self._gzipped = {}  # etag → gzipped body
+
+        self.deep_trees = deep_trees
+        self._trees = {}  # post_id → (top-level children, {comment id: node})
+        self.densities = {}
+        if deep_trees:
+            r = random.Random(seed)
+            for p in self.posts.values():
+                if "Discussion" in p["title"] or "Moves" in p["title"]:
+                    p["num_comments"] = r.randint(1500, 4000)
+                else:
+                    p["num_comments"] = min(int(r.paretovariate(1.1) * 8) - 8, 1500)
+                self.densities[p["id"]] = r.uniform(0.05, 0.8)
+
+    def _tree(self, post_id):
+        """Full comment tree for a deep_trees post, generated from a per-post seed
+        so request order doesn't change the content."""
+        with self._lock:
+            if post_id not in self._trees:
+                idx = list(self.posts).index(post_id)
+                g = CorpusGenerator(self.seed * 100_003 + idx, now=self.gen.now)
+                g._next_id = (idx + 1) << 24  # keep comment ids unique across posts
+                top = g.comment_tree(self.posts[post_id]["num_comments"], max_depth=12, branching=0.6,
+                                     ticker_rate=self.densities[post_id])
+                index = {}
+                stack = list(top)
+                while stack:
+                    node = stack.pop()
+                    node["data"]["link_id"] = f"t3_{post_id}"
+                    index[node["data"]["id"]] = node
+                    stack.extend(_replies(node))
+                self._trees[post_id] = (top, index)
+            return self._trees[post_id]
+
+    def grow(self, post_id, n, reply_rate=0.5):
+        """Add n newer comments to a deep_trees post (for multi-run scenarios)."""
+        top, index = self._tree(post_id)
+        g = CorpusGenerator(self.seed + len(index), now=self.gen.now + 3600)
+        g._next_id = len(index) + (1 << 40) + (list(self.posts).index(post_id) << 24)
+        nodes = list(index.values())
+        for _ in range(n):
+            data = g.comment(g.now, ticker_rate=self.densities[post_id])
+            data["link_id"] = f"t3_{post_id}"
+            data["replies"] = ""
+            node = {"kind": "t1", "data": data}
+            if nodes and g.rng.random() < reply_rate:
+                parent = g.rng.choice(nodes)["data"]
+                if not parent.get("replies"):
+                    parent["replies"] = {"kind": "Listing", "data": {"children": []}}
+                parent["replies"]["data"]["children"].insert(0, node)
+            else:
+                top.insert(0, node)
+            index[data["id"]] = node
+        self.posts[post_id]["num_comments"] += n
+
+    def _truncated(self, post_id, limit):
+        """[post, comments] payload holding at most `limit` comments breadth-first;
+        everything else is collapsed into `more` stubs on its parent."""
+        top, _ = self._tree(post_id)
+        out_top = []
+        queue = [(top, out_top, f"t3_{post_id}")]
+        budget = limit
+        while queue:
+            src, dst, parent = queue.pop(0)
+            hidden = []
+            for node in src:
+                if budget <= 0:
+                    hidden.append(node)
+                    continue
+                budget -= 1
+                data = dict(node["data"], replies="")
+                dst.append({"kind": "t1", "data": data})
+                children = _replies(node)
+                if children:
+                    sub = []
+                    data["replies"] = {"kind": "Listing", "data": {"children": sub}}
+                    queue.append((children, sub, f"t1_{data['id']}"))
+            if hidden:
+                dst.append(_more_stub(hidden, parent))
+        return [self.gen.listing([self.posts[post_id]]),
+                {"kind": "Listing", "data": {"children": out_top, "after": None}}]
+
+    def more_children(self, link_id, ids):
+        """/api/morechildren: the requested comments, each with its replies collapsed into a stub."""
+        post_id = link_id.split("_", 1)[-1]
+        if post_id not in self.posts:
+            return 404, b"{}"
+        _, index = self._tree(post_id)
+        things = []
+        for cid in ids[:100]:
+            node = index.get(cid)
+            if node is None:
+                continue
+            things.append({"kind": "t1", "data": dict(node["data"], replies="")})
+            children = _replies(node)
+            if children:
+                things.append(_more_stub(children, f"t1_{cid}"))
+        return 200, json.dumps({"json": {"errors": [], "data": {"things": things}}}).encode()
+
+    def comments(self, post_id):
+        with self._lock:
+            if post_id not in self._comments:
+                self._comments[post_id] = json.dumps(
+                    self.gen.comments_payload(self.posts[post_id], self.comments_per_post)).encode()
+            return self._comments[post_id]
+
+    def _listing(self, subs, name):
+        """One sub's listing, or the round-robin merge of several; None if unknown."""
+        if (subs[0], name) not in self.listings:
+            return None
+        if len(subs) == 1:
+            return self.listings[(subs[0], name)]
+        with self._lock:
+            if (subs, name) not in self._multi:
+                lists = [self.listings[(sub, name)] for sub in subs]
+                self._multi[(subs, name)] = [p for row in zip_longest(*lists) for p in row if p is not None]
+            return self._multi[(subs, name)]
+
+    def route(self, path, query):
+        """Return (status, body bytes) for a request path."""
+        if path == "/api/morechildren.json":
+            ids = query.get("children", [""])[0].split(",")
+            return self.more_children(query.get("link_id", [""])[0], [i for i in ids if i])
+
+        if not path.startswith("/r/") or not path.endswith(".json") or path.count("/") < 3:
+            return 404, b"{}"
+        subs, rest = path[len("/r/"):-len(".json")].split("/", 1)
+        subs = tuple(subs.split("+"))
+        if any(sub not in self.subreddits for sub in subs):
+            return 404, b"{}"
+
+        if rest.startswith("comments/"):
+            post_id = rest.split("/")[1]
+            if post_id not in self.posts or self.posts[post_id]["subreddit"] not in subs:
+                return 404, b"{}"
+            if self.deep_trees:
+                limit = int(query.get("limit", ["200"])[0])
+                return 200, json.dumps(self._truncated(post_id, limit)).encode()
+            return 200, self.comments(post_id)
+
+        posts = self._listing(subs, rest)
+        if posts is not None:
+            limit = int(query.get("limit", ["25"])[0])
+            after = query.get("after", [None])[0]
+            start = 0
+            if after:
+                ids = [p["id"] for p in posts]
+                start = ids.index(after) + 1 if after in ids else len(posts)
+            page = posts[start:start + limit]
+            next_after = page[-1]["id"] if page and start + limit < len(posts) else None
+            return 200, json.dumps(self.gen.listing(page, next_after)).encode()
+
+        return 404, b"{}"
+
+
+def _replies(node):
+    replies = node["data"].get("replies")
+    if replies and isinstance(replies, dict):
+        return replies["data"]["children"]
+    return []
+
+
+def _subtree_size(node):
+    size, stack = 0, [node]
+    while stack:
+        n = stack.pop()
+        size += 1
+        stack.extend(_replies(n))
+    return size
+
+
+def _more_stub(nodes, parent_id):
+    ids = [n["data"]["id"] for n in nodes]
+    return {"kind": "more", "data": {
+        "count": sum(_subtree_size(n) for n in nodes), "name": f"t1_{ids[0]}", "id": ids[0],
+        "parent_id": parent_id, "children": ids}}
+
+
+def _make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out as separate writes; without this, Nagle holds
+            # the body back for the client's delayed ACK on kept-alive connections
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            fake.connections += 1
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            status, body = fake.route(url.path, parse_qs(url.query))
+            fake.requests += 1
+            headers = {"Content-Type": "application/json"}
+            if status == 200:
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                headers["ETag"] = etag
+                if self.headers.get("If-None-Match") == etag:
+                    status, body = 304, b""
+                    fake.not_modified += 1
+                elif "gzip" in (self.headers.get("Accept-Encoding") or ""):
+                    with fake._lock:
+                        gz = fake._gzipped.get(etag)
+                    if gz is None:
+                        c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                        gz = c.compress(body) + c.flush()
+                        with fake._lock:
+                            fake._gzipped[etag] = gz
+                    body = gz
+                    headers["Content-Encoding"] = "gzip"
+            fake.bytes_sent += len(body)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+@contextmanager
+def serve(fake):
+    """Run `fake` on an ephemeral localhost port. Yields the base URL for the subreddit."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(fake))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address
+        yield f"http://{host}:{port}/r/{fake.subreddit}"
+    finally:
+        server.shutdown()
+        server.server_close()
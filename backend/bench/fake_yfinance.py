@@ -0,0 +1,76 @@
+"""Stub of the slice of yfinance the earnings engine uses.
+
+`install()` puts this module in sys.modules["yfinance"] so `import yfinance`
+(directly or via earnings.py) gets deterministic, offline data: a seeded
+random-walk price history and quarterly earnings dates with EPS figures.
+"""
+
+import random
+import sys
+import types
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# Fixed "today" so results don't drift with the calendar
+TODAY = datetime(2025, 6, 13)
+_ORIGIN = TODAY - timedelta(days=365 * 6)
+
+
+class Ticker:
+    calls = 0
+
+    def __init__(self, symbol, today=TODAY):
+        self.symbol = symbol.upper()
+        self.today = today
+        self._rng = random.Random(self.symbol)
+
+    def history(self, period="5y", start=None, end=None, **kwargs):
+        Ticker.calls += 1
+        years = int(period.rstrip("y")) if period and period.endswith("y") else 5
+        first = datetime.strptime(start, "%Y-%m-%d") if start else self.today - timedelta(days=365 * years)
+        last = datetime.strptime(end, "%Y-%m-%d") if end else self.today
+        # Walk from a fixed origin so slices agree across calls and across `today`s
+        origin = _ORIGIN
+        rng = random.Random(self.symbol)
+        price = 20 + rng.random() * 200
+        dates, closes = [], []
+        d = origin
+        while d <= last:
+            if d.weekday() < 5:
+                price *= 1 + rng.gauss(0, 0.02)
+                if d >= first:
+                    dates.append(d)
+                    closes.append(round(price, 2))
+            d += timedelta(days=1)
+        index = pd.DatetimeIndex(dates).tz_localize("America/New_York")
+        return pd.DataFrame({
+            "Open": closes, "High": closes, "Low": closes, "Close": closes,
+            "Volume": [1_000_000] * len(closes),
+        }, index=index)
+
+    def get_earnings_dates(self, limit=16):
+        rng = random.Random(self.symbol + "eps")
+        dates, est, actual = [], [], []
+        d = self.today - timedelta(days=20)
+        for _ in range(limit):
+            dates.append(d)
+            e = round(rng.uniform(-1, 5), 2)
+            est.append(e)
+            actual.append(round(e + rng.gauss(0, 0.3), 2))
+            d -= timedelta(days=91)
+        index = pd.DatetimeIndex(dates).tz_localize("America/New_York")
+        return pd.DataFrame({"EPS Estimate": est, "Reported EPS": actual}, index=index)
+
+    @property
+    def quarterly_income_stmt(self):
+        return pd.DataFrame()
+
+
+def install():
+    """Register the stub as `yfinance` for subsequent imports."""
+    module = types.ModuleType("yfinance")
+    module.Ticker = Ticker
+    module.__stub__ = True
+    sys.modules["yfinance"] = module
+    return module
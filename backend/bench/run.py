@@ -0,0 +1,1487 @@
+"""Benchmark runner. Run from backend/:
+
+    python -m bench.run                        # all suites, results → bench/results/<commit>.json
+    python -m bench.run -s extraction -s insert --scale 0.2
+    python -m bench.run --compare bench/results/abc123.json bench/results/def456.json
+
+Every suite runs against a throwaway SQLite file, a stubbed SEC ticker list,
+the fake Reddit server and the stubbed yfinance — no network, no shared state.
+The storage suite also runs DuckDB and a throwaway Postgres (pgserver) when
+those are installed.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+from bench import fake_yfinance
+
+fake_yfinance.install()
+
+import db  # noqa: E402
+import tickers  # noqa: E402
+from bench.corpus import CorpusGenerator, TICKERS  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+SUITES = {}
+
+
+def suite(name):
+    def register(fn):
+        SUITES[name] = fn
+        return fn
+    return register
+
+
+class Context:
+    """Per-suite scratch space: temp DB, seeded generator, scale factor."""
+
+    def __init__(self, seed, scale):
+        self.seed = seed
+        self.scale = scale
+        self.tmpdir = tempfile.mkdtemp(prefix="wsb-bench-")
+        db.DB_PATH = os.path.join(self.tmpdir, "bench.db")
+        tickers._sec_tickers = set(TICKERS)
+        db.init_db()
+
+    def gen(self):
+        return CorpusGenerator(self.seed)
+
+    def n(self, base):
+        return max(1, int(base * self.scale))
+
+    def close(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+def _summary(samples):
+    """Latency summary in milliseconds."""
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.mean(ms), 3),
+        "p50_ms": round(ms[len(ms) // 2], 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def _rate(count, seconds):
+    return round(count / seconds, 1) if seconds > 0 else None
+
+
+# ---------------------------------------------------------------- suites
+
+
+@suite("extraction")
+def bench_extraction(ctx):
+    """Per-function throughput of the analysis stage on synthetic items."""
+    from tickers import extract_tickers
+    from sentiment import score_sentiment, get_scorer
+    from options import extract_options
+
+    items = ctx.gen().items(ctx.n(20000))
+    texts = [f"{i['title']} {i.get('selftext', '')}" for i in items]
+    get_scorer()  # exclude lexicon load from the timing
+
+    out = {"items": len(texts)}
+    for name, fn in (("extract_tickers", extract_tickers),
+                     ("score_sentiment", score_sentiment),
+                     ("extract_options", extract_options)):
+        start = time.perf_counter()
+        for t in texts:
+            fn(t)
+        elapsed = time.perf_counter() - start
+        out[name] = {"seconds": round(elapsed, 4), "items_per_sec": _rate(len(texts), elapsed)}
+    return out
+
+
+@suite("scorers")
+def bench_scorers(ctx):
+    """Items/sec of each sentiment scorer (per item and as one batch) and how
+    closely the lexicon scorer agrees with VADER."""
+    import sentiment
+
+    items = ctx.gen().items(ctx.n(20000))
+    texts = [f"{i['title']} {i.get('selftext', '')}" for i in items]
+
+    out = {"items": len(texts)}
+    scores = {}
+    for name, cls in sentiment.SCORERS.items():
+        scorer = cls()
+        start = time.perf_counter()
+        for t in texts[:ctx.n(2000)]:
+            scorer.score(t)
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        scores[name] = scorer.score_batch(texts)
+        batch = time.perf_counter() - start
+        out[name] = {"per_item_items_per_sec": _rate(ctx.n(2000), single),
+                     "batch_seconds": round(batch, 4), "batch_items_per_sec": _rate(len(texts), batch)}
+
+    a, b = scores["vader"], scores["lexicon"]
+    label = lambda x: (x > 0.05) - (x < -0.05)  # VADER's usual pos/neu/neg cut-offs
+    out["agreement"] = {
+        "pearson_r": round(statistics.correlation(a, b), 4),
+        "mean_abs_diff": round(sum(abs(x - y) for x, y in zip(a, b)) / len(a), 4),
+        "exact": round(sum(abs(x - y) < 1e-3 for x, y in zip(a, b)) / len(a), 4),
+        "label": round(sum(label(x) == label(y) for x, y in zip(a, b)) / len(a), 4),
+    }
+    return out
+
+
+def _dedup_sample(ctx, spam_rate):
+    import dedup
+    from run_scraper import analyze_items, _prefilter
+
+    generated = ctx.gen().items(ctx.n(20000), spam_rate=spam_rate)
+    items = _prefilter(generated)
+
+    # Alternate the two variants and keep the best of 3 — single runs are noisy
+    baseline = dedup_seconds = analyze_seconds = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        mentions, options, _ = analyze_items(items)
+        baseline = min(baseline, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        unique, duplicates, _ = dedup.partition(items, dedup.DedupIndex())
+        dedup_seconds = min(dedup_seconds, time.perf_counter() - start)
+        start = time.perf_counter()
+        kept_mentions, kept_options, _ = analyze_items(unique)
+        analyze_seconds = min(analyze_seconds, time.perf_counter() - start)
+
+    # What analyzing the duplicates would have cost, timed on its own: the saving
+    # per duplicate, without the noise of a difference between two full runs
+    duplicate_seconds = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        analyze_items([d[0] for d in duplicates])
+        duplicate_seconds = min(duplicate_seconds, time.perf_counter() - start)
+    saved_per_duplicate = duplicate_seconds / len(duplicates) if duplicates else None
+    return {
+        "items": len(generated),
+        "candidates": len(items),
+        "exact_duplicates": sum(1 for d in duplicates if d[2] == "exact"),
+        "near_duplicates": sum(1 for d in duplicates if d[2] == "near"),
+        "baseline": {"seconds": round(baseline, 3), "rows": len(mentions) + len(options)},
+        "dedup": {"seconds": round(dedup_seconds + analyze_seconds, 3),
+                  "dedup_seconds": round(dedup_seconds, 3),
+                  "rows": len(kept_mentions) + len(kept_options)},
+        "dedup_us_per_candidate": round(1e6 * dedup_seconds / len(items), 1),
+        "analysis_us_saved_per_duplicate": round(1e6 * saved_per_duplicate, 1) if saved_per_duplicate else None,
+        "duplicate_pct": round(100 * len(duplicates) / len(items), 1),
+        "break_even_duplicate_pct": (round(100 * dedup_seconds / len(items) / saved_per_duplicate, 1)
+                                     if saved_per_duplicate and saved_per_duplicate > 0 else None),
+        "cpu_saved_pct": round(100 * (1 - (dedup_seconds + analyze_seconds) / baseline), 1),
+        "rows_saved": len(mentions) + len(options) - len(kept_mentions) - len(kept_options),
+    }
+
+
+@suite("dedup")
+def bench_dedup(ctx):
+    """Analysis CPU and rows with and without the dedup stage, on a megathread-like
+    sample (15% bot/copypasta comments) and a spammier one (35%). Like the
+    pipeline, both sides start from the items that pass the prefilter.
+    break_even_duplicate_pct: the share of duplicate candidates above which dedup
+    saves more analysis than it costs."""
+    from sentiment import get_scorer
+
+    get_scorer()
+    return {f"spam_{int(rate * 100)}": _dedup_sample(ctx, rate) for rate in (0.15, 0.35)}
+
+
+def _is_discussion_thread(title):
+    t = title.lower()
+    keywords = ["daily discussion", "weekend discussion", "what are your moves",
+                "earnings thread", "daily thread", "weekly discussion",
+                "megathread", "moves tomorrow"]
+    return any(k in t for k in keywords)
+
+
+def _fixed_fetch_comments(posts, top_n=50, comments_per_post=50):
+    """The pre-expander comment fetch (fixed per-thread limits, discussion threads
+    first), kept as the baseline."""
+    import scraper
+    from sources import DEFAULT_SOURCE
+
+    discussion_posts = [p for p in posts if _is_discussion_thread(p["title"])]
+    other_posts = [p for p in posts if not _is_discussion_thread(p["title"])]
+    other_posts.sort(key=lambda p: p["upvotes"], reverse=True)
+    targets = discussion_posts + other_posts[:max(0, top_n - len(discussion_posts))]
+    comments = []
+    for post in targets:
+        limit = min(comments_per_post * 3, 150) if _is_discussion_thread(post["title"]) else comments_per_post
+        source = post.get("source", DEFAULT_SOURCE)
+        url = f"{scraper.source_url(source)}/comments/{post['id']}.json?limit={limit}&sort=new&raw_json=1"
+        data = scraper._fetch_json(url, kind="comments")
+        if data and isinstance(data, list) and len(data) >= 2:
+            children = data[1].get("data", {}).get("children", [])
+            comments.extend(scraper.iter_comments(children, post["id"], source=source))
+        scraper._throttle()
+    return comments
+
+
+@suite("expander")
+def bench_expander(ctx):
+    """Budgeted comment expansion vs the fixed per-thread limits, on deep fake trees.
+
+    Both strategies get the same number of comment requests. Run 2 happens after
+    some threads grew; only comments not seen in run 1 count as found.
+    """
+    import random
+    import scraper
+    from expander import expand_comments
+    from bench.fake_reddit import FakeReddit, serve
+
+    def ticker_ids(comments, exclude=()):
+        return {c["id"] for c in comments if c["id"] not in exclude and tickers.extract_tickers(c["title"])}
+
+    out = {}
+    for strategy in ("fixed", "expander"):
+        fake = FakeReddit(seed=ctx.seed, posts_per_listing=ctx.n(200), deep_trees=True)
+        old_base, old_delay = scraper.BASE, scraper.REQUEST_DELAY
+        with serve(fake) as base:
+            scraper.BASE, scraper.REQUEST_DELAY = base, 0
+            try:
+                posts = scraper.fetch_posts()
+                history = {}
+                found = set()
+                runs = []
+                for run in (1, 2):
+                    if run == 2:
+                        # Some threads keep going between runs, most go quiet
+                        r = random.Random(ctx.seed)
+                        for p in r.sample(posts, max(1, len(posts) // 10)):
+                            fake.grow(p["id"], r.randint(10, 400))
+                        posts = [dict(p, num_comments=fake.posts[p["id"]]["num_comments"]) for p in posts]
+                    before = fake.requests
+                    start = time.perf_counter()
+                    if strategy == "fixed":
+                        comments = _fixed_fetch_comments(posts)
+                        budget = fake.requests - before
+                    else:
+                        comments, rows, _ = expand_comments(posts, budget=budget, history=history)
+                        history.update({r["post_id"]: r for r in rows})
+                    elapsed = time.perf_counter() - start
+                    requests = fake.requests - before
+                    new = ticker_ids(comments, exclude=found)
+                    found |= new
+                    runs.append({"requests": requests, "comments": len(comments), "new_ticker_comments": len(new),
+                                 "per_request": round(len(new) / requests, 2) if requests else None,
+                                 "seconds": round(elapsed, 3)})
+                out[strategy] = runs
+            finally:
+                scraper.BASE, scraper.REQUEST_DELAY = old_base, old_delay
+    return out
+
+
+def _flatten_recursive(children, post_id, out):
+    """The pre-iter_comments flattener (recursion + one dict per comment), kept as the baseline."""
+    for child in children:
+        if child.get("kind") != "t1":
+            continue
+        c = child["data"]
+        body = c.get("body", "")
+        if body and body != "[deleted]" and body != "[removed]":
+            out.append({"id": f"{post_id}_{c['id']}", "title": body[:500], "selftext": "",
+                        "author": c.get("author", "[deleted]"), "upvotes": c.get("score", 0),
+                        "created_utc": int(c.get("created_utc", 0)), "source_type": "comment"})
+        replies = c.get("replies")
+        if replies and isinstance(replies, dict):
+            _flatten_recursive(replies.get("data", {}).get("children", []), post_id, out)
+    return out
+
+
+@suite("comment_tree")
+def bench_comment_tree(ctx):
+    """Flattening a synthetic 10k-comment tree (time, peak memory) and the
+    analysis skipped by the ticker prefilter on its comments."""
+    import tracemalloc
+    import scraper
+    import run_scraper
+    from sentiment import get_scorer
+
+    get_scorer()
+    out = {}
+    for shape, kwargs in (("bushy", {"max_depth": 6, "branching": 0.45}),
+                          ("deep", {"max_depth": 2000, "branching": 0.98})):
+        tree = ctx.gen().comment_tree(ctx.n(10000), ticker_rate=0.3, **kwargs)
+        variants = (("recursive", lambda: _flatten_recursive(tree, "t", [])),
+                    ("iterative", lambda: list(scraper.iter_comments(tree, "t", max_depth=None))))
+        result = {}
+        for name, flatten in variants:
+            try:
+                best = float("inf")
+                for _ in range(3):
+                    start = time.perf_counter()
+                    comments = flatten()
+                    best = min(best, time.perf_counter() - start)
+                tracemalloc.start()
+                flatten()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            except RecursionError:
+                result[name] = {"error": "RecursionError"}
+                continue
+            result[name] = {"comments": len(comments), "seconds": round(best, 4),
+                            "peak_mb": round(peak / 1e6, 2)}
+
+        start = time.perf_counter()
+        everything = run_scraper.analyze_items(comments)
+        full = time.perf_counter() - start
+        start = time.perf_counter()
+        kept = run_scraper._prefilter(comments)
+        prefiltered = run_scraper.analyze_items(kept)
+        skipped = time.perf_counter() - start
+        result["prefilter"] = {
+            "skipped": len(comments) - len(kept),
+            "analyze_seconds": round(full, 3),
+            "prefilter_analyze_seconds": round(skipped, 3),
+            "same_rows": everything[:2] == prefiltered[:2],
+        }
+        out[shape] = result
+    return out
+
+
+def _urllib_fetch_json(url, kind=None, parse_times=None):
+    """The pre-pooling fetch (urlopen per request, no gzip, no validators), kept as the baseline."""
+    req = urllib.request.Request(url, headers={"User-Agent": "wsb-sentiment-tracker/1.0"})
+    try:
+        with urllib.request.urlopen(req, timeout=15) as resp:
+            body = resp.read()
+        start = time.perf_counter()
+        data = json.loads(body.decode())
+        if parse_times is not None:
+            parse_times.append(time.perf_counter() - start)
+        return data
+    except Exception:
+        return None
+
+
+@suite("http")
+def bench_http(ctx):
+    """Two scrapes (listings + budgeted comments) of deep fake trees, the second
+    after a tenth of the threads grew: urlopen per request vs the pooled client
+    with gzip and ETag revalidation. wire_bytes is what the server sent."""
+    import random
+    import metrics
+    import scraper
+    from expander import expand_comments
+
+    from bench.fake_reddit import FakeReddit, serve
+
+    out = {}
+    for client in ("urllib", "pooled"):
+        fake = FakeReddit(seed=ctx.seed, posts_per_listing=ctx.n(200), deep_trees=True)
+        for post_id in fake.posts:
+            fake._tree(post_id)  # generate up front so the server's work doesn't dominate the timings
+        # ...and keep the trees out of the client's GC passes: a full collection
+        # walking millions of fake nodes would land on whichever client runs it
+        gc.collect()
+        gc.freeze()
+        scraper._pool.clear()
+        scraper._validators.clear()
+        parse_times = []
+        old_base, old_delay, old_fetch = scraper.BASE, scraper.REQUEST_DELAY, scraper._fetch_json
+        with serve(fake) as base:
+            scraper.BASE, scraper.REQUEST_DELAY = base, 0
+            if client == "urllib":
+                scraper._fetch_json = lambda url, kind=None: _urllib_fetch_json(url, kind, parse_times)
+            try:
+                history, runs = {}, []
+                for run in (1, 2):
+                    before = (fake.requests, fake.bytes_sent, fake.connections, fake.not_modified)
+                    parse_before = metrics.histogram_snapshot("wsb_reddit_parse_seconds")["sum"]
+                    parsed_before = sum(parse_times)
+                    start = time.perf_counter()
+                    posts = scraper.fetch_posts()
+                    if run == 2:
+                        r = random.Random(ctx.seed)
+                        for p in r.sample(posts, max(1, len(posts) // 10)):
+                            fake.grow(p["id"], r.randint(10, 400))
+                        posts = [dict(p, num_comments=fake.posts[p["id"]]["num_comments"]) for p in posts]
+                    comments, rows, _ = expand_comments(posts, budget=ctx.n(60), history=history)
+                    history.update({row["post_id"]: row for row in rows})
+                    scraper.commit_validators()  # as run_pipeline does once the rows are written
+                    elapsed = time.perf_counter() - start
+                    if client == "urllib":
+                        parse = sum(parse_times) - parsed_before
+                    else:
+                        parse = metrics.histogram_snapshot("wsb_reddit_parse_seconds")["sum"] - parse_before
+                    runs.append({
+                        "requests": fake.requests - before[0],
+                        "wire_bytes": fake.bytes_sent - before[1],
+                        "connections": fake.connections - before[2],
+                        "not_modified": fake.not_modified - before[3],
+                        "comments": len(comments),
+                        "parse_seconds": round(parse, 3),
+                        "seconds": round(elapsed, 3),
+                    })
+                out[client] = runs
+            finally:
+                scraper.BASE, scraper.REQUEST_DELAY, scraper._fetch_json = old_base, old_delay, old_fetch
+                scraper._pool.clear()
+                scraper._validators.clear()
+                scraper.discard_validators()
+                gc.unfreeze()
+    return out
+
+
+@suite("pipeline")
+def bench_pipeline(ctx):
+    """End-to-end run_pipeline against the fake Reddit server."""
+    import scraper
+    import run_scraper
+    from bench.fake_reddit import FakeReddit, serve
+
+    fake = FakeReddit(seed=ctx.seed, posts_per_listing=ctx.n(200), comments_per_post=ctx.n(150))
+    old_base, old_delay = scraper.BASE, scraper.REQUEST_DELAY
+    with serve(fake) as base:
+        scraper.BASE, scraper.REQUEST_DELAY = base, 0
+        try:
+            start = time.perf_counter()
+            stats = run_scraper.run_pipeline()
+            elapsed = time.perf_counter() - start
+        finally:
+            scraper.BASE, scraper.REQUEST_DELAY = old_base, old_delay
+    return {
+        "seconds": round(elapsed, 3),
+        "requests": fake.requests,
+        "bytes_served": fake.bytes_sent,
+        "items": stats["posts_fetched"] + stats["comments_fetched"],
+        "items_per_sec": _rate(stats["posts_fetched"] + stats["comments_fetched"], elapsed),
+        "stats": stats,
+    }
+
+
+@suite("sources")
+def bench_sources(ctx):
+    """Four subreddits scraped together (multireddit listings, one shared comment
+    budget) vs r/wallstreetbets alone, and vs scraping each of the four on its
+    own. est_wall_seconds adds the REQUEST_DELAY a real run sleeps per request."""
+    import dedup
+    import scraper
+    import run_scraper
+    from sources import SOURCES
+    from bench.fake_reddit import FakeReddit, serve
+
+    names = list(SOURCES)
+    fake = FakeReddit(seed=ctx.seed, posts_per_listing=ctx.n(200), comments_per_post=ctx.n(150), subreddits=names)
+    old_base, old_delay, old_db = scraper.BASE, scraper.REQUEST_DELAY, db.DB_PATH
+    old_env = os.environ.get("WSB_SOURCES")
+    out = {}
+    with serve(fake) as base:
+        scraper.BASE, scraper.REQUEST_DELAY = base, 0
+        try:
+            for label, groups in (("one_source", [names[:1]]), ("shared", [names]),
+                                  ("separate", [[name] for name in names])):
+                before = fake.requests
+                start = time.perf_counter()
+                runs, stored = [], {}
+                for group in groups:
+                    db.DB_PATH = os.path.join(ctx.tmpdir, f"sources-{label}-{group[0]}.db")
+                    db.init_db()
+                    dedup._index = None
+                    os.environ["WSB_SOURCES"] = ",".join(group)
+                    runs.append(run_scraper.run_pipeline())
+                    conn = db.get_conn()
+                    try:
+                        for source, n in conn.execute("SELECT source, COUNT(*) FROM mentions GROUP BY source"):
+                            stored[source] = stored.get(source, 0) + n
+                    finally:
+                        conn.close()
+                elapsed = time.perf_counter() - start
+                requests = fake.requests - before
+                items = sum(r["posts_fetched"] + r["comments_fetched"] for r in runs)
+                out[label] = {
+                    "sources": len({name for group in groups for name in group}),
+                    "requests": requests,
+                    "posts": sum(r["posts_fetched"] for r in runs),
+                    "items": items,
+                    "items_per_request": round(items / requests, 1) if requests else None,
+                    "mentions": sum(r["mentions_found"] for r in runs),
+                    "seconds": round(elapsed, 3),
+                    "est_wall_seconds": round(elapsed + requests * old_delay, 1),
+                    "stored_by_source": stored,
+                }
+        finally:
+            scraper.BASE, scraper.REQUEST_DELAY, db.DB_PATH = old_base, old_delay, old_db
+            if old_env is None:
+                os.environ.pop("WSB_SOURCES", None)
+            else:
+                os.environ["WSB_SOURCES"] = old_env
+            dedup._index = None
+    return out
+
+
+@suite("insert")
+def bench_insert(ctx):
+    """Bulk write throughput (write_rows) into a fresh DB, then a full-duplicate re-write."""
+    gen = ctx.gen()
+    out = {}
+    for size in (ctx.n(10000), ctx.n(100000), ctx.n(1000000)):
+        mentions = gen.mention_rows(size)
+        options = gen.option_rows(size // 10)
+        db.DB_PATH = os.path.join(ctx.tmpdir, f"insert-{size}.db")
+        db.init_db()
+        start = time.perf_counter()
+        first = db.write_rows(mentions, options)
+        fresh = time.perf_counter() - start
+        start = time.perf_counter()
+        again = db.write_rows(mentions, options)
+        dupes = time.perf_counter() - start
+        out[str(size)] = {
+            "fresh_seconds": round(fresh, 4),
+            "fresh_rows_per_sec": _rate(len(mentions) + len(options), fresh),
+            "duplicate_seconds": round(dupes, 4),
+            "duplicate_rows_per_sec": _rate(len(mentions) + len(options), dupes),
+            "fresh_lock_seconds": first["lock_seconds"],
+            "duplicate_lock_seconds": again["lock_seconds"],
+            "transactions": first["transactions"],
+            "mentions_inserted": first["mentions_inserted"],
+            "mentions_duplicates_on_rewrite": again["mentions_duplicates"],
+        }
+    return out
+
+
+@suite("tickerset")
+def bench_tickerset(ctx):
+    """Load time, memory and lookup speed: JSON → Python set vs the mmap'd TickerSet artifact."""
+    import random
+    import string
+    import tracemalloc
+
+    rng = random.Random(ctx.seed)
+    symbols = set(TICKERS)
+    while len(symbols) < 10000:
+        symbols.add("".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(1, 5))))
+    json_path = os.path.join(ctx.tmpdir, "sec_tickers.json")
+    bin_path = os.path.join(ctx.tmpdir, "sec_tickers.bin")
+    with open(json_path, "w") as f:
+        json.dump(sorted(symbols), f)
+    tickers.build_ticker_artifact(symbols, bin_path)
+
+    def load_json():
+        with open(json_path) as f:
+            return set(json.load(f))
+
+    out = {"symbols": len(symbols), "artifact_bytes": os.path.getsize(bin_path)}
+    for name, loader in (("json_set", load_json), ("mmap", lambda: tickers.TickerSet.open(bin_path))):
+        samples = []
+        for _ in range(20):
+            start = time.perf_counter()
+            loader()
+            samples.append(time.perf_counter() - start)
+        tracemalloc.start()
+        obj = loader()
+        heap = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        words = [w.strip("$") for w in ctx.gen().text(2000, 2000, ticker_rate=1).split()] * 10
+        start = time.perf_counter()
+        for w in words:
+            w in obj
+        lookup = time.perf_counter() - start
+        out[name] = {
+            "load": _summary(samples),
+            "heap_bytes": heap,
+            "lookups_per_sec": _rate(len(words), lookup),
+        }
+    return out
+
+
+@suite("hll")
+def bench_hll(ctx):
+    """Sketch-based unique_authors vs COUNT(DISTINCT author): relative error and
+    latency, for the whole get_top_tickers call and for the author count alone
+    (the rollup query both modes share is excluded there)."""
+    gen = CorpusGenerator(ctx.seed, now=int(time.time()))
+    db.write_rows(gen.mention_rows(ctx.n(200000)), gen.option_rows(ctx.n(20000)))
+    db.get_top_tickers(hours=1)  # warm-up (numpy import, page cache)
+
+    out = {}
+    for hours in (1, 24, 168):
+        timings = {}
+        for mode, exact in (("approx", False), ("exact", True)):
+            samples = []
+            for _ in range(5):
+                start = time.perf_counter()
+                rows = db.get_top_tickers(hours=hours, limit=50, exact=exact)
+                samples.append(time.perf_counter() - start)
+            timings[mode] = (rows, _summary(samples))
+        truth = {r["ticker"]: r["unique_authors"] for r in timings["exact"][0]}
+        errors = [abs(r["unique_authors"] - truth[r["ticker"]]) / truth[r["ticker"]]
+                  for r in timings["approx"][0] if truth.get(r["ticker"])]
+        keys = list(truth)
+        cutoff = int(time.time()) - hours * 3600
+        conn = db.get_conn()
+        try:
+            authors = {}
+            for mode, count in (("approx", lambda: db._sketch_counts(conn, "mentions", keys, cutoff)),
+                                ("exact", lambda: db._exact_author_counts(conn, keys, cutoff))):
+                samples = []
+                for _ in range(5):
+                    start = time.perf_counter()
+                    count()
+                    samples.append(time.perf_counter() - start)
+                authors[mode] = _summary(samples)
+        finally:
+            conn.close()
+        out[f"{hours}h"] = {
+            "approx": timings["approx"][1],
+            "exact": timings["exact"][1],
+            "authors_approx": authors["approx"],
+            "authors_exact": authors["exact"],
+            "mean_rel_error": round(statistics.mean(errors), 4) if errors else None,
+            "max_rel_error": round(max(errors), 4) if errors else None,
+        }
+    conn = db.get_conn()
+    try:
+        count, size = conn.execute("SELECT COUNT(*), SUM(LENGTH(registers)) FROM author_sketches").fetchone()
+    finally:
+        conn.close()
+    out["sketches"] = {"rows": count, "bytes": size}
+    return out
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve_api(port):
+    import uvicorn
+    import api
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.02)
+    return server, thread
+
+
+@suite("sentiment_modes")
+def bench_sentiment_modes(ctx):
+    """/api/tickers aggregation latency per weight= mode and window, from ticker_rollups."""
+    gen = CorpusGenerator(ctx.seed, now=int(time.time()))
+    db.write_rows(gen.mention_rows(ctx.n(200000)), [])
+    db.get_top_tickers(hours=1)
+
+    out = {}
+    for hours in (1, 24, 168):
+        for weight in db.WEIGHT_MODES:
+            samples = []
+            for _ in range(5):
+                start = time.perf_counter()
+                db.get_top_tickers(hours=hours, limit=50, weight=weight)
+                samples.append(time.perf_counter() - start)
+            out[f"{hours}h:{weight}"] = _summary(samples)
+    return out
+
+
+@suite("api")
+def bench_api(ctx):
+    """HTTP read latency for the dashboard endpoints at 1h/24h/168h windows."""
+    gen = CorpusGenerator(ctx.seed, now=int(time.time()))
+    db.insert_mentions_batch(gen.mention_rows(ctx.n(200000)))
+    db.insert_options_batch(gen.option_rows(ctx.n(20000)))
+
+    import earnings
+    earnings._PREFETCH_PATH = os.path.join(ctx.tmpdir, "no-prefetch.json")  # every symbol goes to the stub
+    earnings._prefetch_cache = None
+
+    port = _free_port()
+    server, thread = _serve_api(port)
+    base = f"http://127.0.0.1:{port}"
+    repeat = max(5, ctx.n(30))
+
+    def measure(path):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with urllib.request.urlopen(base + path) as resp:
+                resp.read()
+            samples.append(time.perf_counter() - start)
+        return _summary(samples)
+
+    out = {}
+    try:
+        for hours in (1, 24, 168):
+            out[f"tickers_{hours}h"] = measure(f"/api/tickers?hours={hours}&limit=50")
+            out[f"options_{hours}h"] = measure(f"/api/options?hours={hours}")
+            out[f"ticker_detail_{hours}h"] = measure(f"/api/ticker/NVDA?hours={hours}")
+        out["status"] = measure("/api/status")
+        out["earnings"] = measure("/api/earnings/NVDA")
+        for symbol in TICKERS:
+            result = earnings.fetch_earnings_data(symbol)
+            if result.get("error") is None:
+                db.save_earnings(result)
+        out["earnings_leaderboard"] = measure("/api/earnings")
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+    return out
+
+
+def _columns_to_rows(columns):
+    """The frontend's rows(): /api/dashboard's column-wise lists back to dicts."""
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())] if keys else []
+
+
+@suite("dashboard")
+def bench_dashboard(ctx):
+    """Dashboard first load: the fan-out (/api/tickers?limit=50, /api/options
+    and /api/status, fetched concurrently like a browser does) against one
+    /api/dashboard request. Bytes on the wire with and without gzip, and time
+    until every response is in and decoded (JSON, plus the column-wise lists
+    back to rows) as a proxy for time-to-interactive."""
+    import gzip
+    from concurrent.futures import ThreadPoolExecutor
+
+    gen = CorpusGenerator(ctx.seed, now=int(time.time()))
+    db.write_rows(gen.mention_rows(ctx.n(200000)), gen.option_rows(ctx.n(20000)))
+
+    port = _free_port()
+    server, thread = _serve_api(port)
+    base = f"http://127.0.0.1:{port}"
+    repeat = max(5, ctx.n(30))
+    variants = {
+        "fanout": ("/api/tickers?hours=24&limit=50", "/api/options?hours=24", "/api/status"),
+        "dashboard": ("/api/dashboard?hours=24&limit=50",),
+    }
+
+    def fetch(path, encoding):
+        req = urllib.request.Request(base + path, headers={"Accept-Encoding": encoding})
+        with urllib.request.urlopen(req) as resp:
+            body = resp.read()
+            if resp.headers.get("Content-Encoding") == "gzip":
+                data = json.loads(gzip.decompress(body))
+            else:
+                data = json.loads(body)
+        if path.startswith("/api/dashboard"):
+            _columns_to_rows(data["tickers"])
+            _columns_to_rows(data["options"]["flow"])
+        return len(body)
+
+    out = {}
+    try:
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            for name, paths in variants.items():
+                for encoding in ("identity", "gzip"):
+                    samples = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        sizes = list(pool.map(lambda p: fetch(p, encoding), paths))
+                        samples.append(time.perf_counter() - start)
+                    out[f"{name}_{encoding}"] = {"requests": len(paths), "bytes": sum(sizes),
+                                                 "load": _summary(samples)}
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+    fanout, dashboard = out["fanout_identity"], out["dashboard_gzip"]
+    out["bytes_saved_pct"] = round(100 * (1 - dashboard["bytes"] / fanout["bytes"]), 1)
+    out["load_p50_speedup"] = round(fanout["load"]["p50_ms"] / dashboard["load"]["p50_ms"], 2)
+    return out
+
+
+def _related_selfjoin(symbol, hours, limit=10):
+    """/related as a self-join over raw mentions, kept as the baseline."""
+    cutoff = int(time.time()) - hours * 3600
+    conn = db.get_conn()
+    try:
+        return conn.execute("""
+            SELECT b.ticker, COUNT(*) AS together, SUM(MIN(a.weight, b.weight)) AS weighted
+            FROM mentions a JOIN mentions b ON b.post_id = a.post_id AND b.ticker != a.ticker
+            WHERE a.ticker = ? AND a.timestamp >= ?
+            GROUP BY b.ticker ORDER BY weighted DESC LIMIT ?
+        """, (symbol, cutoff, limit)).fetchall()
+    finally:
+        conn.close()
+
+
+def _graph_selfjoin(tickers, hours):
+    """/api/graph edges as a self-join over raw mentions, kept as the baseline."""
+    cutoff = int(time.time()) - hours * 3600
+    placeholders = ",".join("?" * len(tickers))
+    conn = db.get_conn()
+    try:
+        return conn.execute(f"""
+            SELECT a.ticker, b.ticker, COUNT(*) FROM mentions a JOIN mentions b
+              ON b.post_id = a.post_id AND a.ticker < b.ticker
+            WHERE a.ticker IN ({placeholders}) AND b.ticker IN ({placeholders}) AND a.timestamp >= ?
+            GROUP BY a.ticker, b.ticker
+        """, (*tickers, *tickers, cutoff)).fetchall()
+    finally:
+        conn.close()
+
+
+@suite("comentions")
+def bench_comentions(ctx):
+    """Co-mention index with a 3000-symbol universe: write cost of keeping it,
+    its size, and /related + /api/graph latency from the index vs a self-join
+    over raw mentions."""
+    import random
+    r = random.Random(ctx.seed)
+    now = int(time.time())
+    universe = [f"X{i:04d}" for i in range(3000)]
+    # Zipf-ish popularity: a few names everywhere, a long tail mentioned rarely
+    weights = [1 / (i + 1) for i in range(len(universe))]
+    rows = []
+    for i in range(ctx.n(100000)):
+        ts = now - r.randint(0, 168 * 3600)
+        for ticker in set(r.choices(universe, weights, k=r.choice((1, 1, 1, 2, 2, 3, 4)))):
+            rows.append((ticker, f"c{i}", round(r.uniform(-1, 1), 4), ts, "comment", "", f"ape{r.randint(1, 20000)}",
+                         1, 1.0, "wallstreetbets"))
+    start = time.perf_counter()
+    written = db.write_rows(rows)
+    write_seconds = time.perf_counter() - start
+    conn = db.get_conn()
+    index_rows = conn.execute("SELECT COUNT(*) FROM comentions").fetchone()[0]
+    conn.close()
+
+    out = {"mention_rows": len(rows), "write_seconds": round(write_seconds, 3),
+           "lock_seconds": written["lock_seconds"], "index_rows": index_rows}
+    for hours in (24, 168):
+        for label, symbol in (("head", universe[0]), ("tail", universe[500])):
+            for impl, fn in (("index", lambda: db.get_related_tickers(symbol, hours=hours)),
+                             ("selfjoin", lambda: _related_selfjoin(symbol, hours))):
+                samples = []
+                for _ in range(5):
+                    t0 = time.perf_counter()
+                    fn()
+                    samples.append(time.perf_counter() - t0)
+                out[f"related_{label}_{hours}h_{impl}"] = _summary(samples)
+        counts = {t["ticker"]: t["mention_count"] for t in db.get_top_tickers(hours=hours, limit=25)}
+        for impl, fn in (("index", lambda: db.get_comention_graph(counts, hours=hours)),
+                         ("selfjoin", lambda: _graph_selfjoin(list(counts), hours))):
+            samples = []
+            for _ in range(5):
+                t0 = time.perf_counter()
+                fn()
+                samples.append(time.perf_counter() - t0)
+            out[f"graph_{hours}h_{impl}"] = _summary(samples)
+    return out
+
+
+def _history_scan(tickers, now, hours=72):
+    """Per-ticker hourly counts re-read from raw mentions on every update, kept as the baseline."""
+    placeholders = ",".join("?" * len(tickers))
+    conn = db.get_conn()
+    try:
+        return conn.execute(f"""
+            SELECT ticker, timestamp / 3600, COUNT(*), AVG(sentiment_score) FROM mentions
+            WHERE ticker IN ({placeholders}) AND timestamp >= ? GROUP BY 1, 2
+        """, (*tickers, now - hours * 3600)).fetchall()
+    finally:
+        conn.close()
+
+
+@suite("alerts")
+def bench_alerts(ctx):
+    """Spike detector over two days of hourly traffic on a 3000-symbol universe,
+    four pipeline batches an hour: update cost early vs late (flat = no history
+    scan), alerts against injected spikes, restart and seeding time."""
+    import random
+    import alerts
+    r = random.Random(ctx.seed)
+    universe = [f"X{i:04d}" for i in range(3000)]
+    weights = [1 / (i + 1) for i in range(len(universe))]
+    spiked = set(r.sample(universe[20:300], 5))
+    soured = universe[1]
+    hours, per_hour = 48, ctx.n(4000)
+    now = (int(time.time()) // 3600) * 3600
+    alerts.reset()
+    samples, batch_tickers, raised, i = [], [], [], 0
+    for h in range(hours, -1, -1):
+        last_hour = h == 0
+        picks = r.choices(universe, weights, k=per_hour)
+        if last_hour:
+            picks += [t for t in spiked for _ in range(30)]
+        for q in range(4):
+            rows = []
+            for ticker in picks[q::4]:
+                i += 1
+                mood = 0.6 if last_hour and ticker == soured else 0.0
+                rows.append((ticker, f"c{i}", round(max(-1.0, min(1.0, r.gauss(mood, 0.3))), 4),
+                             now - h * 3600 + q * 900 + r.randint(0, 899), "comment", "", f"ape{i}", 1, 1.0,
+                             "wallstreetbets"))
+            db.write_rows(rows)
+            t0 = time.perf_counter()
+            raised += alerts.observe(rows, now=now - h * 3600 + (q + 1) * 900 - 1)
+            samples.append(time.perf_counter() - t0)
+            batch_tickers.append(len({row[0] for row in rows}))
+
+    last = list({row[0] for row in rows})
+    scan = []
+    for _ in range(5):
+        t0 = time.perf_counter()
+        _history_scan(last, now)
+        scan.append(time.perf_counter() - t0)
+    found = {(a["ticker"], a["kind"]) for a in raised if a["bucket"] == now // 3600}
+    expected = {(t, "mentions") for t in spiked} | {(soured, "sentiment")}
+
+    t0 = time.perf_counter()
+    alerts.reset()
+    alerts._load()
+    reload_seconds = time.perf_counter() - t0
+    conn = db.get_conn()
+    conn.execute("DELETE FROM alert_baselines")
+    conn.commit()
+    conn.close()
+    t0 = time.perf_counter()
+    alerts.reset()
+    alerts._load()
+    seed_seconds = time.perf_counter() - t0
+    alerts.reset()
+    return {
+        "mention_rows": i,
+        "batches": len(samples),
+        "tickers_per_batch": round(statistics.mean(batch_tickers), 1),
+        "update_first_12h": _summary(samples[:48]),
+        "update_last_12h": _summary(samples[-48:]),
+        "history_scan_72h": _summary(scan),
+        "injected": len(expected),
+        "detected": len(found & expected),
+        "false_alerts": len(raised) - len(found & expected),
+        "reload_seconds": round(reload_seconds, 4),
+        "seed_seconds": round(seed_seconds, 4),
+    }
+
+
+def _contend(barrier, results, rounds):
+    """Worker process body for the leader suite: start a scrape on every round."""
+    import leader
+    import run_scraper
+    for _ in range(rounds):
+        barrier.wait()
+        try:
+            run_scraper.run_pipeline()
+            results.put("scraped")
+        except leader.NotLeader:
+            results.put("not_leader")
+        barrier.wait()
+
+
+_PREFETCH_PROBE = """
+import sys, json, tracemalloc
+sys.path.insert(0, {backend!r})
+from bench import fake_yfinance
+fake_yfinance.install()
+import earnings
+earnings._load_prefetch()  # builds the artifact outside the measurement
+earnings._prefetch_cache = None
+tracemalloc.start()
+if {mmap!r}:
+    earnings._load_prefetch()
+else:
+    earnings._read_prefetch_json()
+print(json.dumps({{"bytes": tracemalloc.get_traced_memory()[1]}}))
+"""
+
+
+@suite("leader")
+def bench_leader(ctx):
+    """Four worker processes start a scrape at the same moment, over several
+    rounds: scrapes that actually ran (the scraper lease should let exactly
+    one through per round) and Reddit requests made. Plus per-worker heap for
+    the earnings prefetch, parsed JSON dict vs the mmap'd artifact."""
+    import multiprocessing
+    import scraper
+    from bench.fake_reddit import FakeReddit, serve
+
+    workers, rounds = 4, 3
+    fake = FakeReddit(seed=ctx.seed, posts_per_listing=ctx.n(100), comments_per_post=ctx.n(50))
+    old_base, old_delay = scraper.BASE, scraper.REQUEST_DELAY
+    mp = multiprocessing.get_context("fork")
+    barrier, results = mp.Barrier(workers), mp.Queue()
+    with serve(fake) as base:
+        scraper.BASE, scraper.REQUEST_DELAY = base, 0
+        try:
+            start = time.perf_counter()
+            procs = [mp.Process(target=_contend, args=(barrier, results, rounds)) for _ in range(workers)]
+            for p in procs:
+                p.start()
+            outcomes = [results.get(timeout=300) for _ in range(workers * rounds)]
+            for p in procs:
+                p.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            scraper.BASE, scraper.REQUEST_DELAY = old_base, old_delay
+
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    heap = {}
+    for label, use_mmap in (("dict", False), ("mmap", True)):
+        out = subprocess.check_output([sys.executable, "-c", _PREFETCH_PROBE.format(backend=backend, mmap=use_mmap)],
+                                      cwd=backend, text=True)
+        heap[label] = json.loads(out.strip().splitlines()[-1])["bytes"]
+    return {
+        "workers": workers,
+        "rounds": rounds,
+        "scrapes_run": outcomes.count("scraped"),
+        "scrapes_refused": outcomes.count("not_leader"),
+        "seconds": round(elapsed, 3),
+        "reddit_requests_per_round": round(fake.requests / rounds, 1),
+        "prefetch_heap_kb_dict": round(heap["dict"] / 1024, 1),
+        "prefetch_heap_kb_mmap": round(heap["mmap"] / 1024, 1),
+    }
+
+
+@suite("export")
+def bench_export(ctx):
+    """A month of mentions through /api/export per format (throughput, bytes,
+    peak traced memory of the encoder) vs the old route: one /api/ticker call
+    per symbol, each capped at 100 rows."""
+    import tracemalloc
+    import export
+
+    now = int(time.time())
+    gen = CorpusGenerator(ctx.seed, now=now)
+    rows = ctx.n(200000)
+    db.insert_mentions_batch(gen.mention_rows(rows, hours=720))
+    since = now - 720 * 3600
+
+    port = _free_port()
+    server, thread = _serve_api(port)
+    base = f"http://127.0.0.1:{port}"
+    out = {"rows": rows}
+    formats = ["ndjson"] + (["arrow", "parquet"] if export.have_pyarrow() else [])
+    try:
+        for fmt in formats:
+            start = time.perf_counter()
+            with urllib.request.urlopen(f"{base}/api/export?format={fmt}&since={since}") as resp:
+                size = len(resp.read())
+            elapsed = time.perf_counter() - start
+            tracemalloc.start()
+            for _ in export.stream_export("mentions", fmt, since, now + 1):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            out[fmt] = {"seconds": round(elapsed, 3), "bytes": size, "rows_per_sec": _rate(rows, elapsed),
+                        "peak_traced_mb": round(peak / 1e6, 1)}
+
+        start = time.perf_counter()
+        fetched = 0
+        for symbol in TICKERS:
+            with urllib.request.urlopen(f"{base}/api/ticker/{symbol}?hours=168") as resp:
+                fetched += json.loads(resp.read())["count"]
+        out["per_symbol"] = {"seconds": round(time.perf_counter() - start, 3), "calls": len(TICKERS),
+                             "rows": fetched}
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+    return out
+
+
+@suite("price_history")
+def bench_price_history(ctx):
+    """Incremental price store against the stubbed yfinance: rows downloaded per
+    refresh, bars matching a full re-download, and moves computed offline."""
+    from datetime import timedelta
+    import earnings
+    from bench.fake_yfinance import Ticker, TODAY
+
+    class Offline(Ticker):
+        def history(self, *args, **kwargs):
+            raise ConnectionError("offline")
+
+    downloaded = []
+
+    class Counting(Ticker):
+        def history(self, *args, **kwargs):
+            frame = super().history(*args, **kwargs)
+            downloaded.append(len(frame))
+            return frame
+
+    def closes(frame):
+        return [round(float(c), 4) for c in frame["Close"]]
+
+    symbols = TICKERS[:ctx.n(20)]
+    days = [TODAY, TODAY, TODAY + timedelta(days=1), TODAY + timedelta(days=4)]
+    out = {"symbols": len(symbols), "refreshes": []}
+    matches = True
+    for day in days:
+        downloaded.clear()
+        start = time.perf_counter()
+        for symbol in symbols:
+            stored = earnings._price_history(Counting(symbol, today=day), symbol, today=day.date())
+        elapsed = time.perf_counter() - start
+        # Same window straight from the source, for comparison (last symbol only)
+        full = Ticker(symbols[-1], today=day).history(period="5y")
+        stored = stored[stored.index >= full.index[0].tz_localize(None)]
+        matches = matches and closes(stored) == closes(full)
+        out["refreshes"].append({"day": day.date().isoformat(), "downloads": len(downloaded),
+                                 "rows_downloaded": sum(downloaded), "seconds": round(elapsed, 3)})
+    out["bars_match_full_download"] = matches
+
+    day = days[-1]
+    online = earnings._price_history(Offline(symbols[0], today=day), symbols[0], today=day.date())
+    offline_day = day + timedelta(days=1)
+    offline = earnings._price_history(Offline(symbols[0], today=offline_day), symbols[0], today=offline_day.date())
+    out["offline_bars"] = len(offline)
+    # A day later the 5y window starts a day later too; the bars it keeps are unchanged
+    out["offline_matches_store"] = closes(online[online.index >= offline.index[0]]) == closes(offline)
+    return out
+
+
+@suite("earnings_warm")
+def bench_earnings_warm(ctx):
+    """First-click /api/earnings/{symbol} latency for the leaderboard, cold vs after
+    warmer.warm_earnings(), plus the warmer's own run time and hit ratio."""
+    import earnings
+    import metrics
+    import warmer
+    earnings._PREFETCH_PATH = os.path.join(ctx.tmpdir, "no-prefetch.json")  # every symbol goes to the stub
+    earnings._prefetch_cache = None
+
+    rows = CorpusGenerator(ctx.seed, now=int(time.time())).mention_rows(ctx.n(50000))
+    db.write_rows(rows, [])
+    symbols = [t["ticker"] for t in db.get_top_tickers(hours=24, limit=warmer.WARM_TOP_N)]
+
+    port = _free_port()
+    server, thread = _serve_api(port)
+    base = f"http://127.0.0.1:{port}"
+
+    def first_clicks():
+        samples = []
+        for symbol in symbols:
+            start = time.perf_counter()
+            with urllib.request.urlopen(f"{base}/api/earnings/{symbol}") as resp:
+                resp.read()
+            samples.append(time.perf_counter() - start)
+        return _summary(samples)
+
+    out = {"symbols": len(symbols)}
+    try:
+        out["cold"] = first_clicks()
+        db.DB_PATH = os.path.join(ctx.tmpdir, "warm.db")
+        db.init_db()
+        db.write_rows(rows, [])
+        hits_before = metrics.get_counter("wsb_earnings_requests_total", result="hit")
+        out["warm_run"] = warmer.warm_earnings()
+        out["warm"] = first_clicks()
+        out["warm_hits"] = metrics.get_counter("wsb_earnings_requests_total", result="hit") - hits_before
+        out["rewarm_run"] = warmer.warm_earnings()
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+    return out
+
+
+_STARTUP_PROBE = """
+import json, resource, sys, time
+sys.path.insert(0, {backend!r})
+start = time.perf_counter()
+import api
+elapsed = time.perf_counter() - start
+print(json.dumps({{"import_seconds": elapsed, "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+"""
+
+
+@suite("startup")
+def bench_startup(ctx):
+    """Cold import time and peak RSS of `import api` in a fresh interpreter."""
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples, rss = [], []
+    for _ in range(5):
+        out = subprocess.check_output([sys.executable, "-c", _STARTUP_PROBE.format(backend=backend)],
+                                      cwd=backend, text=True)
+        result = json.loads(out.strip().splitlines()[-1])
+        samples.append(result["import_seconds"])
+        rss.append(result["maxrss_kb"])
+    return {"import": _summary(samples), "maxrss_mb": round(max(rss) / 1024, 1)}
+
+
+def _storage_rows(ctx, now):
+    """Mentions with several tickers per item (for co-mentions), missing authors
+    and down-weighted duplicates, plus options with and without strike/type.
+    No row is within 10 minutes of a whole number of hours old, so windows
+    cut at now - N hours hold the same rows for the first 10 minutes."""
+    import random
+    r = random.Random(ctx.seed)
+    mentions, options = [], []
+    for i in range(ctx.n(100000)):
+        ts = now - 3600 * r.randint(0, 167) - r.randint(600, 3000)
+        author = f"ape{r.randint(1, 5000)}" if r.random() > 0.05 else None
+        weight = 1.0 if r.random() > 0.1 else 0.5
+        source = "options" if i % 4 == 0 else "wallstreetbets"
+        upvotes = int(r.paretovariate(1.5))
+        for ticker in sorted(set(r.choices(TICKERS, k=r.choice((1, 1, 2, 3))))):
+            mentions.append((ticker, f"c{i}", round(r.uniform(-1, 1), 4), ts, "comment", "", author,
+                             upvotes, weight, source))
+        if r.random() < 0.2:
+            ticker = r.choice(TICKERS)
+            strike = float(r.choice([5, 50, 100, 300])) if r.random() > 0.1 else None
+            kind = r.choice(["call", "put", None])
+            dte = r.choice([-3, 0, 4, 20, 60, 200, 500, None])
+            otm = round(r.uniform(-30, 30), 2) if strike is not None and kind and r.random() > 0.2 else None
+            options.append((ticker, strike, kind, None, r.choice(["0DTE", "weekly", "LEAPS", None]),
+                            f"{ticker} {strike}", f"c{i}", round(r.uniform(-1, 1), 4), ts, author, upvotes,
+                            weight, source, None, dte, None if otm is None else 100.0, otm))
+    return mentions, options
+
+
+def _storage_backends(ctx):
+    """(name, backend, close) per engine that can run here: SQLite is db.py
+    itself; DuckDB and Postgres when installed. Postgres is a throwaway
+    pgserver instance, or WSB_BENCH_DATABASE_URL (a scratch database: the
+    suite drops its tables)."""
+    import importlib.util
+    import storage
+    yield "sqlite", db.SQLiteStorage(), lambda: None
+    if importlib.util.find_spec("duckdb"):
+        backend = storage.DuckDBStorage(os.path.join(ctx.tmpdir, "bench.duckdb"))
+        backend.init_db()
+        yield "duckdb", backend, backend.close
+    url, server = os.environ.get("WSB_BENCH_DATABASE_URL"), None
+    if not url and importlib.util.find_spec("pgserver") and importlib.util.find_spec("psycopg_pool"):
+        import pgserver
+        server = pgserver.get_server(os.path.join(ctx.tmpdir, "pg"), cleanup_mode="stop")
+        url = server.get_uri()
+    if url and importlib.util.find_spec("psycopg_pool"):
+        backend = storage.PostgresStorage(url)
+        with backend._transaction() as conn:
+            conn.execute("DROP TABLE IF EXISTS mentions, options_flow, alert_baselines, alerts, leases, "
+                         "ticker_rollups, rollup_authors, comentions, author_sketches")
+        backend.init_db()
+
+        def close():
+            backend.close()
+            if server is not None:
+                server.cleanup()
+        yield "postgres", backend, close
+
+
+def _row_key(row):
+    """Sort key for rows with NULLs in them."""
+    return [(True, 0) if v is None else (False, v) for v in row]
+
+
+def _close_enough(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        return a is not None and b is not None and abs(a - b) <= 2e-4
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_close_enough(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(_close_enough(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def _storage_outputs(s, now, replaced):
+    """Every INTERFACE read over the written corpus, normalized for comparison:
+    ids dropped (sequences skip values on conflicts) and ties sorted."""
+    out = {}
+    for weight in ("none", "upvotes", "authors"):
+        for hours in (6, 168):
+            out[f"top:{weight}:{hours}h"] = sorted(s.get_top_tickers(hours=hours, limit=1000, exact=True, weight=weight),
+                                                   key=lambda t: (-t["weighted_mentions"], -t["mention_count"], t["ticker"]))
+    # Sketch estimates: same sketches, same HLL, so the same numbers
+    out["top:approx"] = sorted(s.get_top_tickers(hours=168, limit=1000),
+                               key=lambda t: (-t["weighted_mentions"], -t["mention_count"], t["ticker"]))
+    out["top:source"] = sorted(s.get_top_tickers(hours=24, limit=1000, source="options"), key=lambda t: t["ticker"])
+    detail = [{k: v for k, v in row.items() if k != "id"} for row in s.get_ticker_detail(TICKERS[0], hours=24)]
+    oldest = min((row["timestamp"] for row in detail), default=None)
+    out["detail"] = sorted((row for row in detail if row["timestamp"] != oldest), key=lambda row: row["post_id"])
+    out["related"] = sorted(s.get_related_tickers(TICKERS[1], hours=48, limit=1000), key=lambda t: t["ticker"])
+    counts = {t["ticker"]: t["mention_count"] for t in s.get_top_tickers(hours=48, limit=15, exact=True)}
+    out["graph"] = sorted(s.get_comention_graph(counts, hours=48), key=lambda e: (e["a"], e["b"]))
+    flow = s.get_options_flow(hours=168, limit=1000, exact=True)
+    for row in flow:
+        row["expiry_categories"] = sorted((row["expiry_categories"] or "").split(","))
+    out["options_flow"] = sorted(flow, key=lambda row: (row["ticker"], row["option_type"]))
+    summary = s.get_options_summary(hours=168)
+    for key in ("top_calls", "top_puts"):
+        summary[key] = sorted(row["upvotes"] for row in summary[key])
+    out["options_summary"] = summary
+    out["options_buckets"] = s.get_options_buckets(hours=168)
+    for table in db.EXPORT_TABLES:
+        out[f"export:{table}"] = sorted((row[1:] for batch in s.iter_export(table, now - 48 * 3600, now + 1)
+                                         for row in batch), key=_row_key)
+    out["db_stats"] = s.get_db_stats()
+    keys = [(now // 3600 - h, t) for h in range(0, 168, 7) for t in TICKERS[:20]]
+    out["hour_totals"] = sorted(s.get_hour_totals(keys).items())
+    out["first_bucket"] = s.get_first_bucket()
+    out["iter_hour_totals"] = [tuple(r) for r in s.iter_hour_totals()]
+    out["replaced"] = sorted((row[1:] for batch in s.iter_export("mentions", 0, now + 1) for row in batch
+                              if row[2] in replaced), key=_row_key)
+
+    alert = {"ticker": "GME", "bucket": now // 3600, "kind": "mentions", "count": 40, "value": 40.0,
+             "baseline": 3.5, "z": 9.1, "ratio": 11.43, "created_at": now}
+    s.save_alert_baselines([("GME", now // 3600, 30, 3.5, 2.0, 20, 0.1, 0.02)])
+    s.save_alert_baselines([("GME", now // 3600, 31, 3.6, 2.1, 21, 0.1, 0.02), ("AMC", 1, 2, 3.0, 4.0, 5, 0.0, 0.0)])
+    out["baselines"] = sorted(s.load_alert_baselines())
+    out["alerts"] = [[{k: v for k, v in a.items() if k != "id"} for a in s.insert_alerts([alert])],
+                     s.insert_alerts([alert]),
+                     [{k: v for k, v in a.items() if k != "id"} for a in s.get_alerts(hours=1)]]
+    first, _ = s.acquire_lease("bench", "a", 60)
+    out["leases"] = [first, s.acquire_lease("bench", "b", 60)[1]["holder"], s.renew_lease("bench", "a", first, 60)]
+    s.release_lease("bench", "a", first)
+    second, _ = s.acquire_lease("bench", "b", 60)
+    out["leases"] += [second - first, s.renew_lease("bench", "a", first, 60), s.get_lease("bench")["holder"]]
+    return out
+
+
+@suite("storage")
+def bench_storage(ctx):
+    """One corpus through every storage backend available here (WSB_STORAGE):
+    conformance of each INTERFACE read against SQLite, then write throughput
+    and read latency per backend. Run with WSB_STORAGE unset: SQLite is the reference."""
+    now = int(time.time())
+    mentions, options = _storage_rows(ctx, now)
+    replaced = sorted({row[1] for row in mentions[::50]})
+    replacement = [row[:2] + (0.9,) + row[3:] for row in mentions if row[1] in set(replaced)][::2]
+    out = {"mention_rows": len(mentions), "option_rows": len(options)}
+    backends = list(_storage_backends(ctx))
+    try:
+        for name, s, _ in backends:
+            start = time.perf_counter()
+            written = s.write_rows(mentions, options)
+            fresh = time.perf_counter() - start
+            start = time.perf_counter()
+            again = s.write_rows(mentions, options)
+            dupes = time.perf_counter() - start
+            start = time.perf_counter()
+            s.write_rows(replacement, (), replace_post_ids=replaced, chunk_size=1 << 30)
+            out[name] = {
+                "write_rows_per_sec": _rate(len(mentions) + len(options), fresh),
+                "rewrite_rows_per_sec": _rate(len(mentions) + len(options), dupes),
+                "replace_seconds": round(time.perf_counter() - start, 4),
+                "inserted": [written["mentions_inserted"], written["options_inserted"]],
+                "duplicates_on_rewrite": [again["mentions_duplicates"], again["options_duplicates"]],
+            }
+
+        # Back to back, and again if the hour turned meanwhile (hour-aligned windows move with it)
+        while True:
+            hour = int(time.time()) // 3600
+            outputs = {name: _storage_outputs(s, now, set(replaced)) for name, s, _ in backends}
+            if int(time.time()) // 3600 == hour:
+                break
+        for name, _, _ in backends:
+            out[name]["mismatches"] = [k for k in outputs["sqlite"]
+                                       if not _close_enough(outputs["sqlite"][k], outputs[name][k])]
+        failed = {name: out[name]["mismatches"] for name, _, _ in backends if out[name]["mismatches"]}
+        if failed:
+            raise AssertionError(f"storage backends disagree with SQLite: {failed}")
+
+        for name, s, _ in backends:
+            counts = {t["ticker"]: t["mention_count"] for t in s.get_top_tickers(hours=168, limit=25)}
+            reads = {
+                "top_24h": lambda: s.get_top_tickers(hours=24),
+                "top_168h": lambda: s.get_top_tickers(hours=168),
+                "top_168h_authors": lambda: s.get_top_tickers(hours=168, weight="authors"),
+                "related_168h": lambda: s.get_related_tickers(TICKERS[0], hours=168),
+                "graph_168h": lambda: s.get_comention_graph(counts, hours=168),
+                "options_flow_168h": lambda: s.get_options_flow(hours=168),
+                "options_buckets_168h": lambda: s.get_options_buckets(hours=168),
+                "hour_totals_500": lambda: s.get_hour_totals([(now // 3600 - h % 48, TICKERS[h % len(TICKERS)])
+                                                              for h in range(500)]),
+                "export_168h": lambda: sum(len(b) for b in s.iter_export("mentions", now - 168 * 3600, now + 1)),
+            }
+            for label, fn in reads.items():
+                samples = []
+                for _ in range(5):
+                    t0 = time.perf_counter()
+                    fn()
+                    samples.append(time.perf_counter() - t0)
+                out[name][label] = _summary(samples)
+    finally:
+        for _, _, close in backends:
+            close()
+    return out
+
+
+# ---------------------------------------------------------------- runner
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(__file__), text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def run(names, seed, scale):
+    results = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "scale": scale,
+        "suites": {},
+    }
+    for name in names:
+        print(f"[bench] {name}...", flush=True)
+        ctx = Context(seed, scale)
+        try:
+            start = time.perf_counter()
+            results["suites"][name] = SUITES[name](ctx)
+            print(f"[bench] {name} done in {time.perf_counter() - start:.1f}s")
+        finally:
+            ctx.close()
+    return results
+
+
+def _flatten(d, prefix=""):
+    for k, v in d.items():
+        key = f"{prefix}.{k}" if prefix else k
+        if isinstance(v, dict):
+            yield from _flatten(v, key)
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            yield key, v
+
+
+def compare(path_a, path_b):
+    """Print every numeric metric present in both result files with the b/a ratio."""
+    with open(path_a) as f:
+        a = dict(_flatten(json.load(f)["suites"]))
+    with open(path_b) as f:
+        b = dict(_flatten(json.load(f)["suites"]))
+    width = max((len(k) for k in a if k in b), default=10)
+    print(f"{'metric':<{width}}  {'a':>12}  {'b':>12}  {'b/a':>7}")
+    for key in sorted(k for k in a if k in b):
+        ratio = f"{b[key] / a[key]:.2f}" if a[key] else "-"
+        print(f"{key:<{width}}  {a[key]:>12}  {b[key]:>12}  {ratio:>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WSB sentiment benchmarks")
+    parser.add_argument("-s", "--suite", action="append", choices=sorted(SUITES),
+                        help="suite to run (repeatable, default: all)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply corpus sizes")
+    parser.add_argument("--out", help="results JSON path (default: bench/results/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("A", "B"), help="compare two result files")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = run(args.suite or list(SUITES), args.seed, args.scale)
+    out = args.out or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[bench] Results written to {out}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,99 @@
 import sqlite3
+import fcntl
+import json
+import math
 import os
+import time
 from datetime import datetime, timedelta, timezone
+from itertools import islice
+import hll
+import metrics
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "data", "wsb.db")
+# Engine for mentions/options, alerts and leases: sqlite (this module), duckdb or postgres (storage.py)
+STORAGE = os.environ.get("WSB_STORAGE", "sqlite")
 
+# Queries slower than this get their EXPLAIN QUERY PLAN logged (0 disables)
+SLOW_QUERY_MS = float(os.environ.get("WSB_SLOW_QUERY_MS", "250"))
+# The progress handler fires every N VM instructions; cheap enough to leave on
+_STEP_GRANULARITY = 1000
 
-def get_conn():
+metrics.describe("wsb_db_query_seconds", "Time per named DB query")
+metrics.describe("wsb_db_rows_returned_total", "Rows returned per named DB query")
+metrics.describe("wsb_db_vm_steps_total", "SQLite VM instructions per named query (proxy for rows scanned)")
+metrics.describe("wsb_db_slow_queries_total", "Queries slower than WSB_SLOW_QUERY_MS")
+
+
+def upvote_weight(upvotes):
+    """Per-row weight for weight=upvotes: 1 + ln(1 + upvotes). A 5,000-upvote DD
+    counts ~9.5× a 0-upvote comment rather than 5,000×."""
+    return 1.0 + math.log1p(max(upvotes or 0, 0))
+
+
+def get_conn(check_same_thread=True):
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL")
+    conn.create_function("upvote_weight", 1, upvote_weight, deterministic=True)
     return conn
 
 
+def _query(conn, name, sql, params=()):
+    """Execute a read query and fetch all rows, recording timing and scan metrics under `name`."""
+    steps = [0]
+
+    def _count_steps():
+        steps[0] += 1
+        return 0
+
+    conn.set_progress_handler(_count_steps, _STEP_GRANULARITY)
+    start = time.perf_counter()
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        elapsed = time.perf_counter() - start
+        conn.set_progress_handler(None, 0)
+
+    metrics.observe("wsb_db_query_seconds", elapsed, query=name)
+    metrics.inc("wsb_db_rows_returned_total", len(rows), query=name)
+    metrics.inc("wsb_db_vm_steps_total", steps[0] * _STEP_GRANULARITY, query=name)
+    if SLOW_QUERY_MS and elapsed * 1000 > SLOW_QUERY_MS:
+        _log_slow_query(conn, name, sql, params, elapsed)
+    return rows
+
+
+def _log_slow_query(conn, name, sql, params, elapsed):
+    metrics.inc("wsb_db_slow_queries_total", query=name)
+    try:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    except sqlite3.Error as e:
+        plan = [(None, None, None, f"<explain failed: {e}>")]
+    print(f"[db] Slow query {name}: {elapsed * 1000:.1f}ms")
+    for row in plan:
+        print(f"[db]   {row[-1]}")
+
+
 def init_db():
+    """Create/migrate the schema. Every API worker calls this at startup; an
+    exclusive lock on a file next to the database makes them take turns, so a
+    migration or rebuild runs once and the others then find nothing to do."""
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    with open(f"{DB_PATH}.init.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # released when the file closes
+        _init_db()
+        store.init_db()
+
+
+def _init_db():
     conn = get_conn()
+    # Rollups from before `source` existed are keyed (bucket, ticker); drop them
+    # and let the rebuild below recreate them per source
+    rollup_columns = {r[1] for r in conn.execute("PRAGMA table_info(ticker_rollups)")}
+    if rollup_columns and "source" not in rollup_columns:
+        conn.executescript("DROP TABLE ticker_rollups; DROP TABLE IF EXISTS rollup_authors;")
+    new_comentions = not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'comentions'").fetchone()
     conn.executescript("""
         CREATE TABLE IF NOT EXISTS mentions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -26,11 +105,14 @@ def init_db():
             title TEXT,
             author TEXT,
             upvotes INTEGER DEFAULT 0,
+            weight REAL NOT NULL DEFAULT 1.0,
+            source TEXT NOT NULL DEFAULT 'wallstreetbets',
             UNIQUE(ticker, post_id)
         );
         CREATE INDEX IF NOT EXISTS idx_ticker ON mentions(ticker);
         CREATE INDEX IF NOT EXISTS idx_timestamp ON mentions(timestamp);
         CREATE INDEX IF NOT EXISTS idx_ticker_timestamp ON mentions(ticker, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_post_id ON mentions(post_id);
 
         CREATE TABLE IF NOT EXISTS options_flow (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -45,198 +127,1397 @@ def init_db():
             timestamp INTEGER NOT NULL,
             author TEXT,
             upvotes INTEGER DEFAULT 0,
+            weight REAL NOT NULL DEFAULT 1.0,
+            source TEXT NOT NULL DEFAULT 'wallstreetbets',
+            expiry_date TEXT,
+            dte INTEGER,
+            underlying REAL,
+            otm_pct REAL,
             UNIQUE(ticker, strike, option_type, post_id)
         );
         CREATE INDEX IF NOT EXISTS idx_options_ticker ON options_flow(ticker);
         CREATE INDEX IF NOT EXISTS idx_options_timestamp ON options_flow(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_options_post_id ON options_flow(post_id);
+
+        -- Earnings oracle results (earnings.fetch_earnings_data): one summary
+        -- row per symbol plus its events. response is the /api/earnings/{symbol}
+        -- body, serialized once when stored and served as-is. See save_earnings.
+        CREATE TABLE IF NOT EXISTS earnings_summary (
+            symbol TEXT PRIMARY KEY,
+            events INTEGER NOT NULL,
+            years_covered REAL,
+            moon_pct REAL,
+            tank_pct REAL,
+            flat_pct REAL,
+            avg_move REAL,
+            max_moon REAL,
+            max_tank REAL,
+            volatility REAL,
+            streak INTEGER,
+            streak_direction TEXT,
+            guh_score REAL,
+            commentary TEXT,
+            fetched_at INTEGER NOT NULL,
+            response BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS earnings_events (
+            symbol TEXT NOT NULL,
+            date TEXT NOT NULL,
+            eps_estimate REAL,
+            eps_actual REAL,
+            surprise_pct REAL,
+            price_before REAL,
+            price_after REAL,
+            move_pct REAL,
+            classification TEXT,
+            PRIMARY KEY (symbol, date)
+        ) WITHOUT ROWID;
+
+        -- Daily OHLC bars for the earnings engine, topped up incrementally
+        -- (see earnings._price_history). price_checks records the calendar
+        -- day each symbol was last refreshed, so one download per day at most.
+        CREATE TABLE IF NOT EXISTS price_history (
+            symbol TEXT NOT NULL,
+            date TEXT NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL NOT NULL,
+            volume INTEGER,
+            PRIMARY KEY (symbol, date)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS price_checks (
+            symbol TEXT PRIMARY KEY,
+            checked_on TEXT NOT NULL
+        );
+
+        -- HyperLogLog sketches of distinct authors per (scope, ticker, bucket).
+        -- scope: 'mentions' (bucket = hour) or 'mentions:day' (bucket = UTC day), so
+        -- long windows merge whole days. get_options_flow scans raw rows anyway
+        -- and counts exactly.
+        CREATE TABLE IF NOT EXISTS author_sketches (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            registers BLOB NOT NULL,
+            PRIMARY KEY (scope, key, bucket)
+        ) WITHOUT ROWID;
+
+        -- Hourly per-ticker running sums for /api/tickers. For each weighting
+        -- mode (prefix: '' none, 'u' upvotes, 'a' authors) w = Σw, ws = Σw·s,
+        -- wss = Σw·s², ww = Σw², so mean and confidence interval come from
+        -- the sums without touching raw rows. See _update_rollups.
+        CREATE TABLE IF NOT EXISTS ticker_rollups (
+            bucket INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            source TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            max_upvotes INTEGER,
+            latest INTEGER,
+            w REAL NOT NULL, ws REAL NOT NULL, wss REAL NOT NULL, ww REAL NOT NULL,
+            uw REAL NOT NULL, uws REAL NOT NULL, uwss REAL NOT NULL, uww REAL NOT NULL,
+            aw REAL NOT NULL, aws REAL NOT NULL, awss REAL NOT NULL, aww REAL NOT NULL,
+            PRIMARY KEY (bucket, ticker, source)
+        ) WITHOUT ROWID;
+        -- Per-ticker mention counts over a window (co-mention jaccard) without scanning every ticker's hours
+        CREATE INDEX IF NOT EXISTS idx_rollups_ticker ON ticker_rollups(ticker, bucket);
+
+        -- Per-thread comment history the comment expander ranks threads by
+        CREATE TABLE IF NOT EXISTS thread_stats (
+            post_id TEXT PRIMARY KEY,
+            num_comments INTEGER NOT NULL,
+            fetched_at INTEGER NOT NULL,
+            comments_seen INTEGER NOT NULL,
+            ticker_hits INTEGER NOT NULL,
+            requests INTEGER NOT NULL,
+            pending_more TEXT NOT NULL DEFAULT '',
+            pending_count INTEGER NOT NULL DEFAULT 0
+        );
+
+        -- (hour, ticker, source, author) already counted in the authors-mode sums
+        CREATE TABLE IF NOT EXISTS rollup_authors (
+            bucket INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            source TEXT NOT NULL,
+            author TEXT NOT NULL,
+            PRIMARY KEY (bucket, ticker, source, author)
+        ) WITHOUT ROWID;
+
+        -- Hourly co-mention counts: n items (posts/comments) mentioned both
+        -- ticker and other, w = Σ min(weight) over those items. Only pairs
+        -- that occurred get a row, and each pair is stored in both directions
+        -- so "related to X" is one range scan. See _fill_stage_comentions.
+        CREATE TABLE IF NOT EXISTS comentions (
+            ticker TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            other TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            w REAL NOT NULL,
+            PRIMARY KEY (ticker, bucket, other)
+        ) WITHOUT ROWID;
 
-        CREATE TABLE IF NOT EXISTS earnings_cache (
+        -- Spike detector state (alerts.py): per ticker, the hour currently
+        -- open plus EWMA mean/variance of closed hours' mention counts and
+        -- (over hours with mentions) mean sentiment
+        CREATE TABLE IF NOT EXISTS alert_baselines (
             ticker TEXT PRIMARY KEY,
-            data TEXT NOT NULL,
-            fetched_at INTEGER NOT NULL
+            bucket INTEGER NOT NULL,
+            hours INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            var REAL NOT NULL,
+            s_hours INTEGER NOT NULL,
+            s_mean REAL NOT NULL,
+            s_var REAL NOT NULL
+        ) WITHOUT ROWID;
+        -- At most one alert per (ticker, hour, kind): the first crossing
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticker TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            value REAL NOT NULL,
+            baseline REAL NOT NULL,
+            z REAL NOT NULL,
+            ratio REAL,
+            created_at INTEGER NOT NULL,
+            UNIQUE(ticker, bucket, kind)
+        );
+        CREATE INDEX IF NOT EXISTS idx_alerts_created ON alerts(created_at);
+
+        -- Named leases (leader.py): one holder at a time until expires_at.
+        -- generation goes up on every acquisition and is never reset
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            generation INTEGER NOT NULL,
+            acquired_at INTEGER NOT NULL,
+            expires_at REAL NOT NULL
         );
     """)
-    conn.close()
+    try:
+        # weight: < 1.0 for duplicate items reused under WSB_DEDUP=weight (see dedup.py)
+        # source: the subreddit a row was scraped from (see sources.py)
+        for table in ("mentions", "options_flow"):
+            columns = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+            if "weight" not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN weight REAL NOT NULL DEFAULT 1.0")
+            if "source" not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN source TEXT NOT NULL DEFAULT 'wallstreetbets'")
+        # pending_more: collapsed comment ids the expander's budget didn't reach, and
+        # pending_count: the new comments still behind them (see expander.py)
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(thread_stats)")}
+        if "pending_more" not in columns:
+            conn.execute("ALTER TABLE thread_stats ADD COLUMN pending_more TEXT NOT NULL DEFAULT ''")
+        if "pending_count" not in columns:
+            conn.execute("ALTER TABLE thread_stats ADD COLUMN pending_count INTEGER NOT NULL DEFAULT 0")
+        # Options enrichment (options.enrich_option_rows); rows from before it stay NULL until a replay
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(options_flow)")}
+        for column, sql_type in OPTION_ENRICHED_COLUMNS:
+            if column not in columns:
+                conn.execute(f"ALTER TABLE options_flow ADD COLUMN {column} {sql_type}")
+        # /api/options DTE and moneyness buckets read only this index
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_options_buckets ON options_flow({_OPTION_BUCKET_INDEX})")
+        # Options sketches are no longer read (get_options_flow counts exactly)
+        conn.execute("DELETE FROM author_sketches WHERE scope IN ('options:call', 'options:put')")
+        has_sketches = conn.execute("SELECT 1 FROM author_sketches WHERE scope = 'mentions:day' LIMIT 1").fetchone()
+        has_mentions = conn.execute("SELECT 1 FROM mentions LIMIT 1").fetchone()
+        if has_mentions and not has_sketches:
+            rebuild_author_sketches(conn)
+        has_rollups = conn.execute("SELECT 1 FROM ticker_rollups LIMIT 1").fetchone()
+        if has_mentions and not has_rollups:
+            rebuild_ticker_rollups(conn)
+        if has_mentions and new_comentions:
+            rebuild_comentions(conn)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'earnings_cache'").fetchone():
+            _migrate_earnings_cache(conn)
+    finally:
+        conn.close()
+
+
+EARNINGS_TTL_SECONDS = 86400
+_EARNINGS_SUMMARY_COLUMNS = ("events", "years_covered", "moon_pct", "tank_pct", "flat_pct", "avg_move",
+                             "max_moon", "max_tank", "volatility", "streak", "streak_direction",
+                             "guh_score", "commentary")
+_EARNINGS_EVENT_COLUMNS = ("date", "eps_estimate", "eps_actual", "surprise_pct", "price_before",
+                           "price_after", "move_pct", "classification")
+
+
+def _save_earnings(conn, result, fetched_at):
+    symbol = result["symbol"].upper()
+    # Same compact encoding FastAPI's JSONResponse uses
+    response = json.dumps(dict(result, cached=True), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    conn.execute(
+        f"""INSERT OR REPLACE INTO earnings_summary
+            (symbol, {", ".join(_EARNINGS_SUMMARY_COLUMNS)}, fetched_at, response)
+            VALUES (?, {", ".join("?" for _ in _EARNINGS_SUMMARY_COLUMNS)}, ?, ?)""",
+        (symbol, *(result.get(c) for c in _EARNINGS_SUMMARY_COLUMNS), fetched_at, response))
+    conn.execute("DELETE FROM earnings_events WHERE symbol = ?", (symbol,))
+    conn.executemany(
+        f"""INSERT OR REPLACE INTO earnings_events (symbol, {", ".join(_EARNINGS_EVENT_COLUMNS)})
+            VALUES (?, {", ".join("?" for _ in _EARNINGS_EVENT_COLUMNS)})""",
+        [(symbol, *(e.get(c) for c in _EARNINGS_EVENT_COLUMNS)) for e in result.get("history", ())])
 
 
-def get_earnings_cache(ticker):
-    """Return cached earnings JSON if < 24h old, else None."""
+def _migrate_earnings_cache(conn):
+    """Move rows from the old JSON-blob earnings_cache table into earnings_summary/events."""
+    moved = 0
+    with conn:
+        for row in conn.execute("SELECT ticker, data, fetched_at FROM earnings_cache").fetchall():
+            try:
+                result = json.loads(row["data"])
+            except ValueError:
+                continue
+            if result.get("error") is None and "moon_pct" in result:
+                result.pop("cached", None)
+                _save_earnings(conn, dict(result, symbol=result.get("symbol") or row["ticker"]), row["fetched_at"])
+                moved += 1
+        conn.execute("DROP TABLE earnings_cache")
+    print(f"[db] Migrated {moved} earnings_cache rows to earnings_summary")
+
+
+def save_earnings(result):
+    """Store a successful earnings.fetch_earnings_data() result."""
     conn = get_conn()
     try:
-        row = conn.execute(
-            "SELECT data, fetched_at FROM earnings_cache WHERE ticker = ?",
-            (ticker.upper(),)
-        ).fetchone()
-        if row is None:
-            return None
-        age = int(datetime.now(timezone.utc).timestamp()) - row["fetched_at"]
-        if age > 86400:  # 24 hours
-            return None
-        return row["data"]
+        with conn:
+            _save_earnings(conn, result, int(datetime.now(timezone.utc).timestamp()))
     finally:
         conn.close()
 
 
-def set_earnings_cache(ticker, data_json):
-    """Upsert earnings cache row."""
+def get_earnings_response(symbol):
+    """Pre-serialized /api/earnings/{symbol} JSON bytes if stored < 24h ago, else None."""
+    cutoff = int(datetime.now(timezone.utc).timestamp()) - EARNINGS_TTL_SECONDS
     conn = get_conn()
     try:
-        conn.execute(
-            """INSERT INTO earnings_cache (ticker, data, fetched_at)
-               VALUES (?, ?, ?)
-               ON CONFLICT(ticker) DO UPDATE SET data=excluded.data, fetched_at=excluded.fetched_at""",
-            (ticker.upper(), data_json, int(datetime.now(timezone.utc).timestamp()))
-        )
-        conn.commit()
+        rows = _query(conn, "get_earnings_response",
+                      "SELECT response FROM earnings_summary WHERE symbol = ? AND fetched_at >= ?",
+                      (symbol.upper(), cutoff))
+        return rows[0]["response"] if rows else None
+    finally:
+        conn.close()
+
+
+def get_earnings_summaries(symbols):
+    """Summary metrics (no event history) for every symbol stored < 24h ago,
+    highest GUH score first. One query for the whole list."""
+    symbols = list(dict.fromkeys(s.upper() for s in symbols))[:500]
+    if not symbols:
+        return []
+    cutoff = int(datetime.now(timezone.utc).timestamp()) - EARNINGS_TTL_SECONDS
+    conn = get_conn()
+    try:
+        rows = _query(
+            conn, "get_earnings_summaries",
+            f"""SELECT symbol, {", ".join(_EARNINGS_SUMMARY_COLUMNS)}, fetched_at
+                FROM earnings_summary
+                WHERE symbol IN ({", ".join("?" for _ in symbols)}) AND fetched_at >= ?
+                ORDER BY guh_score DESC, symbol""",
+            (*symbols, cutoff))
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def get_price_coverage(symbol):
+    """(checked_on, last_date) for a symbol's stored prices; (None, None) if never fetched."""
+    conn = get_conn()
+    try:
+        checked = conn.execute("SELECT checked_on FROM price_checks WHERE symbol = ?", (symbol,)).fetchone()
+        last = conn.execute("SELECT MAX(date) FROM price_history WHERE symbol = ?", (symbol,)).fetchone()
+        return (checked[0] if checked else None), last[0]
+    finally:
+        conn.close()
+
+
+def get_price_history(symbol, since=None):
+    """Stored daily bars for a symbol, oldest first."""
+    conn = get_conn()
+    try:
+        return _query(conn, "get_price_history",
+                      """SELECT date, open, high, low, close, volume FROM price_history
+                         WHERE symbol = ? AND date >= ? ORDER BY date""",
+                      (symbol, since or ""))
+    finally:
+        conn.close()
+
+
+def append_price_history(symbol, rows, checked_on):
+    """Upsert (date, open, high, low, close, volume) bars and mark the symbol
+    refreshed on `checked_on`. Re-sent dates overwrite — the last stored bar
+    may have been taken intraday."""
+    conn = get_conn()
+    try:
+        with conn:
+            conn.executemany(
+                """INSERT OR REPLACE INTO price_history (symbol, date, open, high, low, close, volume)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                [(symbol, *r) for r in rows])
+            conn.execute("INSERT OR REPLACE INTO price_checks (symbol, checked_on) VALUES (?, ?)",
+                         (symbol, checked_on))
+    finally:
+        conn.close()
+
+
+def get_price_checks(symbols):
+    """symbol → the calendar day its price_history was last refreshed, for those ever refreshed."""
+    symbols = list(symbols)
+    conn = get_conn()
+    try:
+        rows = []
+        # Stay under SQLite's host-parameter limit
+        for i in range(0, len(symbols), 500):
+            chunk = symbols[i:i + 500]
+            rows += _query(conn, "get_price_checks",
+                           f"SELECT symbol, checked_on FROM price_checks WHERE symbol IN ({','.join('?' * len(chunk))})",
+                           chunk)
+        return {r["symbol"]: r["checked_on"] for r in rows}
+    finally:
+        conn.close()
+
+
+def get_daily_closes(symbols, since, until):
+    """(symbol, date, close) for the stored bars of `symbols` with since <= date <= until,
+    oldest first per symbol — one pass for a whole batch of options rather than one per option."""
+    symbols = list(symbols)
+    conn = get_conn()
+    try:
+        rows = []
+        for i in range(0, len(symbols), 500):
+            chunk = symbols[i:i + 500]
+            rows += _query(conn, "get_daily_closes",
+                           f"""SELECT symbol, date, close FROM price_history
+                               WHERE symbol IN ({','.join('?' * len(chunk))}) AND date BETWEEN ? AND ?
+                               ORDER BY symbol, date""",
+                           (*chunk, since, until))
+        return [tuple(r) for r in rows]
+    finally:
+        conn.close()
+
+
+THREAD_STATS_RETENTION_DAYS = 7
+
+
+def get_thread_stats(post_ids=None):
+    """thread_stats rows keyed by post_id (all rows when post_ids is None)."""
+    conn = get_conn()
+    try:
+        if post_ids is None:
+            rows = _query(conn, "get_thread_stats", "SELECT * FROM thread_stats")
+        else:
+            ids = list(post_ids)
+            rows = []
+            # Stay under SQLite's host-parameter limit
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                rows += _query(conn, "get_thread_stats",
+                               f"SELECT * FROM thread_stats WHERE post_id IN ({','.join('?' * len(chunk))})",
+                               chunk)
+        return {r["post_id"]: dict(r) for r in rows}
+    finally:
+        conn.close()
+
+
+def update_thread_stats(rows):
+    """Record one run's per-thread fetch results. rows: dicts with post_id,
+    num_comments, fetched_at, comments_seen, ticker_hits, requests, pending_more, pending_count —
+    comments_seen, ticker_hits and requests are added to the running totals."""
+    conn = get_conn()
+    try:
+        with conn:
+            conn.executemany("""
+                INSERT INTO thread_stats (post_id, num_comments, fetched_at, comments_seen, ticker_hits, requests,
+                                          pending_more, pending_count)
+                VALUES (:post_id, :num_comments, :fetched_at, :comments_seen, :ticker_hits, :requests, :pending_more,
+                        :pending_count)
+                ON CONFLICT(post_id) DO UPDATE SET
+                    num_comments = excluded.num_comments,
+                    pending_more = excluded.pending_more,
+                    pending_count = excluded.pending_count,
+                    fetched_at = excluded.fetched_at,
+                    comments_seen = comments_seen + excluded.comments_seen,
+                    ticker_hits = ticker_hits + excluded.ticker_hits,
+                    requests = requests + excluded.requests
+            """, rows)
+            cutoff = int(time.time()) - THREAD_STATS_RETENTION_DAYS * 86400
+            conn.execute("DELETE FROM thread_stats WHERE fetched_at < ?", (cutoff,))
     finally:
         conn.close()
 
 
 def insert_mention(ticker, post_id, sentiment_score, timestamp, source_type,
-                   title=None, author=None, upvotes=0):
+                   title=None, author=None, upvotes=0, weight=1.0, source="wallstreetbets"):
     conn = get_conn()
     try:
         conn.execute(
             """INSERT OR IGNORE INTO mentions
-               (ticker, post_id, sentiment_score, timestamp, source_type, title, author, upvotes)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+               (ticker, post_id, sentiment_score, timestamp, source_type, title, author, upvotes, weight, source)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (ticker, post_id, sentiment_score, int(timestamp), source_type,
-             title, author, upvotes)
+             title, author, upvotes, weight, source)
         )
         conn.commit()
     finally:
         conn.close()
 
 
-def insert_mentions_batch(rows):
-    """Insert multiple mentions efficiently. rows = list of tuples matching insert_mention params."""
-    conn = get_conn()
+MENTION_COLUMNS = "ticker, post_id, sentiment_score, timestamp, source_type, title, author, upvotes, weight, source"
+# Appended by options.enrich_option_rows: resolved expiry, days to it from the
+# post, the underlying's close as of the post and the strike's % out of the money
+OPTION_ENRICHED_COLUMNS = (("expiry_date", "TEXT"), ("dte", "INTEGER"), ("underlying", "REAL"), ("otm_pct", "REAL"))
+OPTION_COLUMNS = ("ticker, strike, option_type, expiry, expiry_category, raw_match, "
+                  "post_id, sentiment_score, timestamp, author, upvotes, weight, source, "
+                  + ", ".join(c for c, _ in OPTION_ENRICHED_COLUMNS))
+
+# /api/options buckets as (inclusive upper bound, label); the last label takes the rest
+DTE_BUCKETS = ((-1, "expired"), (0, "0DTE"), (7, "1-7d"), (30, "8-30d"), (90, "31-90d"), (365, "91-365d"),
+               (None, "LEAPS"))
+MONEYNESS_BUCKETS = ((-10, "deep ITM"), (-2, "ITM"), (2, "ATM"), (10, "OTM"), (None, "far OTM"))
+_OPTION_BUCKET_INDEX = "timestamp, option_type, dte, otm_pct, weight, sentiment_score"
+# otm_pct is stored to 2 decimals: summing whole hundredths keeps the mean exact,
+# so ROUND can't flip on float summation order (which differs between engines)
+_AVG_OTM_PCT_SQL = "SUM(CAST(ROUND(otm_pct * 100) AS BIGINT)) / (100.0 * NULLIF(COUNT(otm_pct), 0))"
+
+# Rows per write transaction — big enough to amortize the commit, small enough
+# that readers never wait long on the write lock
+WRITE_CHUNK_SIZE = int(os.environ.get("WSB_WRITE_CHUNK_SIZE", "20000"))
+
+
+def _create_stage_tables(conn):
+    """Temp staging tables — they live in the connection's temp DB, so filling
+    them takes no lock on wsb.db."""
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.executescript("""
+        CREATE TEMP TABLE IF NOT EXISTS stage_mentions (
+            ticker TEXT NOT NULL,
+            post_id TEXT NOT NULL,
+            sentiment_score REAL NOT NULL,
+            timestamp INTEGER NOT NULL,
+            source_type TEXT NOT NULL,
+            title TEXT,
+            author TEXT,
+            upvotes INTEGER DEFAULT 0,
+            weight REAL NOT NULL DEFAULT 1.0,
+            source TEXT NOT NULL DEFAULT 'wallstreetbets',
+            UNIQUE(ticker, post_id)
+        );
+        CREATE TEMP TABLE IF NOT EXISTS stage_options (
+            ticker TEXT NOT NULL,
+            strike REAL,
+            option_type TEXT,
+            expiry TEXT,
+            expiry_category TEXT,
+            raw_match TEXT,
+            post_id TEXT NOT NULL,
+            sentiment_score REAL NOT NULL,
+            timestamp INTEGER NOT NULL,
+            author TEXT,
+            upvotes INTEGER DEFAULT 0,
+            weight REAL NOT NULL DEFAULT 1.0,
+            source TEXT NOT NULL DEFAULT 'wallstreetbets',
+            expiry_date TEXT,
+            dte INTEGER,
+            underlying REAL,
+            otm_pct REAL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS temp.stage_options_key ON stage_options(
+            ticker, IFNULL(strike, -1), IFNULL(option_type, ''), IFNULL(expiry_category, ''), post_id);
+        CREATE TEMP TABLE IF NOT EXISTS stage_post_ids (post_id TEXT PRIMARY KEY);
+        CREATE TEMP TABLE IF NOT EXISTS stage_comentions (
+            ticker TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            other TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            w REAL NOT NULL
+        );
+        CREATE TEMP TABLE IF NOT EXISTS stage_rollup (
+            bucket INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            source TEXT NOT NULL,
+            author TEXT,
+            s REAL NOT NULL,
+            upvotes INTEGER,
+            timestamp INTEGER NOT NULL,
+            first INTEGER NOT NULL,
+            w REAL NOT NULL,
+            uw REAL NOT NULL,
+            aw REAL NOT NULL
+        );
+    """)
+
+
+def _stage_chunk(conn, mention_chunk, option_chunk):
+    """Load one chunk into the stage tables and drop rows that already exist in the main tables.
+
+    Runs outside any write transaction (reads of wsb.db only)."""
+    conn.execute("DELETE FROM stage_mentions")
+    conn.execute("DELETE FROM stage_options")
+    conn.executemany(f"INSERT OR IGNORE INTO stage_mentions ({MENTION_COLUMNS}) "
+                     f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", mention_chunk)
+    conn.executemany(f"INSERT OR IGNORE INTO stage_options ({OPTION_COLUMNS}) "
+                     f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", option_chunk)
+    conn.execute("""
+        DELETE FROM stage_mentions WHERE EXISTS (
+            SELECT 1 FROM main.mentions m
+            WHERE m.ticker = stage_mentions.ticker AND m.post_id = stage_mentions.post_id)
+    """)
+    conn.execute("""
+        DELETE FROM stage_options WHERE EXISTS (
+            SELECT 1 FROM main.options_flow o
+            WHERE o.ticker = stage_options.ticker
+              AND o.strike IS stage_options.strike
+              AND o.option_type IS stage_options.option_type
+              AND o.post_id = stage_options.post_id
+              AND o.expiry_category IS stage_options.expiry_category)
+    """)
+
+
+def _merge_chunk(conn):
+    """Move staged rows into the main tables. Caller holds the write transaction.
+    Returns (mentions_inserted, options_inserted)."""
+    # rowid order, so ids follow the order _fill_stage_rollup picked authors-mode firsts in
+    mentions = conn.execute(f"INSERT OR IGNORE INTO main.mentions ({MENTION_COLUMNS}) "
+                            f"SELECT {MENTION_COLUMNS} FROM stage_mentions ORDER BY rowid").rowcount
+    options = conn.execute(f"INSERT OR IGNORE INTO main.options_flow ({OPTION_COLUMNS}) "
+                           f"SELECT {OPTION_COLUMNS} FROM stage_options").rowcount
+    return mentions, options
+
+
+SKETCH_BUCKET_SECONDS = 3600
+SKETCH_DAY_BUCKETS = 24  # hourly buckets per 'mentions:day' bucket
+
+
+def _build_sketches(mention_rows):
+    """Per-(scope, ticker, bucket) author sketches for a batch of mention rows:
+    one per hour and one per UTC day.
+
+    HLL adds are idempotent, so rows that turn out to be duplicates are harmless.
+    """
+    sketches = {}
+    for row in mention_rows:
+        author = row[6]
+        if author is None:
+            continue
+        h = hll.hash_value(author)
+        hour = int(row[3]) // SKETCH_BUCKET_SECONDS
+        for key in (("mentions", row[0], hour), ("mentions:day", row[0], hour // SKETCH_DAY_BUCKETS)):
+            sk = sketches.get(key)
+            if sk is None:
+                sk = sketches[key] = hll.HyperLogLog()
+            sk.add_hash(h)
+    return sketches
+
+
+def _apply_sketches(conn, sketches):
+    """Merge batch sketches into author_sketches. Caller holds the write transaction."""
+    merged = []
+    for (scope, key, bucket), sk in sketches.items():
+        row = conn.execute(
+            "SELECT registers FROM author_sketches WHERE scope = ? AND key = ? AND bucket = ?",
+            (scope, key, bucket)
+        ).fetchone()
+        if row is not None:
+            sk.merge(row[0])
+        merged.append((scope, key, bucket, sk.to_bytes()))
+    conn.executemany(
+        "INSERT OR REPLACE INTO author_sketches (scope, key, bucket, registers) VALUES (?, ?, ?, ?)", merged)
+
+
+def rebuild_author_sketches(conn=None):
+    """Recompute every author sketch from the raw tables (first run on an existing DB, or after a replay)."""
+    own = conn is None
+    conn = conn or get_conn()
     try:
-        conn.executemany(
-            """INSERT OR IGNORE INTO mentions
-               (ticker, post_id, sentiment_score, timestamp, source_type, title, author, upvotes)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            rows
+        print("[db] Building author sketches from raw rows...")
+        sketches = _build_sketches(conn.execute(f"SELECT {MENTION_COLUMNS} FROM mentions"))
+        with conn:
+            conn.execute("DELETE FROM author_sketches")
+            _apply_sketches(conn, sketches)
+        print(f"[db] Built {len(sketches)} author sketches")
+    finally:
+        if own:
+            conn.close()
+
+
+def _exact_author_counts(conn, keys, cutoff, source=None):
+    """COUNT(DISTINCT author) per mentioned ticker since `cutoff`, from raw rows."""
+    if not keys:
+        return {}
+    placeholders = ",".join("?" * len(keys))
+    source_sql = "AND source = ?" if source else ""
+    return {r["ticker"]: r["n"] for r in _query(
+        conn, "get_top_tickers:exact_authors",
+        f"SELECT ticker, COUNT(DISTINCT author) AS n FROM mentions "
+        f"WHERE ticker IN ({placeholders}) AND timestamp >= ? {source_sql} GROUP BY ticker",
+        (*keys, cutoff, *((source,) if source else ())))}
+
+
+def _sketch_sql(scope, keys, cutoff):
+    """(sql, params) selecting (key, registers) rows for _sketch_counts: hourly
+    sketches up to the first whole day in the window, daily sketches from there on."""
+    placeholders = ",".join("?" * len(keys))
+    hour = cutoff // SKETCH_BUCKET_SECONDS
+    day = -(-hour // SKETCH_DAY_BUCKETS)
+    return (f"SELECT key, registers FROM author_sketches "
+            f"WHERE scope = ? AND key IN ({placeholders}) AND bucket >= ? AND bucket < ? "
+            f"UNION ALL "
+            f"SELECT key, registers FROM author_sketches "
+            f"WHERE scope = ? AND key IN ({placeholders}) AND bucket >= ?",
+            (scope, *keys, hour, day * SKETCH_DAY_BUCKETS, f"{scope}:day", *keys, day))
+
+
+def _sketch_counts(conn, scope, keys, cutoff):
+    """Approximate distinct authors per key since `cutoff`, from author_sketches.
+
+    The window is widened to the start of the cutoff's hour, so counts can
+    include up to one extra hour of authors at the trailing edge.
+    """
+    if not keys:
+        return {}
+    return hll.estimate_many(_query(conn, f"sketches:{scope}", *_sketch_sql(scope, keys, cutoff)))
+
+
+ROLLUP_BUCKET_SECONDS = 3600
+# rollup_authors only has to cover hours new rows can still land in
+ROLLUP_AUTHOR_RETENTION_HOURS = 8 * 24
+
+# weight= mode → column prefix in ticker_rollups / stage_rollup
+WEIGHT_MODES = {"none": "", "upvotes": "u", "authors": "a"}
+_ROLLUP_SUM_COLUMNS = [f"{p}{c}" for p in WEIGHT_MODES.values() for c in ("w", "ws", "wss", "ww")]
+# Aggregates over stage_rollup-shaped rows (s, w, uw, aw), in _ROLLUP_SUM_COLUMNS order
+_ROLLUP_SUMS_SQL = ", ".join(
+    f"SUM({p}w), SUM({p}w * s), SUM({p}w * s * s), SUM({p}w * {p}w)" for p in WEIGHT_MODES.values())
+
+
+def _fill_stage_rollup(conn, table, where="1", params=()):
+    """Load the rows of `table` (main.mentions or stage_mentions) matching
+    `where` into stage_rollup with their per-mode weights.
+
+    Authors mode counts only the first mention (lowest rowid) per author per
+    (hour, ticker, source); rollup_authors remembers who was already counted,
+    so incremental folds stay correct.
+    """
+    b = ROLLUP_BUCKET_SECONDS
+    conn.execute("DELETE FROM stage_rollup")
+    conn.execute(f"""
+        INSERT INTO stage_rollup (bucket, ticker, source, author, s, upvotes, timestamp, first, w, uw, aw)
+        SELECT bucket, ticker, source, author, s, upvotes, timestamp, first, w, uw, CASE WHEN first THEN w ELSE 0 END
+        FROM (
+            SELECT m.timestamp / {b} AS bucket, m.ticker, m.source, m.author, m.sentiment_score AS s, m.upvotes,
+                   m.timestamp, m.weight AS w, m.weight * upvote_weight(m.upvotes) AS uw,
+                   m.rowid IN (SELECT MIN(rowid) FROM {table} WHERE ({where}) AND author IS NOT NULL
+                               GROUP BY timestamp / {b}, ticker, source, author)
+                   AND NOT EXISTS (SELECT 1 FROM main.rollup_authors ra
+                                   WHERE ra.bucket = m.timestamp / {b} AND ra.ticker = m.ticker
+                                     AND ra.source = m.source AND ra.author = m.author) AS first
+            FROM {table} m WHERE {where}
         )
-        conn.commit()
-        return conn.total_changes
+    """, tuple(params) * 2)
+
+
+def _fold_stage_rollup(conn):
+    """Add stage_rollup into ticker_rollups. Caller holds the write transaction."""
+    conn.execute("INSERT OR IGNORE INTO main.rollup_authors (bucket, ticker, source, author) "
+                 "SELECT bucket, ticker, source, author FROM stage_rollup WHERE first")
+    updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in _ROLLUP_SUM_COLUMNS)
+    conn.execute(f"""
+        INSERT INTO main.ticker_rollups (bucket, ticker, source, n, max_upvotes, latest,
+                                         {", ".join(_ROLLUP_SUM_COLUMNS)})
+        SELECT bucket, ticker, source, COUNT(*), MAX(upvotes), MAX(timestamp), {_ROLLUP_SUMS_SQL}
+        FROM stage_rollup WHERE true
+        GROUP BY bucket, ticker, source
+        ON CONFLICT (bucket, ticker, source) DO UPDATE SET
+            n = n + excluded.n,
+            max_upvotes = MAX(max_upvotes, excluded.max_upvotes),
+            latest = MAX(latest, excluded.latest),
+            {updates}
+    """)
+
+
+def _update_rollups(conn, where, params=()):
+    """Fold the mentions rows matching `where` into ticker_rollups. Caller holds
+    the write transaction and must not pass rows that were already folded in."""
+    _fill_stage_rollup(conn, "main.mentions", where, params)
+    _fold_stage_rollup(conn)
+
+
+def _rebuild_rollup_range(conn, lo, hi):
+    """Recompute ticker_rollups for timestamps in [lo, hi] from raw rows (whole hours)."""
+    b = ROLLUP_BUCKET_SECONDS
+    conn.execute("DELETE FROM main.ticker_rollups WHERE bucket BETWEEN ? AND ?", (lo // b, hi // b))
+    conn.execute("DELETE FROM main.rollup_authors WHERE bucket BETWEEN ? AND ?", (lo // b, hi // b))
+    _update_rollups(conn, "timestamp >= ? AND timestamp < ?", ((lo // b) * b, (hi // b + 1) * b))
+
+
+def _prune_rollup_authors(conn):
+    """Forget counted authors for hours new rows no longer arrive in (replay rebuilds its hours from scratch)."""
+    horizon = int(time.time()) // ROLLUP_BUCKET_SECONDS - ROLLUP_AUTHOR_RETENTION_HOURS
+    conn.execute("DELETE FROM main.rollup_authors WHERE bucket < ?", (horizon,))
+
+
+def rebuild_ticker_rollups(conn=None):
+    """Recompute ticker_rollups from the raw mentions table, a day at a time."""
+    own = conn is None
+    conn = conn or get_conn()
+    try:
+        print("[db] Building ticker rollups from raw rows...")
+        _create_stage_tables(conn)
+        lo, hi = conn.execute("SELECT MIN(timestamp), MAX(timestamp) FROM mentions").fetchone()
+        with conn:
+            conn.execute("DELETE FROM ticker_rollups")
+            conn.execute("DELETE FROM rollup_authors")
+            if lo is not None:
+                for start in range(lo - lo % 86400, hi + 1, 86400):
+                    _rebuild_rollup_range(conn, start, min(start + 86400 - 1, hi))
+        count = conn.execute("SELECT COUNT(*) FROM ticker_rollups").fetchone()[0]
+        print(f"[db] Built {count} ticker rollups")
+    finally:
+        if own:
+            conn.close()
+
+
+def _fill_stage_comentions(conn, rows, where="1", params=()):
+    """Load the co-mention pairs of a batch of rows into stage_comentions,
+    grouped per (ticker, hour, other), in both directions.
+
+    rows:
+      "staged"  stage_mentions before _merge_chunk: new rows pair with each
+                other and with their posts' existing rows in main.mentions
+      "merged"  stage_mentions after _merge_chunk (main already holds them)
+      "main"    main.mentions rows matching `where`, paired within their posts
+    Each pair is emitted once per direction, the reverse in the other row's
+    hour (a post's rows normally share one timestamp).
+    """
+    b = ROLLUP_BUCKET_SECONDS
+    select = f"""
+        SELECT a.ticker AS x, a.timestamp / {b} AS bx, o.ticker AS y, o.timestamp / {b} AS "by",
+               MIN(a.weight, o.weight) AS w, {{both}} AS both
+        FROM {{a}} a JOIN {{o}} o ON o.post_id = a.post_id AND o.ticker != a.ticker
+    """
+    if rows == "staged":
+        pairs = (select.format(a="stage_mentions", o="stage_mentions", both="1") + " UNION ALL "
+                 + select.format(a="stage_mentions", o="main.mentions", both="0"))
+    elif rows == "merged":
+        both = "EXISTS (SELECT 1 FROM stage_mentions s WHERE s.ticker = o.ticker AND s.post_id = o.post_id)"
+        pairs = select.format(a="stage_mentions", o="main.mentions", both=both)
+    else:
+        pairs = select.format(a="main.mentions", o="main.mentions", both="1") + f" WHERE {where}"
+    conn.execute("DELETE FROM stage_comentions")
+    conn.execute(f"""
+        WITH pairs AS ({pairs})
+        INSERT INTO stage_comentions (ticker, bucket, other, n, w)
+        SELECT x, bx, y, COUNT(*), SUM(w) FROM (
+            SELECT x, bx, y, w FROM pairs
+            UNION ALL
+            SELECT y, "by", x, w FROM pairs WHERE NOT both
+        ) GROUP BY x, bx, y
+    """, params)
+
+
+def _fold_stage_comentions(conn, sign=1):
+    """Add (sign=1) or subtract (sign=-1) stage_comentions into comentions.
+    Caller holds the write transaction."""
+    if sign > 0:
+        conn.execute("""
+            INSERT INTO main.comentions (ticker, bucket, other, n, w)
+            SELECT ticker, bucket, other, n, w FROM stage_comentions WHERE true
+            ON CONFLICT (ticker, bucket, other) DO UPDATE SET n = n + excluded.n, w = w + excluded.w
+        """)
+    else:
+        conn.execute("""
+            UPDATE main.comentions SET n = comentions.n - p.n, w = comentions.w - p.w
+            FROM stage_comentions AS p
+            WHERE comentions.ticker = p.ticker AND comentions.bucket = p.bucket AND comentions.other = p.other
+        """)
+        conn.execute("DELETE FROM main.comentions WHERE n <= 0")
+
+
+def rebuild_comentions(conn=None):
+    """Recompute comentions from the raw mentions table, a day at a time."""
+    own = conn is None
+    conn = conn or get_conn()
+    try:
+        print("[db] Building co-mention index from raw rows...")
+        _create_stage_tables(conn)
+        lo, hi = conn.execute("SELECT MIN(timestamp), MAX(timestamp) FROM mentions").fetchone()
+        with conn:
+            conn.execute("DELETE FROM comentions")
+            if lo is not None:
+                for start in range(lo - lo % 86400, hi + 1, 86400):
+                    _fill_stage_comentions(conn, "main", "a.timestamp >= ? AND a.timestamp < ?",
+                                           (start, start + 86400))
+                    _fold_stage_comentions(conn)
+        count = conn.execute("SELECT COUNT(*) FROM comentions").fetchone()[0]
+        print(f"[db] Built {count} co-mention rows")
+    finally:
+        if own:
+            conn.close()
+
+
+def write_rows(mention_rows=(), option_rows=(), replace_post_ids=None, chunk_size=None):
+    """Bulk-write mentions and options rows in chunked transactions.
+
+    Each chunk is first staged into temp tables and de-duplicated against the
+    main tables without holding the write lock; the lock is only taken for one
+    INSERT ... SELECT per table plus the author-sketch, ticker-rollup and
+    co-mention updates. With `replace_post_ids`, existing rows for
+    those posts are deleted in the first transaction (replay backfill).
+
+    mention_rows / option_rows: iterables of tuples in MENTION_COLUMNS /
+    OPTION_COLUMNS order. Returns exact counts:
+    {mentions_inserted, mentions_duplicates, options_inserted, options_duplicates,
+    transactions, lock_seconds}.
+    """
+    chunk_size = chunk_size or WRITE_CHUNK_SIZE
+    mention_iter, option_iter = iter(mention_rows), iter(option_rows)
+    stats = {"mentions_inserted": 0, "mentions_duplicates": 0,
+             "options_inserted": 0, "options_duplicates": 0, "transactions": 0, "lock_seconds": 0.0}
+
+    conn = get_conn()
+    conn.isolation_level = None  # explicit BEGIN/COMMIT below
+    try:
+        with metrics.timed("wsb_db_query_seconds", query="write_rows"):
+            _create_stage_tables(conn)
+            _prune_rollup_authors(conn)
+            replace_pending = replace_post_ids is not None
+            while True:
+                mention_chunk = list(islice(mention_iter, chunk_size))
+                option_chunk = list(islice(option_iter, chunk_size))
+                if not mention_chunk and not option_chunk and not replace_pending:
+                    break
+                if not replace_pending:
+                    # data_version only moves when another connection commits; if it
+                    # hasn't by the time we hold the lock, the staged prefilter and
+                    # rollup below are still exact
+                    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+                    _stage_chunk(conn, mention_chunk, option_chunk)
+                    _fill_stage_rollup(conn, "stage_mentions")
+                    _fill_stage_comentions(conn, "staged")
+                sketches = _build_sketches(mention_chunk)
+
+                locked_at = time.perf_counter()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    rebuild_range = None
+                    replaced = replace_pending
+                    if replace_pending:
+                        # Delete first, then stage against the post-delete state
+                        conn.execute("DELETE FROM stage_post_ids")
+                        conn.executemany("INSERT OR IGNORE INTO stage_post_ids VALUES (?)",
+                                         ((p,) for p in replace_post_ids))
+                        # Rollups can't subtract authors-mode firsts, so the hours
+                        # touched by the replaced posts are rebuilt below instead
+                        timestamps = [ts for ts in conn.execute(
+                            "SELECT MIN(timestamp), MAX(timestamp) FROM main.mentions "
+                            "WHERE post_id IN (SELECT post_id FROM stage_post_ids)").fetchone() if ts is not None]
+                        timestamps += [row[3] for row in mention_chunk]
+                        if timestamps:
+                            rebuild_range = (min(timestamps), max(timestamps))
+                        _fill_stage_comentions(conn, "main", "a.post_id IN (SELECT post_id FROM stage_post_ids)")
+                        _fold_stage_comentions(conn, sign=-1)
+                        conn.execute("DELETE FROM main.mentions WHERE post_id IN (SELECT post_id FROM stage_post_ids)")
+                        conn.execute("DELETE FROM main.options_flow WHERE post_id IN (SELECT post_id FROM stage_post_ids)")
+                        _stage_chunk(conn, mention_chunk, option_chunk)
+                        _fill_stage_comentions(conn, "staged")
+                        replace_pending = False
+                    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM main.mentions").fetchone()[0]
+                    mentions, options = _merge_chunk(conn)
+                    _apply_sketches(conn, sketches)
+                    if rebuild_range:
+                        _rebuild_rollup_range(conn, *rebuild_range)
+                    elif conn.execute("PRAGMA data_version").fetchone()[0] == data_version:
+                        _fold_stage_rollup(conn)
+                    elif mentions:
+                        # Another writer got in between staging and the lock
+                        _update_rollups(conn, "id > ?", (last_id,))
+                    if not replaced and conn.execute("PRAGMA data_version").fetchone()[0] != data_version:
+                        # Another writer got in: re-pair only the staged rows that were actually inserted
+                        conn.execute("""
+                            DELETE FROM stage_mentions WHERE NOT EXISTS (
+                                SELECT 1 FROM main.mentions m WHERE m.id > ?
+                                AND m.ticker = stage_mentions.ticker AND m.post_id = stage_mentions.post_id)
+                        """, (last_id,))
+                        _fill_stage_comentions(conn, "merged")
+                    _fold_stage_comentions(conn)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+
+                stats["lock_seconds"] += time.perf_counter() - locked_at
+                stats["transactions"] += 1
+                stats["mentions_inserted"] += mentions
+                stats["mentions_duplicates"] += len(mention_chunk) - mentions
+                stats["options_inserted"] += options
+                stats["options_duplicates"] += len(option_chunk) - options
+        stats["lock_seconds"] = round(stats["lock_seconds"], 4)
+        return stats
     finally:
         conn.close()
 
 
-def get_top_tickers(hours=24, limit=25):
+def insert_mentions_batch(rows):
+    """Insert multiple mentions efficiently. rows = list of tuples matching insert_mention params.
+    Returns the number of new rows."""
+    return store.write_rows(mention_rows=rows)["mentions_inserted"]
+
+
+def insert_options_batch(rows):
+    """Insert options flow. rows = list of tuples:
+    (ticker, strike, option_type, expiry, expiry_category, raw_match, post_id, sentiment_score, timestamp, author, upvotes,
+    weight, source)
+    Returns the number of new rows.
+    """
+    return store.write_rows(option_rows=rows)["options_inserted"]
+
+
+def replace_post_rows(post_ids, mention_rows, option_rows):
+    """Atomically replace all mentions/options rows for the given post ids (replay backfill).
+
+    Returns (mentions_inserted, options_inserted).
+    """
+    stats = store.write_rows(mention_rows, option_rows, replace_post_ids=post_ids, chunk_size=1 << 30)
+    return stats["mentions_inserted"], stats["options_inserted"]
+
+
+def _sentiment_stats(w, ws, wss, ww):
+    """Weighted mean sentiment and its 95% confidence interval from running sums.
+
+    Uses the effective sample size (Σw)²/Σw², so a handful of heavy rows gives
+    a wide interval. The interval is None below two effective samples.
+    """
+    if not w:
+        return None, None, None
+    mean = ws / w
+    n_eff = w * w / ww if ww else 0.0
+    if n_eff <= 1:
+        return round(mean, 4), None, None
+    var = max(wss / w - mean * mean, 0.0) * n_eff / (n_eff - 1)
+    half = 1.96 * math.sqrt(var / n_eff)
+    return round(mean, 4), round(max(mean - half, -1.0), 4), round(min(mean + half, 1.0), 4)
+
+
+def get_top_tickers(hours=24, limit=25, exact=False, weight="none", source=None, conn=None):
+    """Top tickers by weighted mention count (duplicates under WSB_DEDUP=weight
+    count < 1), served from hourly ticker_rollups plus a raw-row scan of the
+    partial hour at the window's start.
+
+    weight picks how avg_sentiment (and its 95% CI) weights mentions: "none"
+    (row weight only), "upvotes" (upvote_weight) or "authors" (first mention
+    per author per hour and source). unique_authors comes from HLL sketches
+    (±~3%) unless exact=True, which falls back to COUNT(DISTINCT author).
+
+    source restricts everything to one subreddit. The sketches aren't kept per
+    source, so unique_authors is then always exact.
+    """
+    p = WEIGHT_MODES[weight]
+    b = ROLLUP_BUCKET_SECONDS
     cutoff = int((datetime.now(timezone.utc) - timedelta(hours=hours)).timestamp())
-    conn = get_conn()
+    cutoff_bucket = cutoff // b
+    source_sql = "AND source = ?" if source else ""
+    source_params = (source,) if source else ()
+    own = conn is None
+    conn = conn or get_conn()
     try:
-        rows = conn.execute("""
+        rows = _query(conn, f"get_top_tickers:{weight}" + (":source" if source else ""), f"""
+            WITH edge AS (
+                SELECT id, ticker, source, author, sentiment_score AS s, upvotes, timestamp,
+                       weight AS w, weight * upvote_weight(upvotes) AS uw
+                FROM mentions
+                WHERE timestamp >= ? AND timestamp < ? {source_sql}
+            ),
+            parts AS (
+                SELECT ticker, n, max_upvotes, latest, w, {p}w AS mw, {p}ws AS mws, {p}wss AS mwss, {p}ww AS mww
+                FROM ticker_rollups
+                WHERE bucket > ? {source_sql}
+                UNION ALL
+                SELECT ticker, COUNT(*), MAX(upvotes), MAX(timestamp), SUM(w),
+                       SUM({p}w), SUM({p}w * s), SUM({p}w * s * s), SUM({p}w * {p}w)
+                FROM (
+                    SELECT *, CASE WHEN id IN (SELECT MIN(id) FROM edge WHERE author IS NOT NULL
+                                               GROUP BY ticker, source, author) THEN w ELSE 0 END AS aw
+                    FROM edge
+                )
+                GROUP BY ticker
+            )
             SELECT
                 ticker,
-                COUNT(*) as mention_count,
-                ROUND(AVG(sentiment_score), 4) as avg_sentiment,
-                COUNT(DISTINCT author) as unique_authors,
-                MAX(upvotes) as top_upvotes,
-                MAX(timestamp) as latest_mention
-            FROM mentions
-            WHERE timestamp >= ?
+                SUM(n) as mention_count,
+                ROUND(SUM(w), 2) as weighted_mentions,
+                SUM(mw) as mw, SUM(mws) as mws, SUM(mwss) as mwss, SUM(mww) as mww,
+                MAX(max_upvotes) as top_upvotes,
+                MAX(latest) as latest_mention
+            FROM parts
             GROUP BY ticker
-            HAVING COUNT(*) > 5
-            ORDER BY mention_count DESC
+            HAVING SUM(n) > 5
+            ORDER BY weighted_mentions DESC, mention_count DESC
             LIMIT ?
-        """, (cutoff, limit)).fetchall()
-        return [dict(r) for r in rows]
+        """, (cutoff, (cutoff_bucket + 1) * b, *source_params, cutoff_bucket, *source_params, limit))
+
+        result = []
+        for r in rows:
+            avg, ci_low, ci_high = _sentiment_stats(r["mw"], r["mws"], r["mwss"], r["mww"])
+            result.append({
+                "ticker": r["ticker"],
+                "mention_count": r["mention_count"],
+                "weighted_mentions": r["weighted_mentions"],
+                "avg_sentiment": avg,
+                "sentiment_ci_low": ci_low,
+                "sentiment_ci_high": ci_high,
+                "top_upvotes": r["top_upvotes"],
+                "latest_mention": r["latest_mention"],
+            })
+
+        keys = [r["ticker"] for r in result]
+        if exact or source:
+            authors = _exact_author_counts(conn, keys, cutoff, source)
+        else:
+            authors = _sketch_counts(conn, "mentions", keys, cutoff)
+        for r in result:
+            # An author can't be counted more often than they mentioned the ticker
+            r["unique_authors"] = min(authors.get(r["ticker"], 0), r["mention_count"])
+        return result
     finally:
-        conn.close()
+        if own:
+            conn.close()
 
 
-def get_ticker_detail(symbol, hours=24):
+def get_ticker_detail(symbol, hours=24, source=None):
     cutoff = int((datetime.now(timezone.utc) - timedelta(hours=hours)).timestamp())
+    source_sql = "AND source = ?" if source else ""
     conn = get_conn()
     try:
-        rows = conn.execute("""
+        rows = _query(conn, "get_ticker_detail", f"""
             SELECT * FROM mentions
-            WHERE ticker = ? AND timestamp >= ?
+            WHERE ticker = ? AND timestamp >= ? {source_sql}
             ORDER BY timestamp DESC
             LIMIT 100
-        """, (symbol.upper(), cutoff)).fetchall()
+        """, (symbol.upper(), cutoff, *((source,) if source else ())))
         return [dict(r) for r in rows]
     finally:
         conn.close()
 
 
-def insert_options_batch(rows):
-    """Insert options flow. rows = list of tuples:
-    (ticker, strike, option_type, expiry, expiry_category, raw_match, post_id, sentiment_score, timestamp, author, upvotes)
+def _jaccard(together, n_a, n_b):
+    union = n_a + n_b - together
+    return round(together / union, 4) if union > 0 else None
+
+
+def _mention_counts(conn, tickers, cutoff_bucket):
+    """Mentions per ticker since `cutoff_bucket` (whole hours), from ticker_rollups."""
+    if not tickers:
+        return {}
+    placeholders = ",".join("?" * len(tickers))
+    return {r["ticker"]: r["n"] for r in _query(
+        conn, "comentions:counts",
+        f"SELECT ticker, SUM(n) AS n FROM ticker_rollups WHERE bucket >= ? AND ticker IN ({placeholders}) "
+        f"GROUP BY ticker", (cutoff_bucket, *tickers))}
+
+
+def get_related_tickers(symbol, hours=24, limit=10):
+    """Tickers most often mentioned in the same post or comment as `symbol`,
+    from the comentions index (window widened to the start of the cutoff's hour).
+
+    together: items mentioning both; weighted: Σ min(weight) over them;
+    jaccard: together / items mentioning either.
     """
+    symbol = symbol.upper()
+    cutoff_bucket = int((datetime.now(timezone.utc) - timedelta(hours=hours)).timestamp()) // ROLLUP_BUCKET_SECONDS
     conn = get_conn()
     try:
-        conn.executemany(
-            """INSERT OR IGNORE INTO options_flow
-               (ticker, strike, option_type, expiry, expiry_category, raw_match,
-                post_id, sentiment_score, timestamp, author, upvotes)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            rows
-        )
-        conn.commit()
-        return conn.total_changes
+        rows = _query(conn, "get_related_tickers", """
+            SELECT other, SUM(n) AS together, ROUND(SUM(w), 2) AS weighted
+            FROM comentions
+            WHERE ticker = ? AND bucket >= ?
+            GROUP BY other
+            ORDER BY weighted DESC, together DESC
+            LIMIT ?
+        """, (symbol, cutoff_bucket, limit))
+        counts = _mention_counts(conn, [symbol] + [r["other"] for r in rows], cutoff_bucket)
+        return [{
+            "ticker": r["other"],
+            "together": r["together"],
+            "weighted": r["weighted"],
+            "jaccard": _jaccard(r["together"], counts.get(symbol, 0), counts.get(r["other"], 0)),
+        } for r in rows]
     finally:
         conn.close()
 
 
-def get_options_flow(hours=24, limit=50):
-    """Get aggregated options flow — grouped by ticker + option_type."""
-    cutoff = int((datetime.now(timezone.utc) - timedelta(hours=hours)).timestamp())
+def get_comention_graph(counts, hours=24, min_together=1):
+    """Co-mention edges among the tickers in `counts` (ticker → mention count
+    over the same window, e.g. from get_top_tickers), each pair once."""
+    tickers = list(counts)
+    if len(tickers) < 2:
+        return []
+    cutoff_bucket = int((datetime.now(timezone.utc) - timedelta(hours=hours)).timestamp()) // ROLLUP_BUCKET_SECONDS
+    placeholders = ",".join("?" * len(tickers))
+    conn = get_conn()
+    try:
+        rows = _query(conn, "get_comention_graph", f"""
+            SELECT ticker, other, SUM(n) AS together, ROUND(SUM(w), 2) AS weighted
+            FROM comentions
+            WHERE ticker IN ({placeholders}) AND bucket >= ? AND other IN ({placeholders}) AND ticker < other
+            GROUP BY ticker, other
+            HAVING SUM(n) >= ?
+            ORDER BY weighted DESC
+        """, (*tickers, cutoff_bucket, *tickers, min_together))
+        return [{
+            "a": r["ticker"],
+            "b": r["other"],
+            "together": r["together"],
+            "weighted": r["weighted"],
+            "jaccard": _jaccard(r["together"], counts[r["ticker"]], counts[r["other"]]),
+        } for r in rows]
+    finally:
+        conn.close()
+
+
+ALERT_COLUMNS = ("id", "ticker", "bucket", "kind", "count", "value", "baseline", "z", "ratio", "created_at")
+_BASELINE_COLUMNS = ("ticker", "bucket", "hours", "mean", "var", "s_hours", "s_mean", "s_var")
+
+
+def get_hour_totals(keys):
+    """Mentions per (bucket, ticker) in `keys`, summed over sources, from
+    ticker_rollups: {(bucket, ticker): (n, w, ws, wss)}. One primary-key probe per key."""
+    keys = list(keys)
+    out = {}
+    conn = get_conn()
+    try:
+        for i in range(0, len(keys), 5000):
+            chunk = keys[i:i + 5000]
+            values = ", ".join(["(?, ?)"] * len(chunk))
+            rows = _query(conn, "alerts:hour_totals", f"""
+                WITH k(bucket, ticker) AS (VALUES {values})
+                SELECT r.bucket, r.ticker, SUM(r.n) AS n, SUM(r.w) AS w, SUM(r.ws) AS ws, SUM(r.wss) AS wss
+                FROM k JOIN ticker_rollups r ON r.bucket = k.bucket AND r.ticker = k.ticker
+                GROUP BY r.bucket, r.ticker
+            """, [v for key in chunk for v in key])
+            out.update({(r["bucket"], r["ticker"]): (r["n"], r["w"], r["ws"], r["wss"]) for r in rows})
+        return out
+    finally:
+        conn.close()
+
+
+def get_first_bucket():
+    """Earliest hour in ticker_rollups, or None."""
+    conn = get_conn()
+    try:
+        return conn.execute("SELECT MIN(bucket) FROM ticker_rollups").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def iter_hour_totals(batch_size=10000):
+    """Every (ticker, bucket, n, w, ws, wss) in ticker_rollups, summed over sources,
+    ordered by ticker then hour. For seeding alert baselines from history."""
+    conn = get_conn()
+    try:
+        cur = conn.execute("""
+            SELECT ticker, bucket, SUM(n), SUM(w), SUM(ws), SUM(wss) FROM ticker_rollups
+            GROUP BY ticker, bucket ORDER BY ticker, bucket
+        """)
+        while rows := cur.fetchmany(batch_size):
+            yield from rows
+    finally:
+        conn.close()
+
+
+def load_alert_baselines():
+    conn = get_conn()
+    try:
+        return [tuple(r) for r in conn.execute(f"SELECT {', '.join(_BASELINE_COLUMNS)} FROM alert_baselines")]
+    finally:
+        conn.close()
+
+
+def save_alert_baselines(rows):
+    """Upsert baseline tuples in _BASELINE_COLUMNS order."""
+    updates = ", ".join(f"{c} = excluded.{c}" for c in _BASELINE_COLUMNS[1:])
+    conn = get_conn()
+    try:
+        with conn:
+            conn.executemany(f"""
+                INSERT INTO alert_baselines ({', '.join(_BASELINE_COLUMNS)})
+                VALUES ({', '.join('?' * len(_BASELINE_COLUMNS))})
+                ON CONFLICT (ticker) DO UPDATE SET {updates}
+            """, rows)
+    finally:
+        conn.close()
+
+
+def insert_alerts(alerts):
+    """Store alert dicts (ALERT_COLUMNS minus id). Alerts already raised for
+    the same (ticker, bucket, kind) are skipped. Returns the new ones with ids."""
+    columns = ALERT_COLUMNS[1:]
+    inserted = []
     conn = get_conn()
     try:
-        rows = conn.execute("""
+        with conn:
+            for alert in alerts:
+                row = conn.execute(f"""
+                    INSERT INTO alerts ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})
+                    ON CONFLICT DO NOTHING RETURNING id
+                """, [alert[c] for c in columns]).fetchone()
+                if row:
+                    inserted.append({"id": row[0], **alert})
+        return inserted
+    finally:
+        conn.close()
+
+
+def get_alerts(since_id=0, hours=24, limit=50, ticker=None, oldest_first=False):
+    """Alerts newer than `since_id` raised in the last `hours`, newest first
+    (oldest first for a consumer catching up from `since_id`)."""
+    cutoff = int(time.time()) - hours * 3600
+    ticker_sql = "AND ticker = ?" if ticker else ""
+    conn = get_conn()
+    try:
+        rows = _query(conn, "get_alerts", f"""
+            SELECT {', '.join(ALERT_COLUMNS)} FROM alerts
+            WHERE id > ? AND created_at >= ? {ticker_sql}
+            ORDER BY id {"ASC" if oldest_first else "DESC"} LIMIT ?
+        """, (since_id, cutoff, *((ticker.upper(),) if ticker else ()), limit))
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def acquire_lease(name, holder, ttl):
+    """Take lease `name` for `holder` for `ttl` seconds unless someone else
+    holds an unexpired one. Returns (generation, None) on success, else
+    (None, the current lease row as a dict)."""
+    now = time.time()
+    conn = get_conn()
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT * FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row["holder"] != holder and row["expires_at"] > now:
+                conn.execute("ROLLBACK")
+                return None, dict(row)
+            generation = (row["generation"] if row else 0) + 1
+            conn.execute("""
+                INSERT INTO leases (name, holder, generation, acquired_at, expires_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, generation = excluded.generation,
+                    acquired_at = excluded.acquired_at, expires_at = excluded.expires_at
+            """, (name, holder, generation, int(now), now + ttl))
+            conn.execute("COMMIT")
+            return generation, None
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def renew_lease(name, holder, generation, ttl):
+    """Extend a lease we still hold. False if it expired and someone else took it."""
+    conn = get_conn()
+    try:
+        with conn:
+            return conn.execute("UPDATE leases SET expires_at = ? WHERE name = ? AND holder = ? AND generation = ?",
+                                (time.time() + ttl, name, holder, generation)).rowcount == 1
+    finally:
+        conn.close()
+
+
+def release_lease(name, holder, generation):
+    """Expire a lease we hold now instead of at its deadline (the row stays for its generation)."""
+    conn = get_conn()
+    try:
+        with conn:
+            conn.execute("UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ? AND generation = ?",
+                         (name, holder, generation))
+    finally:
+        conn.close()
+
+
+def get_lease(name):
+    conn = get_conn()
+    try:
+        row = conn.execute("SELECT * FROM leases WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def get_options_flow(hours=24, limit=50, exact=False, source=None, conn=None):
+    """Get aggregated options flow — grouped by ticker + option_type.
+
+    unique_authors is always exact: this query scans the window's raw rows
+    anyway, and COUNT(DISTINCT) on top of that costs no more than merging
+    sketches did. `exact` is accepted for symmetry with get_top_tickers.
+    """
+    cutoff = int((datetime.now(timezone.utc) - timedelta(hours=hours)).timestamp())
+    source_sql = "AND source = ?" if source else ""
+    own = conn is None
+    conn = conn or get_conn()
+    try:
+        rows = _query(conn, "get_options_flow", f"""
             SELECT
                 ticker,
                 option_type,
                 COUNT(*) as count,
+                ROUND(SUM(weight), 2) as weighted_count,
                 ROUND(AVG(strike), 2) as avg_strike,
                 MIN(strike) as min_strike,
                 MAX(strike) as max_strike,
-                ROUND(AVG(sentiment_score), 4) as avg_sentiment,
+                ROUND(SUM(weight * sentiment_score) / SUM(weight), 4) as avg_sentiment,
+                ROUND(AVG(dte), 1) as avg_dte,
+                ROUND({_AVG_OTM_PCT_SQL}, 2) as avg_otm_pct,
                 COUNT(DISTINCT author) as unique_authors,
                 GROUP_CONCAT(DISTINCT expiry_category) as expiry_categories
             FROM options_flow
-            WHERE timestamp >= ? AND option_type IS NOT NULL
+            WHERE timestamp >= ? AND option_type IS NOT NULL {source_sql}
             GROUP BY ticker, option_type
-            ORDER BY count DESC
+            ORDER BY weighted_count DESC, count DESC
             LIMIT ?
-        """, (cutoff, limit)).fetchall()
+        """, (cutoff, *((source,) if source else ()), limit))
         return [dict(r) for r in rows]
     finally:
-        conn.close()
+        if own:
+            conn.close()
 
 
-def get_options_summary(hours=24):
+def get_options_summary(hours=24, source=None, conn=None):
     """Get high-level options stats."""
     cutoff = int((datetime.now(timezone.utc) - timedelta(hours=hours)).timestamp())
-    conn = get_conn()
+    source_sql = "AND source = ?" if source else ""
+    source_params = (source,) if source else ()
+    own = conn is None
+    conn = conn or get_conn()
     try:
-        total = conn.execute(
-            "SELECT COUNT(*) FROM options_flow WHERE timestamp >= ?", (cutoff,)
-        ).fetchone()[0]
-        calls = conn.execute(
-            "SELECT COUNT(*) FROM options_flow WHERE timestamp >= ? AND option_type='call'", (cutoff,)
-        ).fetchone()[0]
-        puts = conn.execute(
-            "SELECT COUNT(*) FROM options_flow WHERE timestamp >= ? AND option_type='put'", (cutoff,)
-        ).fetchone()[0]
+        total = _query(
+            conn, "get_options_summary:total",
+            "SELECT COUNT(*) FROM options_flow WHERE timestamp >= ? " + source_sql, (cutoff, *source_params)
+        )[0][0]
+        calls = _query(
+            conn, "get_options_summary:calls",
+            "SELECT COUNT(*) FROM options_flow WHERE timestamp >= ? AND option_type='call' " + source_sql,
+            (cutoff, *source_params)
+        )[0][0]
+        puts = _query(
+            conn, "get_options_summary:puts",
+            "SELECT COUNT(*) FROM options_flow WHERE timestamp >= ? AND option_type='put' " + source_sql,
+            (cutoff, *source_params)
+        )[0][0]
 
         # Top bullish/bearish plays
-        top_calls = conn.execute("""
-            SELECT ticker, strike, expiry, expiry_category, raw_match, upvotes
+        top_calls = _query(conn, "get_options_summary:top_calls", f"""
+            SELECT ticker, strike, expiry, expiry_category, raw_match, upvotes, expiry_date, dte, underlying, otm_pct
             FROM options_flow
-            WHERE timestamp >= ? AND option_type='call'
+            WHERE timestamp >= ? AND option_type='call' {source_sql}
             ORDER BY upvotes DESC LIMIT 5
-        """, (cutoff,)).fetchall()
-        top_puts = conn.execute("""
-            SELECT ticker, strike, expiry, expiry_category, raw_match, upvotes
+        """, (cutoff, *source_params))
+        top_puts = _query(conn, "get_options_summary:top_puts", f"""
+            SELECT ticker, strike, expiry, expiry_category, raw_match, upvotes, expiry_date, dte, underlying, otm_pct
             FROM options_flow
-            WHERE timestamp >= ? AND option_type='put'
+            WHERE timestamp >= ? AND option_type='put' {source_sql}
             ORDER BY upvotes DESC LIMIT 5
-        """, (cutoff,)).fetchall()
+        """, (cutoff, *source_params))
 
         return {
             "total_options": total,
@@ -246,20 +1527,187 @@ def get_options_summary(hours=24):
             "top_calls": [dict(r) for r in top_calls],
             "top_puts": [dict(r) for r in top_puts],
         }
+    finally:
+        if own:
+            conn.close()
+
+
+def _bucket_sql(column, buckets):
+    """CASE expression giving `column`'s bucket label (NULL stays NULL)."""
+    whens = " ".join(f"WHEN {column} <= {bound} THEN '{label}'" for bound, label in buckets[:-1])
+    return f"CASE WHEN {column} IS NULL THEN NULL {whens} ELSE '{buckets[-1][1]}' END"
+
+
+def _options_buckets_sql(source_sql):
+    """Option counts and weight sums per (type, DTE bucket, moneyness bucket) since
+    a cutoff; reads only idx_options_buckets unless filtered by source."""
+    return f"""
+        SELECT option_type,
+               {_bucket_sql("dte", DTE_BUCKETS)} AS dte_bucket,
+               {_bucket_sql("otm_pct", MONEYNESS_BUCKETS)} AS moneyness,
+               COUNT(*) AS n, SUM(weight) AS w, SUM(weight * sentiment_score) AS ws
+        FROM options_flow
+        WHERE timestamp >= ? {source_sql}
+        GROUP BY 1, 2, 3
+    """
+
+
+def _fold_option_buckets(rows):
+    """By-DTE and by-moneyness breakdowns, in bucket order with unresolved rows
+    last, from _options_buckets_sql groups."""
+    out = {}
+    for key, name, buckets in (("dte_bucket", "dte", DTE_BUCKETS), ("moneyness", "moneyness", MONEYNESS_BUCKETS)):
+        totals = {label: [0, 0, 0, 0.0, 0.0] for _, label in buckets}  # count, calls, puts, w, ws
+        totals[None] = [0, 0, 0, 0.0, 0.0]
+        for r in rows:
+            t = totals[r[key]]
+            t[0] += r["n"]
+            t[1] += r["n"] if r["option_type"] == "call" else 0
+            t[2] += r["n"] if r["option_type"] == "put" else 0
+            t[3] += r["w"]
+            t[4] += r["ws"]
+        out[name] = [{
+            "bucket": label or "unresolved",
+            "count": n,
+            "calls": calls,
+            "puts": puts,
+            "weighted_count": round(w, 2),
+            "avg_sentiment": round(ws / w, 4) if w else None,
+        } for label, (n, calls, puts, w, ws) in totals.items() if n]
+    return out
+
+
+def get_options_buckets(hours=24, source=None, conn=None):
+    """Options in the window broken down by days to expiry and by moneyness
+    (DTE_BUCKETS, MONEYNESS_BUCKETS): {"dte": [...], "moneyness": [...]}."""
+    cutoff = int((datetime.now(timezone.utc) - timedelta(hours=hours)).timestamp())
+    own = conn is None
+    conn = conn or get_conn()
+    try:
+        rows = _query(conn, "get_options_buckets", _options_buckets_sql("AND source = ?" if source else ""),
+                      (cutoff, *((source,) if source else ())))
+        return _fold_option_buckets(rows)
+    finally:
+        if own:
+            conn.close()
+
+
+EXPORT_TABLES = {
+    "mentions": ("id, " + MENTION_COLUMNS).split(", "),
+    "options_flow": ("id, " + OPTION_COLUMNS).split(", "),
+}
+
+
+def iter_export(table, since, until, tickers=None, source=None, batch_size=10000):
+    """Yield the rows of `table` with since <= timestamp < until, oldest first,
+    as lists of up to batch_size tuples in EXPORT_TABLES[table] column order.
+
+    Rows are read off one cursor with fetchmany(), so memory stays at one batch
+    however wide the range. The connection is usable from any thread (a
+    streaming response may resume the generator on a different worker) but
+    must be consumed by one at a time.
+    """
+    columns = EXPORT_TABLES[table]  # KeyError for anything else: the name goes into the SQL
+    where = ["timestamp >= ?", "timestamp < ?"]
+    params = [since, until]
+    if tickers:
+        where.append(f"ticker IN ({','.join('?' * len(tickers))})")
+        params += [t.upper() for t in tickers]
+    if source:
+        where.append("source = ?")
+        params.append(source)
+    conn = get_conn(check_same_thread=False)
+    conn.row_factory = None  # plain tuples
+    try:
+        cur = conn.execute(
+            f"SELECT {', '.join(columns)} FROM {table} WHERE {' AND '.join(where)} ORDER BY timestamp", params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
     finally:
         conn.close()
 
 
-def get_db_stats():
-    conn = get_conn()
+def get_db_stats(conn=None):
+    own = conn is None
+    conn = conn or get_conn()
     try:
-        total = conn.execute("SELECT COUNT(*) FROM mentions").fetchone()[0]
-        unique_tickers = conn.execute("SELECT COUNT(DISTINCT ticker) FROM mentions").fetchone()[0]
-        latest_row = conn.execute("SELECT MAX(timestamp) FROM mentions").fetchone()[0]
+        total = _query(conn, "get_db_stats:total", "SELECT COUNT(*) FROM mentions")[0][0]
+        unique_tickers = _query(conn, "get_db_stats:tickers", "SELECT COUNT(DISTINCT ticker) FROM mentions")[0][0]
+        latest_row = _query(conn, "get_db_stats:latest", "SELECT MAX(timestamp) FROM mentions")[0][0]
         return {
             "total_mentions": total,
             "unique_tickers": unique_tickers,
             "latest_timestamp": latest_row,
         }
     finally:
-        conn.close()
+        if own:
+            conn.close()
+
+
+def get_dashboard(hours=24, limit=50):
+    """What the dashboard's first view shows (top tickers, options flow,
+    summary and buckets, DB stats) read on one connection in one read
+    transaction, so every part comes from the same snapshot. The readers
+    take that connection through conn= instead of opening their own."""
+    conn = get_conn()
+    try:
+        conn.execute("BEGIN")  # under WAL the first read pins the snapshot for the rest
+        return {
+            "tickers": get_top_tickers(hours=hours, limit=limit, conn=conn),
+            "options": {
+                "summary": get_options_summary(hours=hours, conn=conn),
+                "flow": get_options_flow(hours=hours, conn=conn),
+                "buckets": get_options_buckets(hours=hours, conn=conn),
+            },
+            "stats": get_db_stats(conn=conn),
+        }
+    finally:
+        conn.close()  # nothing was written; closing ends the read transaction
+
+
+class SQLiteStorage:
+    """storage.INTERFACE over this module's functions: the default `store`."""
+
+    name = "sqlite"
+
+    write_rows = staticmethod(write_rows)
+    get_top_tickers = staticmethod(get_top_tickers)
+    get_ticker_detail = staticmethod(get_ticker_detail)
+    get_related_tickers = staticmethod(get_related_tickers)
+    get_comention_graph = staticmethod(get_comention_graph)
+    get_options_flow = staticmethod(get_options_flow)
+    get_options_summary = staticmethod(get_options_summary)
+    get_options_buckets = staticmethod(get_options_buckets)
+    iter_export = staticmethod(iter_export)
+    get_db_stats = staticmethod(get_db_stats)
+    get_dashboard = staticmethod(get_dashboard)
+    get_hour_totals = staticmethod(get_hour_totals)
+    get_first_bucket = staticmethod(get_first_bucket)
+    iter_hour_totals = staticmethod(iter_hour_totals)
+    load_alert_baselines = staticmethod(load_alert_baselines)
+    save_alert_baselines = staticmethod(save_alert_baselines)
+    insert_alerts = staticmethod(insert_alerts)
+    get_alerts = staticmethod(get_alerts)
+    acquire_lease = staticmethod(acquire_lease)
+    renew_lease = staticmethod(renew_lease)
+    release_lease = staticmethod(release_lease)
+    get_lease = staticmethod(get_lease)
+
+    def init_db(self):
+        """Nothing beyond _init_db, which init_db runs for every engine."""
+
+
+def open_store(name=STORAGE):
+    """The engine serving storage.INTERFACE for WSB_STORAGE `name`. Connects lazily."""
+    if name == "sqlite":
+        return SQLiteStorage()
+    import storage  # deferred: it imports this module, and the engines' drivers are optional
+    return storage.open_storage(name)
+
+
+# Mentions, options, alerts and leases are read and written through this
+# (store.get_top_tickers(...)); earnings, prices and thread stats stay on SQLite
+store = open_store()
@@ -0,0 +1,261 @@
+"""Exact and near-duplicate detection for scraped items, ahead of analysis.
+
+Megathreads repeat themselves — "SPY 0DTE 🚀🚀🚀", copy-paste bots, the same
+copypasta under every post. Each copy used to get full ticker/VADER/options
+processing and count as a separate mention. Two checks run against a bounded
+in-memory index that lives for the whole process, so a bot repeating itself
+across scrape runs is still caught:
+
+- exact: blake2b of the normalized text (lowercased, whitespace collapsed,
+  runs of repeated punctuation/emoji squeezed to one)
+- near: MinHash over word 3-shingles (first NEAR_MAX_TOKENS tokens) for
+  texts of at least NEAR_MIN_TOKENS tokens. Candidates come from LSH bands
+  (8 bands × 4 rows), then the signature agreement — an estimate of the
+  shingle Jaccard similarity — must reach NEAR_MIN_SIMILARITY.
+
+The first item seen with a given text is canonical; a later item with a
+different id and the same (or near-same) text is a duplicate. Re-fetching the
+same item id is not a duplicate.
+
+WSB_DEDUP selects what happens to duplicates:
+  skip   — dropped before analysis (default)
+  weight — not analyzed; the canonical item's tickers/sentiment/options are
+           reused and written with weight WSB_DEDUP_WEIGHT
+  off    — no dedup
+"""
+
+import hashlib
+import os
+import re
+from collections import OrderedDict
+
+DEDUP_MODE = os.environ.get("WSB_DEDUP", "skip")
+DUP_WEIGHT = float(os.environ.get("WSB_DEDUP_WEIGHT", "0.1"))
+MAX_ENTRIES = int(os.environ.get("WSB_DEDUP_MAX_ENTRIES", "50000"))
+
+NEAR_MIN_TOKENS = 8
+NEAR_MAX_TOKENS = 64
+NEAR_MIN_SIMILARITY = 0.7
+_SHINGLE = 3
+_BANDS = 8
+_ROWS = 4
+_PERMUTATIONS = _BANDS * _ROWS
+_MAX_TOKEN_CACHE = 200_000
+
+_WS_RE = re.compile(r"\s+")
+_REPEAT_RE = re.compile(r"([^\w\s])\1+")
+
+
+def normalize(text):
+    return _REPEAT_RE.sub(r"\1", " ".join(text.lower().split()))
+
+
+def _hash64(data):
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=8).digest()
+
+
+class _TokenHashes(dict):
+    """token → 64-bit hash; filled on first lookup, so hits stay in C (map(__getitem__))."""
+
+    def __missing__(self, tok):
+        h = self[tok] = int.from_bytes(_hash64(tok), "little")
+        return h
+
+
+_token_hashes = _TokenHashes()
+_params = None
+
+
+def _minhash_params():
+    """Fixed (a, b) multiply-shift coefficients — seeded so signatures are stable across runs."""
+    global _params
+    if _params is None:
+        import numpy as np  # deferred: keeps numpy off the API import path
+        rng = np.random.default_rng(0x5EED)
+        a = rng.integers(1, 2**63, size=_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+        b = rng.integers(0, 2**63, size=_PERMUTATIONS, dtype=np.uint64)
+        _params = (np, a, b)
+    return _params
+
+
+def minhash_batch(token_lists, batch_size=1024):
+    """MinHash signatures of each token list's 3-shingles, as (signature, bands):
+    _PERMUTATIONS little-endian uint32s, and one int key per LSH band (band
+    index folded in, so all bands share one dict). None for lists shorter than
+    NEAR_MIN_TOKENS.
+
+    Lists are hashed a batch at a time in one numpy pass — per-text numpy
+    calls would cost more than the hashing itself.
+    """
+    np, a, b = _minhash_params()
+    if len(_token_hashes) > _MAX_TOKEN_CACHE:
+        _token_hashes.clear()
+    token_hash = _token_hashes.__getitem__
+    band_offsets = np.arange(_BANDS, dtype=np.uint64) * np.uint64(0xD6E8FEB86659FD93)
+    out = [None] * len(token_lists)
+    eligible = [i for i, toks in enumerate(token_lists) if len(toks) >= NEAR_MIN_TOKENS]
+
+    for start in range(0, len(eligible), batch_size):
+        batch = eligible[start:start + batch_size]
+        hashes, lengths = [], []
+        for i in batch:
+            toks = token_lists[i][:NEAR_MAX_TOKENS]
+            hashes.extend(map(token_hash, toks))
+            lengths.append(len(toks))
+        t = np.array(hashes, dtype=np.uint64)
+        lengths = np.array(lengths)
+        ends = np.cumsum(lengths)
+        # Order-sensitive shingle hash at every position; uint64 arithmetic wraps.
+        # Shingles that would straddle two texts are masked out below.
+        shingles = t[:-2] * np.uint64(0x9E3779B97F4A7C15) + t[1:-1] * np.uint64(0xC2B2AE3D27D4EB4F) + t[2:]
+        keep = np.ones(len(t), dtype=bool)
+        keep[ends - 1] = keep[ends - 2] = False
+        shingles = shingles[keep[:-2]]
+        # One row per permutation, so every pass and the reduceat run along contiguous memory
+        perms = a[:, None] * shingles
+        perms += b[:, None]
+        perms >>= np.uint64(32)
+        starts = np.concatenate(([0], np.cumsum(lengths - (_SHINGLE - 1))[:-1]))
+        sigs = np.ascontiguousarray(np.minimum.reduceat(perms, starts, axis=1).T).astype("<u4")
+        # A band's _ROWS uint32s are two uint64s; mix them into one key
+        halves = sigs.view("<u8").reshape(len(batch), _BANDS, 2)
+        bands = (halves[:, :, 0] * np.uint64(0x9E3779B97F4A7C15) + halves[:, :, 1]) ^ band_offsets
+        for i, sig, keys in zip(batch, sigs, bands.tolist()):
+            out[i] = (sig.tobytes(), keys)
+    return out
+
+
+def _similarity(sig_a, sig_b):
+    np, _, _ = _minhash_params()
+    return float(np.mean(np.frombuffer(sig_a, dtype="<u4") == np.frombuffer(sig_b, dtype="<u4")))
+
+
+class Entry:
+    """Index entry for one canonical text. mentions/options hold the canonical
+    item's analysis once it's known, so duplicates can reuse it."""
+
+    __slots__ = ("item_id", "signature", "bands", "mentions", "options")
+
+    def __init__(self, item_id, signature, bands):
+        self.item_id = item_id
+        self.signature = signature
+        self.bands = bands
+        self.mentions = None
+        self.options = None
+
+
+class DedupIndex:
+    """LRU-bounded map of normalized-text digests (plus MinHash LSH bands) to entries."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # digest → Entry, oldest first
+        self._bands = {}  # band key (minhash_batch) → digest of the latest entry with that band
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _near(self, signature, bands):
+        checked = set()
+        best, best_sim = None, NEAR_MIN_SIMILARITY
+        for key in bands:
+            digest = self._bands.get(key)
+            if digest is None or digest in checked:
+                continue
+            checked.add(digest)
+            sim = _similarity(self._entries[digest].signature, signature)
+            if sim >= best_sim:
+                best, best_sim = digest, sim
+        return best
+
+    def _add(self, digest, entry):
+        self._entries[digest] = entry
+        if entry.bands is not None:
+            self._bands.update(dict.fromkeys(entry.bands, digest))
+        if len(self._entries) > self.max_entries:
+            self._trim()
+
+    def _trim(self):
+        while len(self._entries) > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        digest, entry = self._entries.popitem(last=False)
+        if entry.bands is None:
+            return
+        for key in entry.bands:
+            if self._bands.get(key) == digest:
+                del self._bands[key]
+
+    def check(self, item_id, text):
+        """Return (entry, kind). kind is "exact" or "near" when the text duplicates
+        another item's; otherwise None and entry is this item's own entry."""
+        norm = normalize(text)
+        return self._check(item_id, _hash64(norm), minhash_batch([norm.split(" ")])[0])
+
+    def _check(self, item_id, digest, minhash):
+        entry = self._entries.get(digest)
+        if entry is not None:
+            self._entries.move_to_end(digest)
+            return entry, (None if entry.item_id == item_id else "exact")
+
+        signature, bands = minhash or (None, None)
+        if signature is not None:
+            match = self._near(signature, bands)
+            if match is not None and self._entries[match].item_id != item_id:
+                entry = self._entries[match]
+                self._entries.move_to_end(match)
+                # Alias this text to the match so verbatim copies of it hit the exact path
+                self._entries[digest] = entry
+                self._trim()
+                return entry, "near"
+
+        entry = Entry(item_id, signature, bands)
+        self._add(digest, entry)
+        return entry, None
+
+    def check_many(self, items):
+        """check() for a list of items, in order; normalizing and MinHashing in bulk."""
+        norms = [normalize(item_text(item)) for item in items]
+        digests = [_hash64(n) for n in norms]
+        # Exact repeats never reach the near check, so don't MinHash them
+        seen = set(self._entries)
+        tokens = []
+        for norm, digest in zip(norms, digests):
+            tokens.append([] if digest in seen else norm.split(" "))
+            seen.add(digest)
+        signatures = minhash_batch(tokens)
+        return [self._check(item["id"], digest, sig)
+                for item, digest, sig in zip(items, digests, signatures)]
+
+
+def item_text(item):
+    return f"{item['title']} {item.get('selftext', '')}"
+
+
+def partition(items, index):
+    """Split items into (unique, duplicates, canonical).
+
+    unique: items to analyze. duplicates: [(item, canonical Entry, kind)].
+    canonical: item id → Entry for the unique items, for remembering their
+    analysis afterwards.
+    """
+    unique, duplicates, canonical = [], [], {}
+    for item, (entry, kind) in zip(items, index.check_many(items)):
+        if kind is None:
+            unique.append(item)
+            canonical[item["id"]] = entry
+        else:
+            duplicates.append((item, entry, kind))
+    return unique, duplicates, canonical
+
+
+_index = None
+
+
+def get_index():
+    """The process-wide index shared by every scrape run."""
+    global _index
+    if _index is None:
+        _index = DedupIndex()
+    return _index
@@ -7,10 +7,14 @@ Entertainment only — not financial advice.
 
 import statistics
 import json
+import mmap
 import os
+import struct
+import time
 import yfinance as yf
 import pandas as pd
 from datetime import datetime, timedelta
+from db import get_price_coverage, get_price_history, append_price_history
 
 # Tickers that don't have earnings — roast them WSB style
 _ROASTS = {
@@ -47,19 +51,122 @@ _ROASTS = {
 
 # Pre-fetched earnings dates cache (built locally, committed to repo)
 _PREFETCH_PATH = os.path.join(os.path.dirname(__file__), "data", "earnings_prefetch.json")
+# Served from a sorted, mmap'd index of that file rather than a dict per worker
+_PREFETCH_BIN_PATH = os.path.join(os.path.dirname(__file__), "data", "earnings_prefetch.bin")
+# How often a process re-stats the JSON to pick up a rebuild made by another worker
+_PREFETCH_RECHECK = 60
+
+# Artifact layout: header, `count` sorted index records, then the JSON blobs they point into
+_PREFETCH_MAGIC = b"WSBE"
+_PREFETCH_HEADER = struct.Struct("<4sBBIQ")  # magic, version, key width, count, source JSON mtime_ns
+_PREFETCH_RECORD = struct.Struct("<QI")  # blob offset, length (follows the NUL-padded key)
+
+
+class _Prefetch:
+    """Read-only symbol → prefetched result map backed by a memory-mapped file.
+
+    Pages are shared between every worker mapping the same file; a lookup
+    binary-searches the index and parses only that symbol's JSON.
+    """
+
+    def __init__(self, mm=None, width=0, count=0, source_mtime=0):
+        self._mm = mm
+        self._width = width
+        self._count = count
+        self._stride = width + _PREFETCH_RECORD.size
+        self.source_mtime = source_mtime
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, width, count, source_mtime = _PREFETCH_HEADER.unpack_from(mm, 0)
+        if magic != _PREFETCH_MAGIC or version != 1:
+            mm.close()
+            raise ValueError(f"{path} is not a valid prefetch artifact")
+        return cls(mm, width, count, source_mtime)
+
+    def _key(self, i):
+        off = _PREFETCH_HEADER.size + i * self._stride
+        return self._mm[off:off + self._width]
+
+    def get(self, symbol):
+        key = symbol.encode("ascii", "ignore")
+        if not self._count or len(key) > self._width:
+            return None
+        key = key.ljust(self._width, b"\0")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self._count or self._key(lo) != key:
+            return None
+        offset, length = _PREFETCH_RECORD.unpack_from(self._mm, _PREFETCH_HEADER.size + lo * self._stride + self._width)
+        return json.loads(self._mm[offset:offset + length])
+
+    def __contains__(self, symbol):
+        return self.get(symbol) is not None
+
+    def __len__(self):
+        return self._count
+
+
+def _build_prefetch_artifact(source_mtime):
+    """Index _PREFETCH_PATH into _PREFETCH_BIN_PATH (write-to-temp + rename, so
+    workers that already mapped the old file keep a valid view)."""
+    entries = sorted((sym.upper().encode("ascii", "ignore"), json.dumps(value, separators=(",", ":")).encode())
+                     for sym, value in _read_prefetch_json().items())
+    width = max((len(k) for k, _ in entries), default=1)
+    offset = _PREFETCH_HEADER.size + len(entries) * (width + _PREFETCH_RECORD.size)
+    tmp = f"{_PREFETCH_BIN_PATH}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(_PREFETCH_HEADER.pack(_PREFETCH_MAGIC, 1, width, len(entries), source_mtime))
+        for key, blob in entries:
+            f.write(key.ljust(width, b"\0") + _PREFETCH_RECORD.pack(offset, len(blob)))
+            offset += len(blob)
+        for _, blob in entries:
+            f.write(blob)
+    os.replace(tmp, _PREFETCH_BIN_PATH)
+
+
+def _read_prefetch_json():
+    if not os.path.exists(_PREFETCH_PATH):
+        return {}
+    with open(_PREFETCH_PATH, "r") as f:
+        return json.load(f)
+
+
 _prefetch_cache = None
+_prefetch_checked = 0.0
 
 
 def _load_prefetch():
-    """Load pre-fetched earnings dates from JSON file."""
-    global _prefetch_cache
-    if _prefetch_cache is not None:
+    """The prefetch map, (re)indexing the JSON when it's newer than the artifact."""
+    global _prefetch_cache, _prefetch_checked
+    now = time.time()
+    if _prefetch_cache is not None and now - _prefetch_checked < _PREFETCH_RECHECK:
         return _prefetch_cache
-    if os.path.exists(_PREFETCH_PATH):
-        with open(_PREFETCH_PATH, "r") as f:
-            _prefetch_cache = json.load(f)
-    else:
-        _prefetch_cache = {}
+    _prefetch_checked = now
+    try:
+        source_mtime = os.stat(_PREFETCH_PATH).st_mtime_ns
+    except OSError:
+        source_mtime = 0
+    if _prefetch_cache is not None and _prefetch_cache.source_mtime == source_mtime:
+        return _prefetch_cache
+    if not source_mtime:
+        _prefetch_cache = _Prefetch()
+        return _prefetch_cache
+    try:
+        cached = _Prefetch.open(_PREFETCH_BIN_PATH)
+    except (OSError, ValueError, struct.error):
+        cached = None
+    if cached is None or cached.source_mtime != source_mtime:
+        _build_prefetch_artifact(source_mtime)
+        cached = _Prefetch.open(_PREFETCH_BIN_PATH)
+    _prefetch_cache = cached
     return _prefetch_cache
 
 
@@ -70,7 +177,7 @@ def prefetch_earnings(symbols):
     The cache file gets committed to the repo and deployed to Render.
     On Render, the API just serves this JSON directly — zero Yahoo calls needed.
     """
-    cache = _load_prefetch()
+    cache = _read_prefetch_json()
     for sym in symbols:
         sym = sym.upper()
         print(f"[prefetch] {sym}...", end=" ", flush=True)
@@ -101,9 +208,9 @@ def _get_earnings_dates_robust(ticker, symbol):
     results = []
 
     # Strategy 0: Pre-fetched cache (built locally, works everywhere)
-    prefetch = _load_prefetch()
-    if symbol.upper() in prefetch:
-        for entry in prefetch[symbol.upper()]:
+    prefetched = _load_prefetch().get(symbol.upper())
+    if prefetched is not None:
+        for entry in prefetched:
             d = datetime.strptime(entry["date"], "%Y-%m-%d")
             if d > datetime.now():
                 continue
@@ -174,12 +281,10 @@ def fetch_earnings_data(symbol):
         return {"error": roast}
 
     # Check prefetch for full pre-computed result first
-    prefetch = _load_prefetch()
-    if symbol.upper() in prefetch:
-        cached = prefetch[symbol.upper()]
-        # If it's a full result (has 'moon_pct'), serve it directly
-        if "moon_pct" in cached:
-            return cached
+    cached = _load_prefetch().get(symbol.upper())
+    # If it's a full result (has 'moon_pct'), serve it directly
+    if cached is not None and "moon_pct" in cached:
+        return cached
 
     try:
         ticker = yf.Ticker(symbol.upper())
@@ -189,13 +294,9 @@ def fetch_earnings_data(symbol):
         if not earnings_list:
             return {"error": f"No earnings data available for {symbol.upper()}"}
 
-        # Get 5 years of daily price data
-        try:
-            hist = ticker.history(period="5y")
-        except Exception as e:
-            return {"error": f"Could not fetch price history for {symbol.upper()}: {e}"}
-
-        if hist is None or hist.empty:
+        # 5 years of daily closes from the local store, topped up from Yahoo
+        hist = _price_history(ticker, symbol.upper())
+        if hist is None:
             return {"error": f"No price history available for {symbol.upper()}"}
 
         # Process each earnings event
@@ -289,6 +390,58 @@ def fetch_earnings_data(symbol):
         return {"error": f"Failed to fetch data for {symbol.upper()}: {str(e)}"}
 
 
+PRICE_HISTORY_YEARS = 5
+
+
+def _ohlc_rows(hist):
+    """(date, open, high, low, close, volume) tuples from a yfinance history frame."""
+    if hist is None or hist.empty:
+        return []
+    frame = hist.reindex(columns=["Open", "High", "Low", "Close", "Volume"]).dropna(subset=["Close"])
+    dates = frame.index.strftime("%Y-%m-%d")
+    frame = frame.astype(float).astype(object).where(frame.notna(), None)
+    return [(d, o, h, lo, c, None if v is None else int(v))
+            for d, (o, h, lo, c, v) in zip(dates, frame.itertuples(index=False))]
+
+
+def refresh_price_history(symbol, today, ticker=None, yahoo_symbol=None):
+    """Top up `symbol`'s bars in the price_history table, at most once per calendar day.
+
+    The first refresh downloads PRICE_HISTORY_YEARS of bars; later ones only
+    ask Yahoo for bars since the last stored date (re-fetching that one, as it
+    may have been stored intraday). A failed download is logged and leaves
+    the stored bars as they are. The options enrichment stage uses it too.
+    """
+    checked_on, last_date = get_price_coverage(symbol)
+    if checked_on == today.isoformat():
+        return
+    try:
+        ticker = ticker or yf.Ticker(yahoo_symbol or symbol)
+        if last_date is None:
+            fresh = ticker.history(period=f"{PRICE_HISTORY_YEARS}y")
+        else:
+            fresh = ticker.history(start=last_date)
+        append_price_history(symbol, _ohlc_rows(fresh), today.isoformat())
+    except Exception as e:
+        print(f"[earnings] Price refresh failed for {symbol} ({e}); using stored bars")
+
+
+def _price_history(ticker, symbol, today=None):
+    """Daily closes for `symbol` from the price_history table after
+    refresh_price_history(). Returns a DataFrame with a Close column on a
+    tz-naive date index, or None when nothing is stored.
+    """
+    today = today or datetime.now().date()
+    refresh_price_history(symbol, today, ticker=ticker)
+
+    since = (today - timedelta(days=round(365.25 * PRICE_HISTORY_YEARS))).isoformat()
+    rows = get_price_history(symbol, since=since)
+    if not rows:
+        return None
+    return pd.DataFrame({"Close": [r["close"] for r in rows]},
+                        index=pd.DatetimeIndex([r["date"] for r in rows]))
+
+
 def _safe_float(val):
     """Safely convert a value to float, returning None on failure."""
     if val is None:
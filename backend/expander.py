@@ -0,0 +1,216 @@
+"""Budget-driven comment fetching.
+
+Instead of a fixed number of comments per thread, every comment request the
+run is allowed (WSB_COMMENT_BUDGET) goes wherever the most new ticker mentions
+per request are expected:
+
+- A thread's first page is worth (new comments since the last run) × (its
+  ticker density). New comments come from Reddit's num_comments against the
+  count we saw last time (thread_stats); density is the share of its comments
+  that pass tickers.may_mention_ticker (the pipeline's prefilter: the comments
+  that go on to analysis), shrunk towards the global average.
+- Each first page and /api/morechildren response reveals `more` stubs
+  (collapsed children). Their ids are expanded in batches of up to 100, worth
+  (ids in the batch, capped by the new comments still unaccounted for) × the
+  density observed so far this run. Ids the budget doesn't reach are kept in
+  thread_stats.pending_more, with the count of new comments still behind them
+  (a collapsed id can stand for a whole subtree) in pending_count, and expanded
+  by a later run without refetching the thread's first page.
+- With several sources enabled (sources.py) they all draw on the same budget;
+  every value is scaled by the thread's source priority.
+
+Requests are taken greedily from a priority queue by expected value. Values are
+re-checked when popped, because a thread's density moves as its comments
+arrive.
+"""
+
+import heapq
+import os
+import time
+
+import metrics
+import scraper
+from sources import DEFAULT_SOURCE, enabled_sources
+from tickers import may_mention_ticker
+
+COMMENT_REQUEST_BUDGET = int(os.environ.get("WSB_COMMENT_BUDGET", "60"))
+MORECHILDREN_BATCH = 100
+FIRST_PAGE_MAX = 500
+# Collapsed ids carried over per thread. Ids past it are lost for good (only a first
+# page shows them again), so it only guards against pathological threads (~80 KB)
+PENDING_MORE_MAX = 10_000
+DEFAULT_DENSITY = 0.3
+# A thread's prior density counts as this many comments' worth of evidence
+_PRIOR_WEIGHT = 20
+
+metrics.describe("wsb_comment_requests_total", "Comment requests made by the expander, by kind")
+metrics.describe("wsb_comment_request_yield", "Comments passing the ticker prefilter per expander request")
+
+
+class _Thread:
+    __slots__ = ("post", "source", "priority", "new_comments", "expected_new", "prior_density", "fetched", "hits",
+                 "requests", "pending")
+
+    def __init__(self, post, history, global_density, priority=1.0):
+        self.post = post
+        self.source = post.get("source", DEFAULT_SOURCE)
+        self.priority = priority
+        num_comments = post.get("num_comments", 0)
+        if history:
+            self.new_comments = max(num_comments - history["num_comments"], 0)
+            seen, hits = history["comments_seen"], history["ticker_hits"]
+            # Collapsed ids an earlier run's budget didn't reach, still new to us
+            backlog = [i for i in (history.get("pending_more") or "").split(",") if i]
+            backlog_count = max(history.get("pending_count") or 0, len(backlog))
+        else:
+            self.new_comments = num_comments
+            seen = hits = 0
+            backlog = []
+            backlog_count = 0
+        self.expected_new = self.new_comments + backlog_count
+        self.prior_density = (hits + global_density * _PRIOR_WEIGHT) / (seen + _PRIOR_WEIGHT)
+        self.fetched = 0
+        self.hits = 0
+        self.requests = 0
+        self.pending = backlog  # collapsed comment ids, in the order Reddit listed them
+
+    def density(self):
+        return (self.hits + self.prior_density * _PRIOR_WEIGHT) / (self.fetched + _PRIOR_WEIGHT)
+
+    def remaining_new(self):
+        return max(self.expected_new - self.fetched, 0)
+
+    def page_value(self):
+        return min(self.new_comments, FIRST_PAGE_MAX) * self.prior_density * self.priority
+
+    def batch_value(self):
+        return min(len(self.pending), MORECHILDREN_BATCH, self.remaining_new()) * self.density() * self.priority
+
+
+def _record(thread, comments, more):
+    thread.requests += 1
+    thread.fetched += len(comments)
+    # The prefilter, not extract_tickers: analysis extracts once, later, for the comments kept
+    hits = sum(1 for c in comments if may_mention_ticker(c["title"]))
+    thread.hits += hits
+    ids = [i for stub in more for i in stub.get("children") or ()]
+    if ids:
+        # A first page can list collapsed ids already carried over as backlog
+        thread.pending = list(dict.fromkeys(thread.pending + ids))
+    metrics.observe("wsb_comment_request_yield", hits)
+
+
+def _fetch_first_page(thread):
+    post_id = thread.post["id"]
+    limit = min(FIRST_PAGE_MAX, max(25, thread.new_comments))
+    data = scraper._fetch_json(
+        f"{scraper.source_url(thread.source)}/comments/{post_id}.json?limit={limit}&sort=new&raw_json=1", kind="comments")
+    metrics.inc("wsb_comment_requests_total", kind="page")
+    if not data or not isinstance(data, list) or len(data) < 2:
+        thread.requests += 1
+        return []
+    more = []
+    children = data[1].get("data", {}).get("children", [])
+    comments = list(scraper.iter_comments(children, post_id, max_depth=None, more=more, source=thread.source))
+    _record(thread, comments, more)
+    return comments
+
+
+def _fetch_next_batch(thread):
+    ids, thread.pending = thread.pending[:MORECHILDREN_BATCH], thread.pending[MORECHILDREN_BATCH:]
+    result = scraper.fetch_more_children(thread.post["id"], ids, source=thread.source)
+    metrics.inc("wsb_comment_requests_total", kind="more")
+    if result is None:
+        thread.requests += 1
+        return []
+    comments, more = result
+    _record(thread, comments, more)
+    return comments
+
+
+def expand_comments(posts, budget=None, history=None, sources=None):
+    """Fetch comments for `posts` within a request budget.
+
+    history: thread_stats rows by post id (db.get_thread_stats()).
+    sources: the enabled Sources, for their priorities (default: enabled_sources()).
+    Returns (comments, thread_rows, summary). thread_rows are ready for
+    db.update_thread_stats().
+    """
+    budget = COMMENT_REQUEST_BUDGET if budget is None else budget
+    history = history or {}
+    seen = sum(h["comments_seen"] for h in history.values())
+    global_density = (sum(h["ticker_hits"] for h in history.values()) / seen) if seen else DEFAULT_DENSITY
+
+    priorities = {s.name: s.priority for s in sources or enabled_sources()}
+    threads = [_Thread(p, history.get(p["id"]), global_density, priorities.get(p.get("source", DEFAULT_SOURCE), 1.0))
+               for p in posts]
+    # (-value, tiebreak, kind, thread) — heapq is a min-heap
+    queue = [(-t.page_value(), i, "page", t) for i, t in enumerate(threads) if t.page_value() > 0]
+    queue += [(-t.batch_value(), len(threads) + i, "more", t) for i, t in enumerate(threads) if t.batch_value() > 0]
+    heapq.heapify(queue)
+    tiebreak = 2 * len(threads)
+
+    comments = []
+    seen_ids = set()
+    used = 0
+    while queue and used < budget:
+        neg_value, _, kind, thread = heapq.heappop(queue)
+        if kind == "more":
+            # Density may have moved since this entry was queued
+            value = thread.batch_value()
+            if value <= 0:
+                continue
+            if queue and value < -queue[0][0]:
+                tiebreak += 1
+                heapq.heappush(queue, (-value, tiebreak, kind, thread))
+                continue
+            batch = _fetch_next_batch(thread)
+        else:
+            batch = _fetch_first_page(thread)
+        used += 1
+        for c in batch:
+            if c["id"] not in seen_ids:
+                seen_ids.add(c["id"])
+                comments.append(c)
+        if thread.pending and thread.batch_value() > 0:
+            tiebreak += 1
+            heapq.heappush(queue, (-thread.batch_value(), tiebreak, "more", thread))
+        scraper._throttle()
+
+    now = int(time.time())
+    thread_rows = []
+    for t in threads:
+        if not t.requests:
+            continue
+        # What the budget left of the new comments, for the next run to expand
+        pending = t.pending[:min(t.remaining_new(), PENDING_MORE_MAX)]
+        thread_rows.append({
+            "post_id": t.post["id"],
+            "num_comments": t.post.get("num_comments", 0),
+            "fetched_at": now,
+            "comments_seen": t.fetched,
+            "ticker_hits": t.hits,
+            "requests": t.requests,
+            "pending_more": ",".join(pending),
+            "pending_count": t.remaining_new() if pending else 0,
+        })
+    hits = sum(t.hits for t in threads)
+    by_source = {}
+    for t in threads:
+        if t.requests:
+            s = by_source.setdefault(t.source, {"requests": 0, "comments": 0, "ticker_comments": 0})
+            s["requests"] += t.requests
+            s["comments"] += t.fetched
+            s["ticker_comments"] += t.hits
+    summary = {
+        "budget": budget,
+        "requests": used,
+        "threads": len(thread_rows),
+        "comments": len(comments),
+        "ticker_comments": hits,
+        "ticker_comments_per_request": round(hits / used, 2) if used else None,
+        "sources": by_source,
+    }
+    print(f"[expander] {used}/{budget} requests over {len(thread_rows)} threads — "
+          f"{len(comments)} comments, {hits} ticker-like")
+    return comments, thread_rows, summary
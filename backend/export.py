@@ -0,0 +1,111 @@
+"""Bulk export of mentions / options_flow for analytics consumers.
+
+Rows come off db.iter_export() one batch at a time and each batch is encoded
+and handed to the response as soon as it's ready, so a month of data streams
+in bounded memory instead of being built up as one JSON list.
+
+Formats:
+  ndjson   one JSON object per line (stdlib only)
+  arrow    Arrow IPC stream, one record batch per db batch
+  parquet  Parquet, one row group per db batch
+
+arrow and parquet need pyarrow, which is optional: `pip install pyarrow`.
+"""
+
+import importlib.util
+import json
+
+import metrics
+from db import EXPORT_TABLES, store
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Arrow type per column name (shared by both tables)
+_ARROW_TYPES = {
+    "id": "int64", "ticker": "string", "post_id": "string", "sentiment_score": "float64",
+    "timestamp": "int64", "source_type": "string", "title": "string", "author": "string",
+    "upvotes": "int64", "weight": "float64", "source": "string", "strike": "float64",
+    "option_type": "string", "expiry": "string", "expiry_category": "string", "raw_match": "string",
+    "expiry_date": "string", "dte": "int64", "underlying": "float64", "otm_pct": "float64",
+}
+
+metrics.describe("wsb_export_rows_total", "Rows streamed by /api/export, by table and format")
+
+
+def have_pyarrow():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+class _Sink:
+    """Write-only file object that collects what pyarrow writes until drained."""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        out = b"".join(self._parts)
+        self._parts = []
+        return out
+
+
+def _ndjson(columns, batches):
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for rows in batches:
+        yield "".join(encode(dict(zip(columns, row))) + "\n" for row in rows).encode()
+
+
+def _pyarrow(fmt, columns, batches):
+    import pyarrow as pa  # deferred: optional and heavy
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.type_for_alias(_ARROW_TYPES[name])) for name in columns])
+    sink = _Sink()
+    writer = pa.ipc.new_stream(sink, schema) if fmt == "arrow" else pq.ParquetWriter(sink, schema)
+    try:
+        for rows in batches:
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            batch = pa.record_batch(arrays, schema=schema)
+            if fmt == "arrow":
+                writer.write_batch(batch)
+            else:
+                writer.write_table(pa.Table.from_batches([batch]))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_export(table, fmt, since, until, tickers=None, source=None, batch_size=10000):
+    """Encoded chunks (bytes) of `table` rows in `fmt`; see db.iter_export for the filters."""
+    columns = EXPORT_TABLES[table]
+    batches = _counted(store.iter_export(table, since, until, tickers, source, batch_size), table, fmt)
+    if fmt == "ndjson":
+        return _ndjson(columns, batches)
+    return _pyarrow(fmt, columns, batches)
+
+
+def _counted(batches, table, fmt):
+    for rows in batches:
+        metrics.inc("wsb_export_rows_total", len(rows), table=table, format=fmt)
+        yield rows
@@ -0,0 +1,108 @@
+"""One scraper at a time across API workers and hosts sharing the database.
+
+`uvicorn api:app --workers N` (or several hosts on one DB file) gives every
+worker its own /api/scrape. A scrape run holds the "scraper" lease, a row in
+the leases table: whoever starts a run while another worker holds it gets
+NotLeader (409 from /api/scrape) instead of a second concurrent scrape. The
+holder renews the lease from a heartbeat thread while it runs and releases it
+when done; a worker that dies mid-run loses it after WSB_LEADER_LEASE_SECONDS.
+
+Every acquisition bumps the lease's generation. A process that takes the
+lease when someone else held it in between runs its on_takeover() hooks, so
+state kept in memory between its own runs (spike detector baselines) is
+reloaded from the DB rather than written back stale. If a renewal fails the
+run is no longer the leader and Lease.check() raises before its next write.
+"""
+
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from db import store
+
+LEASE_SECONDS = float(os.environ.get("WSB_LEADER_LEASE_SECONDS", "60"))
+SCRAPER = "scraper"
+
+_locks = {}  # lease name → in-process lock (a lease row can't tell our own threads apart)
+_locks_lock = threading.Lock()
+_generations = {}  # lease name → generation this process held last
+_takeover_hooks = []
+
+
+def worker_id():
+    """This process as a lease holder (looked up per call: workers may fork after import)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class NotLeader(Exception):
+    def __init__(self, name, holder=None, expires_at=None):
+        self.name = name
+        self.holder = holder
+        self.expires_at = expires_at
+        super().__init__(f"{name} lease is held by {holder}" if holder else f"lost the {name} lease")
+
+
+class Lease:
+    __slots__ = ("name", "generation", "lost", "_stop")
+
+    def __init__(self, name, generation):
+        self.name = name
+        self.generation = generation
+        self.lost = False
+        self._stop = threading.Event()
+
+    def check(self):
+        """Raise NotLeader if the lease was lost (a renewal failed)."""
+        if self.lost:
+            raise NotLeader(self.name)
+
+    def _heartbeat(self):
+        while not self._stop.wait(LEASE_SECONDS / 3):
+            if not store.renew_lease(self.name, worker_id(), self.generation, LEASE_SECONDS):
+                self.lost = True
+                print(f"[leader] Lost the {self.name} lease (generation {self.generation})")
+                return
+
+
+def on_takeover(fn):
+    """Call fn() whenever this process takes a lease someone else held since its last run."""
+    _takeover_hooks.append(fn)
+    return fn
+
+
+@contextmanager
+def lease(name=SCRAPER):
+    """Hold lease `name` for the duration of the block, or raise NotLeader."""
+    with _locks_lock:
+        local = _locks.setdefault(name, threading.Lock())
+    if not local.acquire(blocking=False):
+        raise NotLeader(name, worker_id())
+    try:
+        generation, current = store.acquire_lease(name, worker_id(), LEASE_SECONDS)
+        if generation is None:
+            raise NotLeader(name, current["holder"], current["expires_at"])
+        if _generations.get(name) != generation - 1:
+            for fn in _takeover_hooks:
+                fn()
+        _generations[name] = generation
+        held = Lease(name, generation)
+        heartbeat = threading.Thread(target=held._heartbeat, name=f"{name}-lease", daemon=True)
+        heartbeat.start()
+        try:
+            yield held
+        finally:
+            held._stop.set()
+            heartbeat.join()
+            if not held.lost:
+                store.release_lease(name, worker_id(), generation)
+    finally:
+        local.release()
+
+
+def status(name=SCRAPER):
+    """The lease row plus whether it's live, for /api/status."""
+    row = store.get_lease(name) or {"holder": None, "generation": 0, "expires_at": 0}
+    return {"worker": worker_id(), "holder": row["holder"], "generation": row["generation"],
+            "active": row["expires_at"] > time.time()}
@@ -0,0 +1,205 @@
+"""In-process metrics — counters, gauges, histograms and stage timers.
+
+Everything lives in module-level dicts guarded by one lock, so recording a
+value is a dict lookup and an add. `render_prometheus()` dumps the lot in
+Prometheus text exposition format for the /api/metrics endpoint.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds — covers a fast regex pass up to a slow Reddit fetch
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> float
+_gauges = {}      # (name, labels) -> float
+_histograms = {}  # (name, labels) -> {"buckets": tuple, "counts": list, "sum": float, "count": int}
+_help = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def describe(name, text):
+    """Attach a HELP line to a metric name."""
+    _help[name] = text
+
+
+def inc(name, value=1, **labels):
+    """Increment a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to an absolute value."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Record one observation into a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = {"buckets": tuple(buckets), "counts": [0] * (len(buckets) + 1), "sum": 0.0, "count": 0}
+            _histograms[key] = h
+        h["counts"][bisect.bisect_left(h["buckets"], value)] += 1
+        h["sum"] += value
+        h["count"] += 1
+
+
+@contextmanager
+def timed(name, **labels):
+    """Observe the wall time of a block into histogram `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def get_counter(name, **labels):
+    """Current value of a counter (0 if never incremented)."""
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def histogram_snapshot(name, **labels):
+    """Copy of a histogram's state, for computing per-run deltas."""
+    with _lock:
+        h = _histograms.get(_key(name, labels))
+        if h is None:
+            return {"buckets": DEFAULT_BUCKETS, "counts": [0] * (len(DEFAULT_BUCKETS) + 1), "sum": 0.0, "count": 0}
+        return {"buckets": h["buckets"], "counts": list(h["counts"]), "sum": h["sum"], "count": h["count"]}
+
+
+def histogram_delta(before, after):
+    """Observations recorded between two snapshots of the same histogram."""
+    return {
+        "buckets": after["buckets"],
+        "counts": [a - b for a, b in zip(after["counts"], before["counts"])],
+        "sum": after["sum"] - before["sum"],
+        "count": after["count"] - before["count"],
+    }
+
+
+def quantile(snapshot, q):
+    """Estimate a quantile from histogram buckets (upper bound of the matching bucket)."""
+    total = snapshot["count"]
+    if total == 0:
+        return None
+    target = q * total
+    running = 0
+    for bound, count in zip(snapshot["buckets"], snapshot["counts"]):
+        running += count
+        if running >= target:
+            return bound
+    return snapshot["buckets"][-1]
+
+
+def _fmt_labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def _fmt_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render_prometheus():
+    """Render all metrics in Prometheus text exposition format (v0.0.4)."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: dict(v, counts=list(v["counts"])) for k, v in _histograms.items()}
+
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name in seen:
+            return
+        seen.add(name)
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, "counter")
+        lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+    for (name, labels), value in sorted(gauges.items()):
+        header(name, "gauge")
+        lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+    for (name, labels), h in sorted(histograms.items()):
+        header(name, "histogram")
+        running = 0
+        for bound, count in zip(h["buckets"], h["counts"]):
+            running += count
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', _fmt_value(float(bound)))])} {running}")
+        lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {h['count']}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(h['sum'])}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Accumulates wall and CPU time per named pipeline stage.
+
+    Usage:
+        timer = StageTimer()
+        with timer.stage("scrape_posts"):
+            ...
+        timer.report()  # {"scrape_posts": {"wall_seconds": ..., "cpu_seconds": ...}}
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall0, time.process_time() - cpu0)
+
+    def add(self, name, wall, cpu=None, items=None):
+        s = self.stages.setdefault(name, {"wall_seconds": 0.0})
+        s["wall_seconds"] += wall
+        if cpu is not None:
+            s["cpu_seconds"] = s.get("cpu_seconds", 0.0) + cpu
+        if items is not None:
+            s["items"] = s.get("items", 0) + items
+
+    def report(self):
+        out = {}
+        for name, s in self.stages.items():
+            entry = {"wall_seconds": round(s["wall_seconds"], 4)}
+            if "cpu_seconds" in s:
+                entry["cpu_seconds"] = round(s["cpu_seconds"], 4)
+            if "items" in s:
+                entry["items"] = s["items"]
+                entry["items_per_sec"] = round(s["items"] / s["wall_seconds"], 1) if s["wall_seconds"] > 0 else None
+            out[name] = entry
+        return out
+
+    def publish(self, prefix="wsb_pipeline"):
+        """Copy the last run's stage timings into gauges."""
+        for name, s in self.report().items():
+            set_gauge(f"{prefix}_stage_seconds", s["wall_seconds"], stage=name, kind="wall")
+            if "cpu_seconds" in s:
+                set_gauge(f"{prefix}_stage_seconds", s["cpu_seconds"], stage=name, kind="cpu")
+            if s.get("items_per_sec") is not None:
+                set_gauge(f"{prefix}_items_per_second", s["items_per_sec"], stage=name)
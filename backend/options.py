@@ -6,11 +6,40 @@ Patterns matched:
   UNH 295 calls friday  → ticker=UNH, strike=295, type=call, expiry=weekly
   AAPL 200p             → ticker=AAPL, strike=200, type=put, expiry=None
   SPX 0DTE              → ticker=SPX, strike=None, type=None, expiry=0DTE
+
+enrich_option_rows() then resolves each row's expiry to a date relative to
+the post (DTE) and, where a daily close for the underlying is stored in
+price_history, how far the strike is out of the money. It never downloads:
+refresh_option_prices() tops up price_history, after a scrape's write and
+before (not during) a replay.
 """
 
+import os
 import re
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import metrics
+from db import get_daily_closes, get_price_checks
 from tickers import load_sec_tickers, BLOCKLIST
 
+# Underlyings per scrape whose price_history gets topped up from Yahoo after
+# the write, most optioned first; the rest use what's stored (0 disables downloads)
+PRICE_REFRESH_LIMIT = int(os.environ.get("WSB_OPTIONS_PRICE_REFRESH", "10"))
+
+# Expiries and closes are US market days
+MARKET_TZ = ZoneInfo("America/New_York")
+_MARKET_CLOSE_HOUR = 16
+# A stored close older than this as of the post (a gap in price_history) isn't used
+_MAX_CLOSE_AGE_DAYS = 10
+# An explicit M/D this far before the post is next year's (a date just past is a closed play)
+_PAST_EXPIRY_DAYS = 31
+# Yahoo symbols for the index tickers _valid_ticker lets through
+_YAHOO_SYMBOLS = {"SPX": "^SPX", "VIX": "^VIX", "NDX": "^NDX", "RUT": "^RUT", "DXY": "DX-Y.NYB"}
+
+metrics.describe("wsb_options_enriched_total", "Option rows enriched, by what could be resolved")
+
 # Expiry keyword → normalized category
 EXPIRY_KEYWORDS = {
     "0dte": "0DTE", "0DTE": "0DTE",
@@ -150,3 +179,144 @@ def _categorize_expiry(date_str, context=""):
             return "weekly"
 
     return None
+
+
+def _next_weekday(day):
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def _third_friday(year, month):
+    first = date(year, month, 1)
+    return first + timedelta(days=(4 - first.weekday()) % 7 + 14)
+
+
+def _monthly_on_or_after(day):
+    year, month = day.year, day.month
+    while _third_friday(year, month) < day:
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return _third_friday(year, month)
+
+
+def resolve_expiry(expiry, expiry_category, posted):
+    """Expiry date of an option mentioned on `posted` (a market-timezone date), or None.
+
+    An explicit M/D[/YY] is taken as written (a month-old M/D means next year);
+    otherwise the category decides: 0DTE the post's trading day, weekly that
+    week's Friday, monthly the next third Friday, LEAPS the first January
+    monthly at least a year out. Market holidays aren't modelled.
+    """
+    m = re.fullmatch(r"(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?", expiry or "")
+    if m:
+        month, day, year = int(m.group(1)), int(m.group(2)), m.group(3)
+        try:
+            if year:
+                return date(int(year) + (2000 if len(year) == 2 else 0), month, day)
+            resolved = date(posted.year, month, day)
+            if (posted - resolved).days > _PAST_EXPIRY_DAYS:
+                resolved = date(posted.year + 1, month, day)
+            return resolved
+        except ValueError:
+            return None  # 2/30 and the like
+
+    trading_day = _next_weekday(posted)
+    if expiry_category == "0DTE":
+        return trading_day
+    if expiry_category == "weekly":
+        return trading_day + timedelta(days=4 - trading_day.weekday())
+    if expiry_category == "monthly":
+        return _monthly_on_or_after(trading_day)
+    if expiry_category == "LEAPS":
+        january = _third_friday(posted.year + 1, 1)
+        if (january - posted).days < 365:
+            january = _third_friday(posted.year + 2, 1)
+        return january
+    return None
+
+
+def otm_pct(option_type, strike, underlying):
+    """How far the strike is out of the money, in % of the underlying (negative: in the money)."""
+    if strike is None or not underlying or option_type not in ("call", "put"):
+        return None
+    pct = (strike / underlying - 1) * 100
+    return round(pct if option_type == "call" else -pct, 2)
+
+
+def _market_time(timestamp):
+    return datetime.fromtimestamp(timestamp, MARKET_TZ)
+
+
+def optioned_tickers(rows):
+    """Tickers of the option rows that name a strike, most optioned first."""
+    counts = {}
+    for row in rows:
+        if row[1] is not None:
+            counts[row[0]] = counts.get(row[0], 0) + 1
+    return sorted(counts, key=counts.get, reverse=True)
+
+
+def refresh_option_prices(symbols, today=None, limit=PRICE_REFRESH_LIMIT):
+    """Top up price_history for the first `limit` of `symbols` (all of them if
+    None) not refreshed today, through the earnings engine's incremental
+    download (5 years on a symbol's first refresh, so a replay finds its
+    closes too). Returns the symbols downloaded.
+
+    This is the only network call here: run it outside the scraper lease,
+    never per replay chunk.
+    """
+    today = today or datetime.now().date()  # the earnings engine's calendar day
+    if not symbols or (limit is not None and limit <= 0):
+        return []
+    checked = get_price_checks(symbols)
+    stale = [s for s in symbols if checked.get(s) != today.isoformat()][:limit]
+    if not stale:
+        return []
+    import earnings  # deferred: pulls in yfinance and pandas
+    for symbol in stale:
+        earnings.refresh_price_history(symbol, today, yahoo_symbol=_YAHOO_SYMBOLS.get(symbol, symbol))
+    return stale
+
+
+def enrich_option_rows(rows):
+    """Option rows (OPTION_COLUMNS up to source) with expiry_date, dte,
+    underlying and otm_pct appended.
+
+    underlying is the last close stored for the ticker as of the post: the
+    previous trading day's, or the same day's for a post after the close.
+    Closes are read for all of the rows' tickers in one query, from what's
+    stored only: refresh_option_prices() does the downloads.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    when = [_market_time(row[8]) for row in rows]
+    tickers = optioned_tickers(rows)
+    first = min(when).date() - timedelta(days=_MAX_CLOSE_AGE_DAYS)
+    closes = {}  # ticker → (dates, closes), oldest first
+    for ticker, day, close in get_daily_closes(tickers, first.isoformat(), max(when).date().isoformat()):
+        dates, values = closes.setdefault(ticker, ([], []))
+        dates.append(day)
+        values.append(close)
+
+    out = []
+    dated = priced = 0
+    for row, at in zip(rows, when):
+        posted = at.date()
+        expiry_date = resolve_expiry(row[3], row[4], posted)
+        dte = (expiry_date - posted).days if expiry_date else None
+        underlying = None
+        series = closes.get(row[0])
+        if series and row[1] is not None:
+            # Last close strictly before the post's day, or on it once the market has closed
+            cutoff = posted + timedelta(days=1) if at.hour >= _MARKET_CLOSE_HOUR else posted
+            i = bisect_left(series[0], cutoff.isoformat()) - 1
+            if i >= 0 and (posted - date.fromisoformat(series[0][i])).days <= _MAX_CLOSE_AGE_DAYS:
+                underlying = series[1][i]
+        dated += dte is not None
+        priced += underlying is not None
+        out.append((*row, expiry_date.isoformat() if expiry_date else None, dte, underlying,
+                    otm_pct(row[2], row[1], underlying)))
+    metrics.inc("wsb_options_enriched_total", dated, resolved="expiry")
+    metrics.inc("wsb_options_enriched_total", priced, resolved="underlying")
+    return out
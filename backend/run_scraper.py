@@ -1,33 +1,91 @@
-"""Pipeline: scrape WSB → extract tickers → score sentiment → extract options → save to DB."""
+"""Pipeline: scrape WSB (+ other sources) → extract tickers → score sentiment → extract options → resolve
+expiries and moneyness → save to DB."""
 
+import argparse
+import os
 import time
-from db import init_db, insert_mentions_batch, insert_options_batch
-from scraper import fetch_posts, fetch_comments
-from tickers import extract_tickers
-from sentiment import score_sentiment
-from options import extract_options
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from collections import deque
+from itertools import islice
+import alerts
+import archive
+import dedup
+import leader
+import metrics
+from db import store, init_db, replace_post_rows, get_thread_stats, update_thread_stats
+from expander import expand_comments
+from scraper import commit_validators, discard_validators, fetch_posts, items_from_payload
+from tickers import extract_tickers, may_mention_ticker
+from sentiment import score_batch
+from sources import DEFAULT_SOURCE
+from options import PRICE_REFRESH_LIMIT, enrich_option_rows, extract_options, optioned_tickers, refresh_option_prices
 
+PROFILE_DIR = os.path.join(os.path.dirname(__file__), "data", "profiles")
 
-def run_pipeline():
-    """Run the full scrape-analyze-store pipeline. Returns stats dict."""
-    start = time.time()
-    init_db()
+metrics.describe("wsb_pipeline_runs_total", "Completed pipeline runs")
+metrics.describe("wsb_pipeline_stage_seconds", "Wall/CPU seconds per stage in the last pipeline run")
+metrics.describe("wsb_pipeline_items_per_second", "Analysis throughput per function in the last pipeline run")
+metrics.describe("wsb_dedup_items_total", "Duplicate items caught before analysis, by match kind")
+metrics.describe("wsb_prefilter_skipped_total", "Items skipped before analysis because they can't mention a ticker")
 
-    # 1. Scrape
-    print("[pipeline] Fetching posts...")
-    posts = fetch_posts()
-    print("[pipeline] Fetching comments...")
-    comments = fetch_comments(posts)
-    all_items = posts + comments
 
-    # 2. Extract tickers + score sentiment → build DB rows
+def _fetch_counters():
+    """The scraper's counters and histograms, to diff after a run (_fetch_stats)."""
+    return {
+        "ok": metrics.get_counter("wsb_reddit_requests_total", status="ok"),
+        "not_modified": metrics.get_counter("wsb_reddit_requests_total", status="not_modified"),
+        "error": metrics.get_counter("wsb_reddit_requests_total", status="error"),
+        "sleep": metrics.get_counter("wsb_reddit_sleep_seconds_total"),
+        "wire": metrics.get_counter("wsb_reddit_bytes_total", stage="wire"),
+        "decoded": metrics.get_counter("wsb_reddit_bytes_total", stage="decoded"),
+        "connections": metrics.get_counter("wsb_reddit_connections_total"),
+        "fetch_hist": metrics.histogram_snapshot("wsb_reddit_fetch_seconds"),
+        "parse_hist": metrics.histogram_snapshot("wsb_reddit_parse_seconds"),
+    }
+
+
+def _fetch_stats(before):
+    """Network/sleep/bytes breakdown for this run from the scraper's metrics."""
+    after = _fetch_counters()
+    delta = {k: after[k] - before[k] for k in after if not k.endswith("_hist")}
+    hist = metrics.histogram_delta(before["fetch_hist"], after["fetch_hist"])
+    parse = metrics.histogram_delta(before["parse_hist"], after["parse_hist"])
+    return {
+        "requests": delta["ok"] + delta["not_modified"] + delta["error"],
+        "not_modified": delta["not_modified"],
+        "errors": delta["error"],
+        "connections": delta["connections"],
+        "wire_bytes": int(delta["wire"]),
+        "decoded_bytes": int(delta["decoded"]),
+        "network_seconds": round(hist["sum"], 3),
+        "parse_seconds": round(parse["sum"], 3),
+        "sleep_seconds": round(delta["sleep"], 3),
+        "latency_p50": metrics.quantile(hist, 0.5),
+        "latency_p95": metrics.quantile(hist, 0.95),
+    }
+
+
+def analyze_items(items):
+    """Extract tickers, sentiment and options from items.
+
+    Returns (mention_rows, option_rows, timings) where timings holds the
+    seconds spent in each analysis function.
+    """
     mention_rows = []
     option_rows = []
+    t_tickers = t_sentiment = t_options = 0.0
+    clock = time.perf_counter
+
+    texts = [f"{item['title']} {item.get('selftext', '')}" for item in items]
+    t0 = clock()
+    sentiments = score_batch(texts)
+    t_sentiment = clock() - t0
 
-    for item in all_items:
-        text = f"{item['title']} {item.get('selftext', '')}"
+    for item, text, sentiment in zip(items, texts, sentiments):
+        t0 = clock()
         tickers = extract_tickers(text)
-        sentiment = score_sentiment(text)
+        t_tickers += clock() - t0
 
         # Ticker mentions
         if tickers:
@@ -41,10 +99,14 @@ def run_pipeline():
                     item["title"][:200],
                     item["author"],
                     item["upvotes"],
+                    1.0,
+                    item.get("source", DEFAULT_SOURCE),
                 ))
 
         # Options extraction (runs on all text, not just ticker-matched)
+        t0 = clock()
         opts = extract_options(text)
+        t_options += clock() - t0
         for opt in opts:
             option_rows.append((
                 opt["ticker"],
@@ -58,26 +120,425 @@ def run_pipeline():
                 item["created_utc"],
                 item["author"],
                 item["upvotes"],
+                1.0,
+                item.get("source", DEFAULT_SOURCE),
             ))
 
-    # 3. Save
-    mentions_inserted = insert_mentions_batch(mention_rows)
-    options_inserted = insert_options_batch(option_rows)
+    timings = {
+        "extract_tickers": t_tickers,
+        "score_sentiment": t_sentiment,
+        "extract_options": t_options,
+    }
+    return mention_rows, option_rows, timings
+
+
+def _prefilter(items):
+    """Items that could yield a mention or option row; the rest (no '$', no
+    uppercase run) would only cost a VADER pass and produce nothing."""
+    kept = [item for item in items if may_mention_ticker(dedup.item_text(item))]
+    metrics.inc("wsb_prefilter_skipped_total", len(items) - len(kept))
+    return kept
+
+
+def _remember_analysis(canonical, mention_rows, option_rows):
+    """Attach each analyzed item's results to its dedup entry so later copies can reuse them."""
+    for entry in canonical.values():
+        entry.mentions = []
+        entry.options = []
+    for row in mention_rows:
+        entry = canonical.get(row[1])
+        if entry is not None:
+            entry.mentions.append((row[0], row[2]))
+    for row in option_rows:
+        entry = canonical.get(row[6])
+        if entry is not None:
+            entry.options.append(row[:6] + (row[7],))
+
+
+def _duplicate_rows(duplicates, weight):
+    """Rows for duplicate items built from their canonical item's analysis.
+
+    Duplicates whose canonical entry was never analyzed (e.g. it was seen
+    under WSB_DEDUP=skip before a mode change) produce no rows.
+    """
+    mention_rows, option_rows = [], []
+    for item, entry, _ in duplicates:
+        if entry.mentions is None:
+            continue
+        source = item.get("source", DEFAULT_SOURCE)
+        for ticker, sentiment in entry.mentions:
+            mention_rows.append((ticker, item["id"], sentiment, item["created_utc"], item["source_type"],
+                                 item["title"][:200], item["author"], item["upvotes"], weight, source))
+        for opt in entry.options:
+            option_rows.append(opt[:6] + (item["id"], opt[6], item["created_utc"],
+                                          item["author"], item["upvotes"], weight, source))
+    return mention_rows, option_rows
+
+
+def _source_stats(posts, comments, mention_rows):
+    """Posts, comments and mentions per source for this run."""
+    out = {}
+
+    def count(source, key):
+        counts = out.setdefault(source, {"posts": 0, "comments": 0, "mentions": 0})
+        counts[key] += 1
+
+    for post in posts:
+        count(post.get("source", DEFAULT_SOURCE), "posts")
+    for comment in comments:
+        count(comment.get("source", DEFAULT_SOURCE), "comments")
+    for row in mention_rows:
+        count(row[-1], "mentions")
+    return out
+
+
+def _dedup_stats(duplicates, analyzed, analyze_seconds, dedup_seconds, mode):
+    """What dedup saved: items and rows kept out of analysis, the CPU that
+    would have cost at this run's per-item analysis rate, and that less the
+    dedup stage's own cost (negative when dedup cost more than it saved)."""
+    by_kind = {"exact": 0, "near": 0}
+    for _, _, kind in duplicates:
+        by_kind[kind] += 1
+    for kind, n in by_kind.items():
+        if n:
+            metrics.inc("wsb_dedup_items_total", n, kind=kind)
+    rows = sum(len(e.mentions) + len(e.options) for _, e, _ in duplicates if e.mentions is not None)
+    per_item = analyze_seconds / analyzed if analyzed else 0.0
+    return {
+        "mode": mode,
+        "exact_duplicates": by_kind["exact"],
+        "near_duplicates": by_kind["near"],
+        # skip: rows never written; weight: rows written at reduced weight
+        "duplicate_rows": rows,
+        "analysis_seconds_saved": round(per_item * len(duplicates), 3),
+        "net_seconds_saved": round(per_item * len(duplicates) - dedup_seconds, 3),
+    }
+
+
+def _run_pipeline(lease, optioned):
+    start = time.time()
+    timer = metrics.StageTimer()
+    counters_before = _fetch_counters()
+    discard_validators()  # anything held by an earlier run that failed before its write
+
+    # 1. Scrape
+    print("[pipeline] Fetching posts...")
+    with timer.stage("fetch_posts"):
+        posts = fetch_posts()
+    print("[pipeline] Fetching comments...")
+    with timer.stage("fetch_comments"):
+        history = get_thread_stats(p["id"] for p in posts)
+        comments, thread_rows, expand_stats = expand_comments(posts, history=history)
+    all_items = posts + comments
+
+    # 2. Skip items with nothing ticker-like, then drop exact/near-duplicates
+    #    before the expensive analysis
+    with timer.stage("prefilter"):
+        candidates = _prefilter(all_items)
+    print(f"[pipeline] Prefilter: {len(all_items) - len(candidates)} of {len(all_items)} items can't mention a ticker")
+    mode = dedup.DEDUP_MODE
+    duplicates, canonical = [], {}
+    items = candidates
+    if mode != "off":
+        with timer.stage("dedup"):
+            items, duplicates, canonical = dedup.partition(candidates, dedup.get_index())
+        print(f"[pipeline] Dedup: {len(duplicates)} of {len(candidates)} items are duplicates ({mode})")
+
+    # 3. Extract tickers + score sentiment → build DB rows
+    with timer.stage("analyze"):
+        mention_rows, option_rows, timings = analyze_items(items)
+    for name, seconds in timings.items():
+        timer.add(name, seconds, items=len(items))
+    if mode != "off":
+        _remember_analysis(canonical, mention_rows, option_rows)
+        if mode == "weight":
+            dup_mentions, dup_options = _duplicate_rows(duplicates, dedup.DUP_WEIGHT)
+            mention_rows += dup_mentions
+            option_rows += dup_options
+    with timer.stage("enrich_options"):
+        option_rows = enrich_option_rows(option_rows)
+    optioned.extend(optioned_tickers(option_rows))
+
+    # 4. Save, unless another worker took over the scraper lease while we were fetching
+    lease.check()
+    with timer.stage("db_write"):
+        written = store.write_rows(mention_rows, option_rows)
+    # Only now may a 304 on these comment URLs, or thread_stats' counts, mean "already stored"
+    commit_validators()
+    update_thread_stats(thread_rows)
+    with timer.stage("alerts"):
+        try:
+            raised = alerts.observe(mention_rows)
+        except Exception as e:
+            # The rows are committed; a detector failure shouldn't fail the scrape
+            print(f"[pipeline] Warning: spike detector update failed ({e})")
+            raised = []
+    mentions_inserted = written["mentions_inserted"]
+    options_inserted = written["options_inserted"]
     elapsed = round(time.time() - start, 1)
 
+    timer.publish()
+    metrics.inc("wsb_pipeline_runs_total")
+
     stats = {
         "posts_fetched": len(posts),
         "comments_fetched": len(comments),
+        "items_prefiltered": len(all_items) - len(candidates),
         "mentions_found": len(mention_rows),
         "mentions_inserted": mentions_inserted,
+        "mentions_duplicates": written["mentions_duplicates"],
         "options_found": len(option_rows),
         "options_inserted": options_inserted,
+        "options_duplicates": written["options_duplicates"],
         "elapsed_seconds": elapsed,
+        "stages": timer.report(),
+        "fetch": _fetch_stats(counters_before),
+        "comment_expansion": expand_stats,
+        "sources": _source_stats(posts, comments, mention_rows),
+        "alerts": raised,
     }
+    if mode != "off":
+        stats["dedup"] = _dedup_stats(duplicates, len(items), sum(timings.values()),
+                                      timer.stages["dedup"]["wall_seconds"], mode)
     print(f"[pipeline] Done in {elapsed}s — {len(mention_rows)} mentions ({mentions_inserted} new), "
           f"{len(option_rows)} options ({options_inserted} new)")
     return stats
 
 
+def _profiled(fn, profiler):
+    """Run fn under cProfile or pyinstrument and dump the result to PROFILE_DIR."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler
+        prof = Profiler()
+        prof.start()
+        try:
+            result = fn()
+        finally:
+            prof.stop()
+            path = os.path.join(PROFILE_DIR, f"pipeline-{stamp}.html")
+            with open(path, "w") as f:
+                f.write(prof.output_html())
+    else:
+        import cProfile
+        prof = cProfile.Profile()
+        try:
+            result = prof.runcall(fn)
+        finally:
+            path = os.path.join(PROFILE_DIR, f"pipeline-{stamp}.prof")
+            prof.dump_stats(path)
+
+    print(f"[pipeline] Profile written to {path}")
+    result["profile_path"] = path
+    return result
+
+
+def run_pipeline(profile=None):
+    """Run the full scrape-analyze-store pipeline. Returns stats dict.
+
+    profile: None, "cprofile" or "pyinstrument" — dump a profile of this run
+    to data/profiles/. Defaults to the WSB_PROFILE env var.
+
+    Holds the scraper lease for the whole run; raises leader.NotLeader if
+    another worker is already scraping (see leader.py). The price_history
+    top-up for the run's optioned underlyings happens once it's released.
+    """
+    profile = profile or os.environ.get("WSB_PROFILE")
+    init_db()  # before the lease: a fresh DB has no leases table yet
+    optioned = []  # filled by _run_pipeline, most optioned first
+    with leader.lease() as held:
+        if profile:
+            stats = _profiled(lambda: _run_pipeline(held, optioned), profile)
+        else:
+            stats = _run_pipeline(held, optioned)
+    stats["price_refresh"] = _refresh_prices(optioned)
+    return stats
+
+
+def _refresh_prices(symbols, limit=PRICE_REFRESH_LIMIT):
+    """Top up closes for the most optioned underlyings, outside the lease:
+    Yahoo's latency shouldn't hold up a scrape, and enrichment only reads
+    what this stores."""
+    start = time.time()
+    try:
+        refreshed = refresh_option_prices(symbols, limit=limit)
+    except Exception as e:
+        print(f"[pipeline] Warning: price top-up failed ({e})")
+        refreshed = []
+    return {"symbols": len(refreshed), "seconds": round(time.time() - start, 2)}
+
+
+def _iter_replay_items(since=None, until=None):
+    """Stream items out of the raw archive, first occurrence of each id wins."""
+    seen_ids = set()
+    for record in archive.iter_archive(since, until):
+        for item in items_from_payload(record["kind"], record["payload"]):
+            if item["id"] in seen_ids:
+                continue
+            seen_ids.add(item["id"])
+            yield item
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _analyze_chunk(items):
+    """Worker entry point for replay — must stay top-level so it pickles."""
+    mention_rows, option_rows, timings = analyze_items(items)
+    return [item["id"] for item in items], mention_rows, option_rows, timings
+
+
+def _analyzed_chunks(chunks, workers):
+    """Yield analyzed chunks in order, keeping at most 2×workers chunks in flight."""
+    if workers <= 1:
+        for chunk in chunks:
+            yield _analyze_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for chunk in chunks:
+            pending.append(pool.submit(_analyze_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def replay_pipeline(since=None, until=None, workers=None, chunk_size=2000, refresh_prices=False):
+    """Re-run analysis over archived raw payloads and rewrite their DB rows.
+
+    No network: items come from data/raw/*.jsonl.gz (see archive.py) and
+    option rows are enriched from the closes already in price_history. Each
+    chunk's mentions/options are replaced in one transaction, so re-scoring
+    after a WSB_LEXICON or BLOCKLIST change overwrites the old rows. Holds the
+    scraper lease like run_pipeline, so it never overlaps a scrape.
+
+    refresh_prices: first top up price_history from Yahoo for every optioned
+    underlying in the range, once, before taking the lease.
+    """
+    init_db()
+    refreshed = None
+    if refresh_prices:
+        refreshed = _refresh_prices(_replay_option_tickers(since, until), limit=None)
+        print(f"[replay] Topped up price history for {refreshed['symbols']} underlyings")
+    with leader.lease():
+        stats = _replay_pipeline(since, until, workers, chunk_size)
+    if refreshed:
+        stats["price_refresh"] = refreshed
+    return stats
+
+
+def _replay_option_tickers(since, until):
+    """Optioned underlyings across the archive range, most optioned first."""
+    rows = []
+    for item in _iter_replay_items(since, until):
+        if not may_mention_ticker(dedup.item_text(item)):
+            continue
+        for option in extract_options(f"{item['title']} {item.get('selftext', '')}"):
+            rows.append((option["ticker"], option["strike"]))
+    return optioned_tickers(rows)
+
+
+def _replay_pipeline(since, until, workers, chunk_size):
+    start = time.time()
+    timer = metrics.StageTimer()
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    mode = dedup.DEDUP_MODE
+
+    items = mentions = options = 0
+    mentions_written = options_written = 0
+    duplicates_total = prefiltered = 0
+    chunks = _chunks(_iter_replay_items(since, until), chunk_size)
+
+    # Dedup runs here in the parent, in archive order, with a fresh index so a
+    # replay's result doesn't depend on what the live process has seen. Chunk
+    # results come back in submission order, so a FIFO pairs them up again.
+    pending = deque()
+
+    def _deduped(chunks):
+        index = dedup.DedupIndex()
+        for chunk in chunks:
+            candidates = _prefilter(chunk)
+            if mode == "off":
+                unique, duplicates, canonical = candidates, [], {}
+            else:
+                unique, duplicates, canonical = dedup.partition(candidates, index)
+            # Every id in the chunk is replaced, so rows from before the prefilter go too
+            pending.append(([item["id"] for item in chunk], len(unique), duplicates, canonical))
+            yield unique
+
+    for _, mention_rows, option_rows, timings in _analyzed_chunks(_deduped(chunks), workers):
+        ids, analyzed, duplicates, canonical = pending.popleft()
+        for name, seconds in timings.items():
+            timer.add(name, seconds, items=analyzed)
+        if mode != "off":
+            _remember_analysis(canonical, mention_rows, option_rows)
+        if mode == "weight":
+            dup_mentions, dup_options = _duplicate_rows(duplicates, dedup.DUP_WEIGHT)
+            mention_rows += dup_mentions
+            option_rows += dup_options
+        duplicates_total += len(duplicates)
+        prefiltered += len(ids) - analyzed - len(duplicates)
+        with timer.stage("enrich_options"):
+            option_rows = enrich_option_rows(option_rows)
+        with timer.stage("db_write"):
+            m, o = replace_post_rows(ids, mention_rows, option_rows)
+        items += len(ids)
+        mentions += len(mention_rows)
+        options += len(option_rows)
+        mentions_written += m
+        options_written += o
+        print(f"[replay] {items} items, {mentions} mentions, {options} options")
+
+    elapsed = round(time.time() - start, 1)
+    stats = {
+        "items_replayed": items,
+        "mentions_found": mentions,
+        "mentions_written": mentions_written,
+        "options_found": options,
+        "options_written": options_written,
+        "duplicates": duplicates_total,
+        "prefiltered": prefiltered,
+        "workers": workers,
+        "elapsed_seconds": elapsed,
+        "items_per_sec": round(items / elapsed, 1) if elapsed > 0 else None,
+        "stages": timer.report(),
+    }
+    print(f"[replay] Done in {elapsed}s — {items} items, {mentions_written} mentions, {options_written} options")
+    return stats
+
+
 if __name__ == "__main__":
-    run_pipeline()
+    parser = argparse.ArgumentParser(description="Run the WSB scrape pipeline once.")
+    parser.add_argument("--profile", choices=["cprofile", "pyinstrument"],
+                        help="dump a profile of this run to data/profiles/")
+    parser.add_argument("--replay", action="store_true",
+                        help="re-analyze archived raw payloads instead of scraping")
+    parser.add_argument("--since", help="replay: first archive day (YYYY-MM-DD)")
+    parser.add_argument("--until", help="replay: last archive day (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, help="replay: analysis processes (default: CPU count)")
+    parser.add_argument("--refresh-prices", action="store_true",
+                        help="replay: download missing closes for the range's optioned underlyings first")
+    parser.add_argument("--warm-earnings", action="store_true",
+                        help="after scraping, fetch earnings for the new leaderboard (see warmer.py)")
+    args = parser.parse_args()
+    try:
+        if args.replay:
+            replay_pipeline(since=args.since, until=args.until, workers=args.workers,
+                            refresh_prices=args.refresh_prices)
+        else:
+            run_pipeline(profile=args.profile)
+    except leader.NotLeader as e:
+        raise SystemExit(f"[pipeline] Not running: {e}")
+    if args.warm_earnings and not args.replay:
+        from warmer import warm_earnings
+        warm_earnings()
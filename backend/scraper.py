@@ -1,38 +1,281 @@
-"""Scrape r/wallstreetbets using Reddit's public JSON endpoints. No API key needed."""
+"""Scrape r/wallstreetbets (and the other subs in sources.py) using Reddit's public JSON endpoints. No API key needed."""
 
+import http.client
+import os
+import threading
 import time
-import urllib.request
 import json
+import zlib
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit
+import archive
+import metrics
+from sources import DEFAULT_SOURCE, enabled_sources
 
 USER_AGENT = "wsb-sentiment-tracker/1.0"
 BASE = "https://www.reddit.com/r/wallstreetbets"
 REQUEST_DELAY = 1.2  # seconds between requests (respect rate limits)
+HTTP_TIMEOUT = 15
+POOL_SIZE = 4  # idle keep-alive connections kept per host
+# URLs whose ETag/Last-Modified are kept for conditional requests; 0 disables
+HTTP_CACHE_ENTRIES = int(os.environ.get("WSB_HTTP_CACHE_ENTRIES", "1024"))
+_MAX_REDIRECTS = 3
 
+# The only fields anything downstream reads (_parse_post, iter_comments, the expander, replay)
+_KEEP_FIELDS = frozenset({
+    "id", "title", "selftext", "author", "score", "created_utc", "num_comments", "subreddit",
+    "body", "replies", "link_id", "children", "count", "name", "parent_id",
+})
 
-def _fetch_json(url):
-    """Fetch JSON from Reddit. Returns parsed dict or None on error."""
-    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+metrics.describe("wsb_reddit_requests_total", "Reddit JSON requests by outcome")
+metrics.describe("wsb_reddit_fetch_seconds", "Reddit request latency (network + JSON decode)")
+metrics.describe("wsb_reddit_parse_seconds", "Time spent decompressing and parsing Reddit responses")
+metrics.describe("wsb_reddit_bytes_total", "Reddit response bytes, as sent (wire) and after decompression (decoded)")
+metrics.describe("wsb_reddit_connections_total", "New HTTP connections opened to Reddit (the rest reuse keep-alive)")
+metrics.describe("wsb_reddit_sleep_seconds_total", "Time spent in REQUEST_DELAY rate-limit sleeps")
+
+
+class _ConnectionPool:
+    """Idle keep-alive connections per (scheme, host), shared by every fetch."""
+
+    __slots__ = ("_idle", "_lock")
+
+    def __init__(self):
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, scheme, host):
+        """(connection, reused) — an idle connection if there is one, else a new one."""
+        with self._lock:
+            idle = self._idle.get((scheme, host))
+            if idle:
+                return idle.pop(), True
+        metrics.inc("wsb_reddit_connections_total")
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(host, timeout=HTTP_TIMEOUT), False
+
+    def put(self, scheme, host, conn):
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host), [])
+            if len(idle) < POOL_SIZE:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def clear(self):
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for conn in conns:
+            conn.close()
+
+
+_pool = _ConnectionPool()
+_validators = OrderedDict()  # url → (etag, last_modified, slimmed payload), least recently used first
+_validators_lock = threading.Lock()
+# Comment/morechildren validators from the current run; they join _validators only
+# once the run's rows are written (commit_validators), since a 304 for them stands
+# for "every comment here is stored"
+_pending_validators = {}
+
+
+def _get(url, headers):
+    """GET over a pooled connection, following redirects. Returns (status, headers, raw body).
+
+    A reused connection the server has meanwhile closed fails on first use;
+    that request is retried once on a fresh connection.
+    """
+    for _ in range(_MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+        while True:
+            conn, reused = _pool.get(parts.scheme, parts.netloc)
+            try:
+                conn.request("GET", target, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            break
+        if resp.will_close:
+            conn.close()
+        else:
+            _pool.put(parts.scheme, parts.netloc, conn)
+        if resp.status in (301, 302, 303, 307, 308) and resp.getheader("Location"):
+            url = urljoin(url, resp.getheader("Location"))
+            continue
+        return resp.status, resp, body
+    raise http.client.HTTPException(f"too many redirects ({url})")
+
+
+def _decompress(body, encoding):
+    if encoding == "gzip":
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        # Servers disagree on whether "deflate" means zlib-wrapped or raw
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+def _slim(data):
+    """Drop, in place, every field of every t3/t1/more `data` dict the pipeline
+    doesn't read, so cached payloads hold what matters and not Reddit's ~100
+    keys per thing."""
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            thing = node.get("data") if "kind" in node else None
+            if isinstance(thing, dict) and node["kind"] in ("t1", "t3", "more"):
+                for key in [k for k in thing if k not in _KEEP_FIELDS]:
+                    del thing[key]
+                replies = thing.get("replies")
+                if replies:
+                    stack.append(replies)
+            else:
+                stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+    return data
+
+
+def _unchanged(kind):
+    """What a 304 stands for when the payload itself wasn't kept: the comments
+    were all seen last time, so there is nothing new to return."""
+    if kind == "comments":
+        return [{"kind": "Listing", "data": {"children": [], "after": None}},
+                {"kind": "Listing", "data": {"children": [], "after": None}}]
+    return {"json": {"errors": [], "data": {"things": []}}}
+
+
+def _cached(url):
+    with _validators_lock:
+        entry = _validators.get(url)
+        if entry is not None:
+            _validators.move_to_end(url)
+        return entry
+
+
+def _remember(url, etag, last_modified, data):
+    with _validators_lock:
+        _validators[url] = (etag, last_modified, data)
+        _validators.move_to_end(url)
+        while len(_validators) > HTTP_CACHE_ENTRIES:
+            _validators.popitem(last=False)
+
+
+def _hold(url, etag, last_modified):
+    with _validators_lock:
+        _pending_validators[url] = (etag, last_modified, None)
+
+
+def commit_validators():
+    """Keep the comment validators held this run: its rows are written, so a
+    304 for those URLs next time may safely stand for "nothing new"."""
+    with _validators_lock:
+        pending = list(_pending_validators.items())
+        _pending_validators.clear()
+    for url, (etag, last_modified, data) in pending:
+        _remember(url, etag, last_modified, data)
+
+
+def discard_validators():
+    """Drop the comment validators held by a run that never wrote its rows."""
+    with _validators_lock:
+        _pending_validators.clear()
+
+
+def _fetch_json(url, kind=None):
+    """Fetch JSON from Reddit. Returns parsed dict or None on error.
+
+    Connections are kept alive and reused, responses are requested gzipped,
+    and URLs fetched before are revalidated with If-None-Match /
+    If-Modified-Since. A 304 isn't downloaded or parsed: listing pages return
+    the (slimmed) page kept from last time, since pagination and the expander
+    need their posts; comment payloads return an empty payload, since every
+    comment in them was already stored. Comment validators are only held until
+    the run that fetched them commits them (commit_validators) after its write.
+
+    kind: "listing", "comments" or "morechildren" — archived for replay when WSB_ARCHIVE_RAW=1.
+    """
+    headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"}
+    cached = _cached(url) if HTTP_CACHE_ENTRIES > 0 else None
+    if cached is not None:
+        etag, last_modified, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    start = time.perf_counter()
     try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return json.loads(resp.read().decode())
+        status, resp, body = _get(url, headers)
+        metrics.inc("wsb_reddit_bytes_total", len(body), stage="wire")
+        if status == 304 and cached is not None:
+            metrics.inc("wsb_reddit_requests_total", status="not_modified")
+            return cached[2] if cached[2] is not None else _unchanged(kind)
+        if status != 200:
+            raise http.client.HTTPException(f"HTTP {status} {resp.reason}")
+        parse_start = time.perf_counter()
+        raw = _decompress(body, (resp.getheader("Content-Encoding") or "").strip().lower())
+        data = json.loads(raw)
+        metrics.observe("wsb_reddit_parse_seconds", time.perf_counter() - parse_start)
+        metrics.inc("wsb_reddit_bytes_total", len(raw), stage="decoded")
+        metrics.inc("wsb_reddit_requests_total", status="ok")
+        etag, last_modified = resp.getheader("ETag"), resp.getheader("Last-Modified")
+        if HTTP_CACHE_ENTRIES > 0 and (etag or last_modified):
+            # Comment payloads are big and their URLs rarely repeat; only listing pages are kept
+            if kind in ("comments", "morechildren"):
+                _hold(url, etag, last_modified)
+            else:
+                _remember(url, etag, last_modified, _slim(data))
+        if kind and archive.ARCHIVE_RAW:
+            archive.archive_payload(kind, url, data)
+        return data
     except Exception as e:
+        metrics.inc("wsb_reddit_requests_total", status="error")
         print(f"[scraper] Error fetching {url}: {e}")
         return None
+    finally:
+        metrics.observe("wsb_reddit_fetch_seconds", time.perf_counter() - start)
+
+
+def _throttle():
+    """Sleep REQUEST_DELAY between requests, tracking the time spent."""
+    time.sleep(REQUEST_DELAY)
+    metrics.inc("wsb_reddit_sleep_seconds_total", REQUEST_DELAY)
+
+
+def _root():
+    return BASE.split("/r/")[0]
+
+
+def source_url(source):
+    """Base URL of one subreddit, e.g. https://www.reddit.com/r/options."""
+    return f"{_root()}/r/{source}"
 
 
 def _paginate_listing(path, limit):
-    """Paginate through a Reddit listing endpoint. Returns list of post dicts."""
+    """Paginate through a Reddit listing endpoint. Returns list of post dicts.
+
+    path: "<subreddits>/<listing>", where subreddits may be a multireddit ("a+b").
+    """
     seen_ids = set()
     posts = []
     after = None
 
     while len(posts) < limit:
         batch = min(100, limit - len(posts))
-        url = f"{BASE}/{path}.json?limit={batch}&raw_json=1"
+        url = f"{_root()}/r/{path}.json?limit={batch}&raw_json=1"
         if after:
             url += f"&after={after}"
 
-        data = _fetch_json(url)
+        data = _fetch_json(url, kind="listing")
         if not data or "data" not in data:
             break
 
@@ -45,110 +288,171 @@ def _paginate_listing(path, limit):
             if post["id"] in seen_ids:
                 continue
             seen_ids.add(post["id"])
-            posts.append({
-                "id": post["id"],
-                "title": post.get("title", ""),
-                "selftext": post.get("selftext", ""),
-                "author": post.get("author", "[deleted]"),
-                "upvotes": post.get("score", 0),
-                "created_utc": int(post.get("created_utc", 0)),
-                "num_comments": post.get("num_comments", 0),
-                "source_type": "post",
-            })
+            posts.append(_parse_post(post))
 
         after = data["data"].get("after")
         if not after:
             break
-        time.sleep(REQUEST_DELAY)
+        _throttle()
 
     return posts
 
 
-def fetch_posts(limit_hot=200, limit_new=200, limit_rising=50):
-    """Fetch hot + new + rising posts from r/wallstreetbets."""
+def _parse_post(post):
+    """Convert a Reddit t3 `data` dict into a pipeline item."""
+    return {
+        "id": post["id"],
+        "title": post.get("title", ""),
+        "selftext": post.get("selftext", ""),
+        "author": post.get("author", "[deleted]"),
+        "upvotes": post.get("score", 0),
+        "created_utc": int(post.get("created_utc", 0)),
+        "num_comments": post.get("num_comments", 0),
+        "source_type": "post",
+        "source": (post.get("subreddit") or DEFAULT_SOURCE).lower(),
+    }
+
+
+def fetch_posts(sources=None):
+    """Fetch every source's listings (default: sources.enabled_sources()).
+
+    Each listing name is paginated once as a multireddit of all the sources
+    that want it, sized to the sum of their limits, so more sources mean
+    fuller pages rather than more requests. Reddit decides the mix between
+    subs; each post is tagged with the subreddit it came from.
+    """
+    sources = sources or enabled_sources()
+    wanted = {}  # listing → [(source, limit)], in the order the sources list them
+    for source in sources:
+        for listing, limit in source.listings.items():
+            wanted.setdefault(listing, []).append((source.name, limit))
+
     seen_ids = set()
     all_posts = []
-
-    for listing, limit in [("hot", limit_hot), ("new", limit_new), ("rising", limit_rising)]:
-        posts = _paginate_listing(listing, limit)
+    for listing, subs in wanted.items():
+        names = "+".join(name for name, _ in subs)
+        posts = _paginate_listing(f"{names}/{listing}", sum(limit for _, limit in subs))
         for p in posts:
             if p["id"] not in seen_ids:
                 seen_ids.add(p["id"])
                 all_posts.append(p)
-        print(f"[scraper] {listing}: {len(posts)} fetched, {len(all_posts)} total unique")
+        print(f"[scraper] {listing} ({names}): {len(posts)} fetched, {len(all_posts)} total unique")
 
     return all_posts
 
 
-def _extract_comments_recursive(children, post_id, max_depth=3, depth=0):
-    """Recursively extract comments from a comment tree."""
-    comments = []
-    for child in children:
-        if child.get("kind") != "t1":
+class Comment:
+    """One comment as a pipeline item.
+
+    Reads like the post dicts (item["title"], item.get("selftext")) so the
+    rest of the pipeline doesn't care, but holds only the fields Reddit gave
+    us — the prefixed id and the 500-char title are built on access.
+    """
+
+    __slots__ = ("post_id", "comment_id", "body", "author", "upvotes", "created_utc", "source")
+    source_type = "comment"
+    selftext = ""
+
+    def __init__(self, post_id, comment_id, body, author, upvotes, created_utc, source=DEFAULT_SOURCE):
+        self.post_id = post_id
+        self.comment_id = comment_id
+        self.body = body
+        self.author = author
+        self.upvotes = upvotes
+        self.created_utc = created_utc
+        self.source = source
+
+    @property
+    def id(self):
+        return f"{self.post_id}_{self.comment_id}"
+
+    @property
+    def title(self):
+        return self.body[:500]
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if isinstance(key, str) else default
+
+    def __repr__(self):
+        return f"Comment({self.id!r}, {self.author!r})"
+
+
+def iter_comments(children, post_id, max_depth=3, more=None, source=DEFAULT_SOURCE):
+    """Walk a comment tree depth-first, yielding a Comment per live comment.
+
+    Same pre-order as the tree reads top to bottom, but with an explicit
+    stack of child iterators instead of recursion, so deep megathread chains
+    neither hit the recursion limit nor build a list per level. max_depth=None
+    follows replies all the way down. If `more` is a list, the data of every
+    `more` stub (collapsed children) is appended to it. Every comment is
+    tagged with `source`, the thread's subreddit.
+    """
+    stack = [(iter(children), 0)]
+    while stack:
+        it, depth = stack[-1]
+        child = next(it, None)
+        if child is None:
+            stack.pop()
+            continue
+        kind = child.get("kind")
+        if kind == "more":
+            if more is not None:
+                more.append(child["data"])
+            continue
+        if kind != "t1":
             continue
         c = child["data"]
         body = c.get("body", "")
         if body and body != "[deleted]" and body != "[removed]":
-            comments.append({
-                "id": f"{post_id}_{c['id']}",
-                "title": body[:500],
-                "selftext": "",
-                "author": c.get("author", "[deleted]"),
-                "upvotes": c.get("score", 0),
-                "created_utc": int(c.get("created_utc", 0)),
-                "source_type": "comment",
-            })
-        # Recurse into replies
-        if depth < max_depth:
+            yield Comment(post_id, c["id"], body, c.get("author", "[deleted]"),
+                          c.get("score", 0), int(c.get("created_utc", 0)), source)
+        if max_depth is None or depth < max_depth:
             replies = c.get("replies")
             if replies and isinstance(replies, dict):
-                reply_children = replies.get("data", {}).get("children", [])
-                comments.extend(
-                    _extract_comments_recursive(reply_children, post_id, max_depth, depth + 1)
-                )
-    return comments
-
-
-def fetch_comments(posts, top_n=50, comments_per_post=50):
-    """Fetch comments from top N posts. Prioritizes discussion threads."""
-    # Prioritize daily/weekly discussion threads — they have the most ticker mentions
-    discussion_posts = [p for p in posts if _is_discussion_thread(p["title"])]
-    other_posts = [p for p in posts if not _is_discussion_thread(p["title"])]
-    other_posts.sort(key=lambda p: p["upvotes"], reverse=True)
-
-    # Take all discussion threads + top N other posts
-    targets = discussion_posts + other_posts[:max(0, top_n - len(discussion_posts))]
-    comments = []
-
-    for i, post_data in enumerate(targets):
-        is_mega = _is_discussion_thread(post_data["title"])
-        # Pull more comments from discussion threads
-        limit = min(comments_per_post * 3, 150) if is_mega else comments_per_post
-        tag = " [MEGATHREAD]" if is_mega else ""
-
-        url = f"{BASE}/comments/{post_data['id']}.json?limit={limit}&sort=new&raw_json=1"
-        data = _fetch_json(url)
-        if not data or not isinstance(data, list) or len(data) < 2:
-            time.sleep(REQUEST_DELAY)
-            continue
-
-        comment_children = data[1].get("data", {}).get("children", [])
-        batch = _extract_comments_recursive(comment_children, post_data["id"])
-        comments.extend(batch)
+                stack.append((iter(replies.get("data", {}).get("children", [])), depth + 1))
 
-        if (i + 1) % 10 == 0 or is_mega:
-            print(f"[scraper] Comments: {len(comments)} total ({i+1}/{len(targets)} posts){tag}")
 
-        time.sleep(REQUEST_DELAY)
+def fetch_more_children(post_id, ids, source=DEFAULT_SOURCE):
+    """Expand up to 100 collapsed comment ids via /api/morechildren.
 
-    print(f"[scraper] Fetched {len(comments)} comments from {len(targets)} posts")
-    return comments
+    Returns (comments, more) — comment items plus the `more` stubs for
+    whatever is still collapsed below them — or None on error.
+    """
+    url = (f"{_root()}/api/morechildren.json?api_type=json&raw_json=1"
+           f"&link_id=t3_{post_id}&children={','.join(ids)}")
+    data = _fetch_json(url, kind="morechildren")
+    if not data or "json" not in data:
+        return None
+    more = []
+    things = data["json"].get("data", {}).get("things", [])
+    return list(iter_comments(things, post_id, max_depth=None, more=more, source=source)), more
 
 
-def _is_discussion_thread(title):
-    """Check if a post is a daily/weekly discussion or earnings thread."""
-    t = title.lower()
-    keywords = ["daily discussion", "weekend discussion", "what are your moves",
-                "earnings thread", "daily thread", "weekly discussion",
-                "megathread", "moves tomorrow"]
-    return any(k in t for k in keywords)
+def items_from_payload(kind, payload):
+    """Turn one archived raw payload back into pipeline items (used by replay)."""
+    if kind == "listing":
+        children = (payload or {}).get("data", {}).get("children", [])
+        return [_parse_post(c["data"]) for c in children if c.get("kind", "t3") == "t3"]
+    if kind == "comments":
+        if not isinstance(payload, list) or len(payload) < 2:
+            return []
+        post_children = payload[0].get("data", {}).get("children", [])
+        if not post_children:
+            return []
+        post = _parse_post(post_children[0]["data"])
+        comment_children = payload[1].get("data", {}).get("children", [])
+        return list(iter_comments(comment_children, post["id"], max_depth=None, source=post["source"]))
+    if kind == "morechildren":
+        things = (payload or {}).get("json", {}).get("data", {}).get("things", [])
+        first = next((t["data"] for t in things if t.get("kind") == "t1"), None)
+        if not first or not first.get("link_id"):
+            return []
+        source = (first.get("subreddit") or DEFAULT_SOURCE).lower()
+        return list(iter_comments(things, first["link_id"].split("_", 1)[-1], max_depth=None, source=source))
+    return []
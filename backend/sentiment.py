@@ -1,4 +1,20 @@
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+"""Sentiment scoring: a compound score in [-1, 1] per text.
+
+Two scorers, picked with WSB_SCORER:
+  vader    VADER's compound score with the WSB lexicon, blended 70/30 with the
+           average emoji score (the default)
+  lexicon  the same lexicons and the main VADER rules (negation, intensifiers,
+           ALL CAPS, "but", ! and ?), with a precompiled tokenizer and
+           array-backed lookups that score a whole batch in a few NumPy passes
+
+Both blend in EMOJI_SCORES the same way. The agreement between them and each
+scorer's items/sec are in the scorers bench suite.
+"""
+
+import os
+import re
+
+SCORER = os.environ.get("WSB_SCORER", "vader")
 
 # Custom WSB lexicon additions (word: sentiment score, -4.0 to +4.0)
 WSB_LEXICON = {
@@ -103,40 +119,239 @@ EMOJI_SCORES = {
 }
 
 _analyzer = None
+_scorer = None
 
 
 def get_analyzer():
+    """VADER analyzer with the WSB lexicon, built on first use (loading the lexicon is slow)."""
     global _analyzer
     if _analyzer is None:
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
         _analyzer = SentimentIntensityAnalyzer()
         # Add WSB lexicon
         _analyzer.lexicon.update(WSB_LEXICON)
     return _analyzer
 
 
-def score_sentiment(text):
-    """Score text sentiment, returning compound score (-1.0 to 1.0).
-    Incorporates VADER + WSB custom lexicon + emoji analysis.
+class Scorer:
+    """Scores texts. Subclasses implement score() or score_batch(); each has a default via the other."""
+
+    name = None
+
+    def score(self, text):
+        return self.score_batch([text])[0]
+
+    def score_batch(self, texts):
+        """Compound scores (floats in [-1, 1]) for a list of texts, in order."""
+        return [self.score(text) for text in texts]
+
+
+class VaderScorer(Scorer):
+    name = "vader"
+
+    def __init__(self):
+        get_analyzer()
+
+    def score(self, text):
+        """Score text sentiment, returning compound score (-1.0 to 1.0).
+        Incorporates VADER + WSB custom lexicon + emoji analysis.
+        """
+        if not text:
+            return 0.0
+
+        compound = _analyzer.polarity_scores(text)["compound"]
+
+        # Add emoji influence
+        emoji_total = 0.0
+        emoji_count = 0
+        for emoji, score in EMOJI_SCORES.items():
+            count = text.count(emoji)
+            if count > 0:
+                emoji_total += score * count
+                emoji_count += count
+
+        if emoji_count > 0:
+            emoji_avg = emoji_total / emoji_count
+            # Blend: 70% VADER, 30% emoji
+            compound = 0.7 * compound + 0.3 * (emoji_avg / 4.0)  # normalize emoji to -1..1
+
+        # Clamp to [-1, 1]
+        return max(-1.0, min(1.0, compound))
+
+
+class LexiconScorer(Scorer):
+    """VADER's lexicon scoring without its per-word Python rules.
+
+    Every token maps to an id; valence, intensifier, negator and emoji score
+    are arrays indexed by id. A batch is tokenized into one flat id array and
+    the rules become shifted-array operations over it. Covered: lexicon valence
+    (emoji valued by VADER's description of them), ALL CAPS emphasis, intensifiers
+    and negators up to three words back (with "never so/this" and "without doubt"),
+    "no" before a lexicon word, "but", and ! / ? emphasis. Not covered: "least",
+    "kind of" and VADER's multi-word idioms.
     """
-    if not text:
-        return 0.0
-
-    analyzer = get_analyzer()
-    compound = analyzer.polarity_scores(text)["compound"]
-
-    # Add emoji influence
-    emoji_total = 0.0
-    emoji_count = 0
-    for emoji, score in EMOJI_SCORES.items():
-        count = text.count(emoji)
-        if count > 0:
-            emoji_total += score * count
-            emoji_count += count
-
-    if emoji_count > 0:
-        emoji_avg = emoji_total / emoji_count
-        # Blend: 70% VADER, 30% emoji
-        compound = 0.7 * compound + 0.3 * (emoji_avg / 4.0)  # normalize emoji to -1..1
-
-    # Clamp to [-1, 1]
-    return max(-1.0, min(1.0, compound))
+
+    name = "lexicon"
+
+    def __init__(self):
+        import numpy as np  # deferred: only this scorer needs it
+        import vaderSentiment.vaderSentiment as vader
+
+        self._np = np
+        folder = os.path.dirname(vader.__file__)
+        lexicon = {}
+        with open(os.path.join(folder, "vader_lexicon.txt"), encoding="utf-8") as f:
+            for line in f:
+                word, measure = line.rstrip("\n").split("\t")[:2]
+                lexicon[word] = float(measure)
+        lexicon.update(WSB_LEXICON)
+        # VADER swaps an emoji for its description; score it as the description's words
+        with open(os.path.join(folder, "emoji_utf8_lexicon.txt"), encoding="utf-8") as f:
+            for line in f:
+                emoji, _, description = line.rstrip("\n").partition("\t")
+                emoji = emoji.replace("\ufe0f", "")
+                if len(emoji) == 1 and emoji not in lexicon:
+                    lexicon[emoji] = sum(lexicon.get(w, 0.0) for w in description.lower().split())
+
+        negators = set(vader.NEGATE) | {"no"}
+        words = sorted(set(lexicon) | set(vader.BOOSTER_DICT) | negators | {"but", "so", "this", "doubt"})
+        self._vocab = {w: i for i, w in enumerate(words, 1)}  # 0: not in the vocabulary
+        size = len(words) + 1
+        self._valence = np.zeros(size)
+        self._booster = np.zeros(size)
+        self._negator = np.zeros(size, dtype=bool)
+        self._in_lexicon = np.zeros(size, dtype=bool)
+        self._emoji = np.zeros(size)
+        for word, i in self._vocab.items():
+            self._valence[i] = lexicon.get(word, 0.0)
+            self._in_lexicon[i] = word in lexicon
+            self._booster[i] = vader.BOOSTER_DICT.get(word, 0.0)
+            self._negator[i] = word in negators
+        for emoji, score in EMOJI_SCORES.items():
+            self._emoji[self._vocab.setdefault(emoji[0], len(self._vocab) + 1)] = score
+        self._but, self._no, self._never, self._without, self._doubt = (
+            self._vocab[w] for w in ("but", "no", "never", "without", "doubt"))
+        self._so_this = [self._vocab["so"], self._vocab["this"]]
+        self._c_incr = vader.C_INCR
+        self._n_scalar = vader.N_SCALAR
+
+        # Emoticons are whole whitespace-separated tokens (the lookahead on their first
+        # characters keeps most words from trying every one); words keep contractions;
+        # any other non-ASCII symbol (emoji) is a token of its own
+        emoticons = sorted((w for w in lexicon if not re.fullmatch(r"[\w']+", w) and len(w) > 1 and w.isascii()),
+                           key=len, reverse=True)
+        first = "".join(sorted({re.escape(e[0]) for e in emoticons}))
+        self._token = re.compile(r"(?<!\S)(?=[" + first + r"])(?:" + "|".join(map(re.escape, emoticons)) + r")(?!\S)"
+                                 r"|[\w']+|[^\w\s\x00-\x7f\ufe0f\u200d]")
+
+    def score_batch(self, texts):
+        np = self._np
+        n = len(texts)
+        if not n:
+            return []
+        get = self._vocab.get
+        findall = self._token.findall
+        ids, caps = [], []
+        lengths = np.zeros(n, dtype=np.intp)
+        cap_diff = np.zeros(n, dtype=bool)
+        punct = np.zeros(n)
+        for d, text in enumerate(texts):
+            if not text:
+                continue
+            tokens = findall(text)
+            ids += [get(t.lower(), 0) for t in tokens]
+            upper = [t.isupper() for t in tokens]
+            caps += upper
+            lengths[d] = len(tokens)
+            cap_diff[d] = any(upper) and not all(upper)
+            bangs, questions = text.count("!"), text.count("?")
+            punct[d] = min(bangs, 4) * 0.292 + (0.0 if questions < 2 else 0.96 if questions > 3 else questions * 0.18)
+
+        ids = np.array(ids, dtype=np.intp)
+        doc = np.repeat(np.arange(n), lengths)
+        pos = np.arange(len(ids))
+        v = self._valence[ids]
+
+        def back(a, k):
+            """a shifted k tokens back within each text (zero/False past its start)."""
+            out = np.zeros_like(a)
+            if k < len(a):
+                out[k:] = np.where(doc[k:] == doc[:-k], a[:-k], 0)
+            return out
+
+        back1, back2, back3 = back(ids, 1), back(ids, 2), back(ids, 3)
+        # "no" right before a lexicon word only negates it; one or two words back it negates
+        following = np.zeros(len(ids), dtype=bool)
+        following[:-1] = (v[1:] != 0) & (doc[1:] == doc[:-1])
+        v[(ids == self._no) & following] = 0.0
+        sentiment = v != 0
+        v = np.where(sentiment & ((back1 == self._no) | (back2 == self._no)), v * self._n_scalar, v)
+        shouted = np.array(caps, dtype=bool) & cap_diff[doc]
+        v += np.where(shouted & sentiment, np.where(v > 0, self._c_incr, -self._c_incr), 0.0)
+
+        # Up to three words back, each not in the lexicon itself: intensifiers (weaker with
+        # distance, stronger in caps), then negators unless one of VADER's idioms applies.
+        # Its third check multiplies anything right after "so"/"this" by 1.25 (operator
+        # precedence in VADER), kept so the two scorers agree.
+        so_this1, so_this2 = np.isin(back1, self._so_this), np.isin(back2, self._so_this)
+        idioms = (
+            (None, None),
+            ((back2 == self._never) & so_this1, (back2 == self._without) & (back1 == self._doubt)),
+            (((back3 == self._never) & so_this2) | so_this1,
+             (back3 == self._without) & ((back2 == self._doubt) | (back1 == self._doubt))),
+        )
+        exists = np.ones(len(ids), dtype=bool)
+        for k, prev, damp in ((1, back1, 1.0), (2, back2, 0.95), (3, back3, 0.9)):
+            step = sentiment & back(exists, k) & ~self._in_lexicon[prev]
+            scalar = self._booster[prev] * damp
+            scalar += np.where((scalar != 0) & back(shouted, k), self._c_incr * damp, 0.0)
+            v += np.where(step, np.where(v < 0, -scalar, scalar), 0.0)
+            factor = np.where(self._negator[prev], self._n_scalar, 1.0)
+            emphasis, doubt = idioms[k - 1]
+            if emphasis is not None:
+                factor = np.where(emphasis, 1.25, np.where(doubt, 1.0, factor))
+            v = np.where(step, v * factor, v)
+
+        # "but": words before the first one count half, words after it 1.5×
+        buts = np.flatnonzero(ids == self._but)
+        if len(buts):
+            first = np.full(n, -1)
+            docs, at = np.unique(doc[buts], return_index=True)
+            first[docs] = buts[at]
+            pivot = first[doc]
+            v *= np.where(pivot < 0, 1.0, np.where(pos < pivot, 0.5, np.where(pos > pivot, 1.5, 1.0)))
+
+        total = np.bincount(doc, weights=v, minlength=n).astype(float)  # int when no tokens at all
+        total += np.sign(total) * punct
+        compound = np.round(total / np.sqrt(total * total + 15), 4)
+
+        emoji = self._emoji[ids]
+        emoji_total = np.bincount(doc, weights=emoji, minlength=n).astype(float)
+        emoji_count = np.bincount(doc, weights=emoji != 0, minlength=n)
+        blended = 0.7 * compound + 0.3 * (emoji_total / np.maximum(emoji_count, 1) / 4.0)
+        compound = np.where(emoji_count > 0, blended, compound)
+        return np.clip(compound, -1.0, 1.0).tolist()
+
+
+SCORERS = {"vader": VaderScorer, "lexicon": LexiconScorer}
+
+
+def get_scorer():
+    """The WSB_SCORER scorer, built on first use."""
+    global _scorer
+    if _scorer is None:
+        try:
+            _scorer = SCORERS[SCORER]()
+        except KeyError:
+            raise ValueError(f"unknown WSB_SCORER {SCORER!r} ({', '.join(SCORERS)})") from None
+    return _scorer
+
+
+def score_sentiment(text):
+    """Compound score (-1.0 to 1.0) of one text with the configured scorer."""
+    return get_scorer().score(text)
+
+
+def score_batch(texts):
+    """score_sentiment() for a list of texts; the lexicon scorer does the whole batch at once."""
+    return get_scorer().score_batch(texts)
@@ -0,0 +1,56 @@
+"""Subreddits the scraper covers.
+
+Each source has its own listing config (which listings, how many posts) and a
+priority. All sources share one scrape run and one request budget:
+
+- Listings are fetched as multireddits (/r/a+b+c/new.json), one pagination
+  per listing name for every source that wants it, so adding a source adds
+  posts to the same pages instead of its own set of requests.
+- The comment expander's budget (WSB_COMMENT_BUDGET) is shared across every
+  source's threads; a thread's expected value is scaled by its source's
+  priority, so low-priority subs only get requests their yield earns.
+
+WSB_SOURCES picks the enabled sources, comma-separated, each optionally with a
+priority override: "wallstreetbets,options:0.5,stocks". Names not in SOURCES
+get DEFAULT_LISTINGS at priority 0.5.
+"""
+
+import os
+
+DEFAULT_SOURCE = "wallstreetbets"
+DEFAULT_LISTINGS = {"hot": 50, "new": 100}
+
+
+class Source:
+    __slots__ = ("name", "listings", "priority")
+
+    def __init__(self, name, listings, priority=1.0):
+        self.name = name
+        self.listings = listings  # listing name → posts wanted
+        self.priority = priority
+
+    def __repr__(self):
+        return f"Source({self.name!r}, priority={self.priority})"
+
+
+SOURCES = {
+    "wallstreetbets": Source("wallstreetbets", {"hot": 200, "new": 200, "rising": 50}, 1.0),
+    "options": Source("options", {"hot": 50, "new": 100}, 0.8),
+    "stocks": Source("stocks", {"hot": 50, "new": 100}, 0.6),
+    "pennystocks": Source("pennystocks", {"hot": 50, "new": 50}, 0.4),
+}
+
+
+def enabled_sources(spec=None):
+    """Sources named in `spec` (default: WSB_SOURCES, else just r/wallstreetbets)."""
+    spec = spec if spec is not None else os.environ.get("WSB_SOURCES", DEFAULT_SOURCE)
+    out = []
+    for part in spec.split(","):
+        name, _, priority = part.strip().partition(":")
+        name = name.lower()
+        if not name or any(s.name == name for s in out):
+            continue
+        base = SOURCES.get(name) or Source(name, DEFAULT_LISTINGS, 0.5)
+        out.append(Source(name, base.listings, float(priority) if priority else base.priority))
+    return out or [SOURCES[DEFAULT_SOURCE]]
+
@@ -0,0 +1,998 @@
+"""Alternative storage engines behind db.py (WSB_STORAGE).
+
+db.py is the SQLite implementation and the default. WSB_STORAGE=duckdb or
+postgres moves the mentions and options_flow tables, spike alerts and leases
+to another engine. db.store is the engine serving INTERFACE (db.open_store):
+db.SQLiteStorage over db.py's own functions, or one of the classes here.
+Callers go through it: store.get_top_tickers(...).
+
+  sqlite    db.py: hourly rollups, author sketches and the co-mention index
+            maintained on write, one local file
+  duckdb    WSB_DUCKDB_PATH (default data/wsb.duckdb). Columnar, for long
+            analytic windows. DuckDB locks its file to one process, so run
+            the API with a single worker
+  postgres  WSB_DATABASE_URL, up to WSB_PG_POOL_SIZE pooled connections per
+            process, for several API workers or hosts on one database
+
+Both keep the same derived tables as SQLite in step on write (ticker_rollups,
+rollup_authors, comentions, author_sketches), so /api/tickers, related tickers,
+the co-mention graph and the alert hour totals read hourly aggregates, not raw
+rows. Writers take turns (an advisory lock on Postgres) so each chunk's fold is
+exact. Earnings, price history and thread stats are caches and scraper hints;
+they stay in the local SQLite file whatever the backend.
+
+duckdb and postgres need their drivers from requirements-optional.txt.
+"""
+
+import abc
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+import db
+import hll
+import metrics
+
+DUCKDB_PATH = os.environ.get("WSB_DUCKDB_PATH") or os.path.join(os.path.dirname(db.DB_PATH), "wsb.duckdb")
+DATABASE_URL = os.environ.get("WSB_DATABASE_URL", "")
+PG_POOL_SIZE = int(os.environ.get("WSB_PG_POOL_SIZE", "10"))
+
+# What a backend implements; the same names and signatures as db.py's SQLite functions
+INTERFACE = (
+    "write_rows", "get_top_tickers", "get_ticker_detail", "get_related_tickers", "get_comention_graph",
+    "get_options_flow", "get_options_summary", "get_options_buckets", "iter_export", "get_db_stats", "get_dashboard",
+    "get_hour_totals", "get_first_bucket", "iter_hour_totals",
+    "load_alert_baselines", "save_alert_baselines", "insert_alerts", "get_alerts",
+    "acquire_lease", "renew_lease", "release_lease", "get_lease",
+)
+
+# Column types for the tables and the stage tables bulk writes go through
+_TYPES = {
+    "id": "BIGINT", "seq": "BIGINT", "ticker": "TEXT", "post_id": "TEXT", "sentiment_score": "DOUBLE PRECISION",
+    "timestamp": "BIGINT", "source_type": "TEXT", "title": "TEXT", "author": "TEXT", "upvotes": "BIGINT",
+    "weight": "DOUBLE PRECISION", "source": "TEXT", "strike": "DOUBLE PRECISION", "option_type": "TEXT",
+    "expiry": "TEXT", "expiry_category": "TEXT", "raw_match": "TEXT",
+    "expiry_date": "TEXT", "dte": "BIGINT", "underlying": "DOUBLE PRECISION", "otm_pct": "DOUBLE PRECISION",
+    "bucket": "BIGINT", "hours": "BIGINT", "mean": "DOUBLE PRECISION", "var": "DOUBLE PRECISION",
+    "s_hours": "BIGINT", "s_mean": "DOUBLE PRECISION", "s_var": "DOUBLE PRECISION",
+    "scope": "TEXT", "key": "TEXT",  # "registers": the engine's BLOB
+}
+_MENTION_COLUMNS = db.MENTION_COLUMNS.split(", ")
+_OPTION_COLUMNS = db.OPTION_COLUMNS.split(", ")
+_BUCKET = db.ROLLUP_BUCKET_SECONDS
+# db.upvote_weight in SQL
+_UPVOTE_WEIGHT = "(1 + ln(1 + CAST(GREATEST(COALESCE(upvotes, 0), 0) AS DOUBLE PRECISION)))"
+# Postgres advisory lock key write_rows holds for its transaction
+_WRITE_LOCK_KEY = 0x77736277
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS mentions (
+        id {id},
+        ticker TEXT NOT NULL,
+        post_id TEXT NOT NULL,
+        sentiment_score DOUBLE PRECISION NOT NULL,
+        timestamp BIGINT NOT NULL,
+        source_type TEXT NOT NULL,
+        title TEXT,
+        author TEXT,
+        upvotes BIGINT DEFAULT 0,
+        weight DOUBLE PRECISION NOT NULL DEFAULT 1.0,
+        source TEXT NOT NULL DEFAULT 'wallstreetbets',
+        UNIQUE(ticker, post_id)
+    );
+    CREATE TABLE IF NOT EXISTS options_flow (
+        id {id},
+        ticker TEXT NOT NULL,
+        strike DOUBLE PRECISION,
+        option_type TEXT,
+        expiry TEXT,
+        expiry_category TEXT,
+        raw_match TEXT,
+        post_id TEXT NOT NULL,
+        sentiment_score DOUBLE PRECISION NOT NULL,
+        timestamp BIGINT NOT NULL,
+        author TEXT,
+        upvotes BIGINT DEFAULT 0,
+        weight DOUBLE PRECISION NOT NULL DEFAULT 1.0,
+        source TEXT NOT NULL DEFAULT 'wallstreetbets',
+        expiry_date TEXT,
+        dte BIGINT,
+        underlying DOUBLE PRECISION,
+        otm_pct DOUBLE PRECISION,
+        UNIQUE(ticker, strike, option_type, post_id)
+    );
+    CREATE TABLE IF NOT EXISTS alert_baselines (
+        ticker TEXT PRIMARY KEY,
+        bucket BIGINT NOT NULL,
+        hours BIGINT NOT NULL,
+        mean DOUBLE PRECISION NOT NULL,
+        var DOUBLE PRECISION NOT NULL,
+        s_hours BIGINT NOT NULL,
+        s_mean DOUBLE PRECISION NOT NULL,
+        s_var DOUBLE PRECISION NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS alerts (
+        id {id},
+        ticker TEXT NOT NULL,
+        bucket BIGINT NOT NULL,
+        kind TEXT NOT NULL,
+        count BIGINT NOT NULL,
+        value DOUBLE PRECISION NOT NULL,
+        baseline DOUBLE PRECISION NOT NULL,
+        z DOUBLE PRECISION NOT NULL,
+        ratio DOUBLE PRECISION,
+        created_at BIGINT NOT NULL,
+        UNIQUE(ticker, bucket, kind)
+    );
+    CREATE TABLE IF NOT EXISTS ticker_rollups (
+        bucket BIGINT NOT NULL,
+        ticker TEXT NOT NULL,
+        source TEXT NOT NULL,
+        n BIGINT NOT NULL,
+        max_upvotes BIGINT,
+        latest BIGINT,
+        {sums},
+        PRIMARY KEY (bucket, ticker, source)
+    );
+    CREATE TABLE IF NOT EXISTS rollup_authors (
+        bucket BIGINT NOT NULL,
+        ticker TEXT NOT NULL,
+        source TEXT NOT NULL,
+        author TEXT NOT NULL,
+        PRIMARY KEY (bucket, ticker, source, author)
+    );
+    CREATE TABLE IF NOT EXISTS comentions (
+        ticker TEXT NOT NULL,
+        bucket BIGINT NOT NULL,
+        other TEXT NOT NULL,
+        n BIGINT NOT NULL,
+        w DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (ticker, bucket, other)
+    );
+    CREATE TABLE IF NOT EXISTS author_sketches (
+        scope TEXT NOT NULL,
+        key TEXT NOT NULL,
+        bucket BIGINT NOT NULL,
+        registers {blob} NOT NULL,
+        PRIMARY KEY (scope, key, bucket)
+    );
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        generation BIGINT NOT NULL,
+        acquired_at BIGINT NOT NULL,
+        expires_at DOUBLE PRECISION NOT NULL
+    );
+"""
+
+# Columns added since a table was first created, for databases made before them
+_MIGRATIONS = tuple(f"ALTER TABLE options_flow ADD COLUMN IF NOT EXISTS {c} {_TYPES[c]}"
+                    for c, _ in db.OPTION_ENRICHED_COLUMNS)
+
+
+def _cutoff(hours):
+    return int((datetime.now(timezone.utc) - timedelta(hours=hours)).timestamp())
+
+
+def _in(values):
+    return f"({','.join('?' * len(values))})"
+
+
+class SQLStorage(abc.ABC):
+    """INTERFACE over the raw and derived tables, in SQL that DuckDB and
+    Postgres both accept. Subclasses supply connections, DDL details and bulk
+    staging."""
+
+    name = None
+    ID = None  # DDL of the id columns
+    BLOB = None  # binary column type
+    INDEXES = ()
+    DIV = "/"  # integer division
+
+    def __init__(self):
+        self._pinned = threading.local()  # .conn: this thread's _snapshot() connection
+        self._write_lock = threading.Lock()  # one writer per process; _begin_write covers other processes
+
+    # ---------------------------------------------------------- per engine
+
+    @abc.abstractmethod
+    def _connection(self):
+        """Context manager yielding a connection for reads."""
+
+    @abc.abstractmethod
+    def _transaction(self):
+        """Context manager yielding a connection in a transaction: committed on a
+        clean exit, rolled back on an exception."""
+
+    def _execute(self, conn, sql, params=()):
+        return conn.execute(sql, params)
+
+    @abc.abstractmethod
+    def _stage(self, conn, table, columns, rows):
+        """Create temp table `table` (seq, *columns) holding `rows` in order, for this transaction."""
+
+    @abc.abstractmethod
+    def _inserted(self, cur):
+        """Rows an INSERT ... SELECT added."""
+
+    def _stream(self, conn, sql, params, batch_size):
+        cur = self._execute(conn, sql, params)
+        while rows := cur.fetchmany(batch_size):
+            yield rows
+
+    def _round(self, expr, digits):
+        return f"ROUND({expr}, {digits})"
+
+    def _begin_snapshot(self, conn):
+        """Make the transaction just opened on conn read one consistent snapshot."""
+
+    def _begin_write(self, conn):
+        """Make the write transaction just opened on conn the only one until it ends."""
+
+    def _type(self, column):
+        return self.BLOB if column == "registers" else _TYPES[column]
+
+    # ---------------------------------------------------------- shared
+
+    @contextmanager
+    def _snapshot(self):
+        """Run this thread's _query calls in the block on one connection, in one
+        read transaction."""
+        with self._transaction() as conn:
+            self._begin_snapshot(conn)
+            self._pinned.conn = conn
+            try:
+                yield
+            finally:
+                self._pinned.conn = None
+
+    def _query(self, name, sql, params=()):
+        """Run a read query and return its rows as dicts, recording wsb_db_* metrics under `name`."""
+        start = time.perf_counter()
+        pinned = getattr(self._pinned, "conn", None)
+        with nullcontext(pinned) if pinned is not None else self._connection() as conn:
+            cur = self._execute(conn, sql, params)
+            columns = [d[0] for d in cur.description]
+            rows = [dict(zip(columns, r)) for r in cur.fetchall()]
+        elapsed = time.perf_counter() - start
+        metrics.observe("wsb_db_query_seconds", elapsed, query=name)
+        metrics.inc("wsb_db_rows_returned_total", len(rows), query=name)
+        if db.SLOW_QUERY_MS and elapsed * 1000 > db.SLOW_QUERY_MS:
+            metrics.inc("wsb_db_slow_queries_total", query=name)
+            print(f"[storage] Slow {self.name} query {name}: {elapsed * 1000:.1f}ms")
+        return rows
+
+    def _bucket(self, column):
+        return f"({column} {self.DIV} {_BUCKET})"
+
+    def _ddl(self):
+        statements = []
+        for statement in _SCHEMA.split(";")[:-1]:
+            table = statement.split("EXISTS", 1)[1].split()[0]
+            statements.append(statement.replace("{id}", self.ID.format(table=table)).replace("{blob}", self.BLOB)
+                              .replace("{sums}", ", ".join(f"{c} DOUBLE PRECISION NOT NULL"
+                                                           for c in db._ROLLUP_SUM_COLUMNS)))
+        return statements + list(_MIGRATIONS) + list(self.INDEXES)
+
+    def init_db(self):
+        with self._write_lock, self._transaction() as conn:
+            self._begin_write(conn)
+            for statement in self._ddl():
+                self._execute(conn, statement)
+            # Databases from before the derived tables: fill them once
+            if (self._execute(conn, "SELECT 1 FROM mentions LIMIT 1").fetchone()
+                    and not self._execute(conn, "SELECT 1 FROM ticker_rollups LIMIT 1").fetchone()):
+                self._rebuild_aggregates(conn)
+
+    # ---------------------------------------------------------- derived tables
+
+    def _fold_rollups(self, conn, rows, order, where="TRUE", params=()):
+        """Add the mentions in `rows` (stage_mentions or mentions) matching `where`
+        into ticker_rollups, as db._fill_stage_rollup + _fold_stage_rollup do.
+        Authors mode counts the first row by `order` per (hour, ticker, source,
+        author) that rollup_authors hasn't seen yet."""
+        bucket = self._bucket("timestamp")
+        sums = ",\n".join(f"{c} = ticker_rollups.{c} + excluded.{c}" for c in db._ROLLUP_SUM_COLUMNS)
+        self._execute(conn, f"""
+            INSERT INTO ticker_rollups (bucket, ticker, source, n, max_upvotes, latest,
+                                        {", ".join(db._ROLLUP_SUM_COLUMNS)})
+            SELECT bucket, ticker, source, COUNT(*), MAX(upvotes), MAX(timestamp), {db._ROLLUP_SUMS_SQL}
+            FROM (
+                SELECT r.*, CASE WHEN is_first AND NOT EXISTS (
+                    SELECT 1 FROM rollup_authors ra
+                    WHERE ra.bucket = r.bucket AND ra.ticker = r.ticker
+                      AND ra.source = r.source AND ra.author = r.author) THEN w ELSE 0 END AS aw
+                FROM (
+                    SELECT {bucket} AS bucket, ticker, source, author, sentiment_score AS s, upvotes, timestamp,
+                           weight AS w, weight * {_UPVOTE_WEIGHT} AS uw,
+                           author IS NOT NULL AND {order} = MIN({order}) OVER (
+                               PARTITION BY {bucket}, ticker, source, author) AS is_first
+                    FROM {rows} WHERE {where}
+                ) r
+            ) r
+            GROUP BY bucket, ticker, source
+            ON CONFLICT (bucket, ticker, source) DO UPDATE SET
+                n = ticker_rollups.n + excluded.n,
+                max_upvotes = GREATEST(ticker_rollups.max_upvotes, excluded.max_upvotes),
+                latest = GREATEST(ticker_rollups.latest, excluded.latest),
+                {sums}
+        """, params)
+        self._execute(conn, f"""
+            INSERT INTO rollup_authors (bucket, ticker, source, author)
+            SELECT DISTINCT {bucket}, ticker, source, author FROM {rows} WHERE ({where}) AND author IS NOT NULL
+            ON CONFLICT DO NOTHING
+        """, params)
+
+    def _rebuild_rollups(self, conn, lo, hi):
+        """Recompute ticker_rollups for timestamps in [lo, hi] from raw rows (whole hours)."""
+        lo, hi = lo // _BUCKET, hi // _BUCKET
+        for table in ("ticker_rollups", "rollup_authors"):
+            self._execute(conn, f"DELETE FROM {table} WHERE bucket BETWEEN ? AND ?", (lo, hi))
+        self._fold_rollups(conn, "mentions", "id", "timestamp >= ? AND timestamp < ?",
+                           (lo * _BUCKET, (hi + 1) * _BUCKET))
+
+    def _fold_comentions(self, conn):
+        """Add the co-mention pairs of stage_mentions (not inserted yet) into
+        comentions: staged rows pair with each other, and with their posts'
+        stored rows in both directions, as db._fill_stage_comentions("staged")."""
+        select = f"""
+            SELECT a.ticker AS x, {self._bucket("a.timestamp")} AS bx, o.ticker AS y,
+                   {self._bucket("o.timestamp")} AS "by", LEAST(a.weight, o.weight) AS w, {{mutual}} AS mutual
+            FROM stage_mentions a JOIN {{o}} o ON o.post_id = a.post_id AND o.ticker != a.ticker
+        """
+        self._execute(conn, f"""
+            INSERT INTO comentions (ticker, bucket, other, n, w)
+            WITH pairs AS ({select.format(o="stage_mentions", mutual="TRUE")}
+                           UNION ALL {select.format(o="mentions", mutual="FALSE")})
+            SELECT x, bx, y, COUNT(*), SUM(w) FROM (
+                SELECT x, bx, y, w FROM pairs
+                UNION ALL
+                SELECT y, "by", x, w FROM pairs WHERE NOT mutual
+            ) p
+            GROUP BY x, bx, y
+            ON CONFLICT (ticker, bucket, other) DO UPDATE SET
+                n = comentions.n + excluded.n, w = comentions.w + excluded.w
+        """)
+
+    def _comention_pairs_sql(self, where):
+        """Co-mention counts among stored rows, both directions, per (ticker, hour, other)."""
+        return f"""
+            SELECT a.ticker AS x, {self._bucket("a.timestamp")} AS bx, o.ticker AS y,
+                   COUNT(*) AS n, SUM(LEAST(a.weight, o.weight)) AS w
+            FROM mentions a JOIN mentions o ON o.post_id = a.post_id AND o.ticker != a.ticker
+            WHERE {where}
+            GROUP BY a.ticker, {self._bucket("a.timestamp")}, o.ticker
+        """
+
+    def _merge_sketches(self, conn, sketches):
+        """Merge db._build_sketches output into author_sketches."""
+        if not sketches:
+            return
+        self._stage(conn, "stage_sketch_keys", ["scope", "key", "bucket"], list(sketches))
+        for scope, key, bucket, registers in self._execute(conn, """
+            SELECT a.scope, a.key, a.bucket, a.registers FROM author_sketches a
+            JOIN stage_sketch_keys k ON k.scope = a.scope AND k.key = a.key AND k.bucket = a.bucket
+        """).fetchall():
+            sketches[(scope, key, bucket)].merge(bytes(registers))
+        self._stage(conn, "stage_sketches", ["scope", "key", "bucket", "registers"],
+                    [(*k, sk.to_bytes()) for k, sk in sketches.items()])
+        self._execute(conn, """
+            INSERT INTO author_sketches (scope, key, bucket, registers)
+            SELECT scope, key, bucket, registers FROM stage_sketches
+            ON CONFLICT (scope, key, bucket) DO UPDATE SET registers = excluded.registers
+        """)
+
+    def _rebuild_aggregates(self, conn):
+        """Recompute every derived table from the raw mentions."""
+        print(f"[storage] Building {self.name} rollups, co-mentions and author sketches from raw rows...")
+        for table in ("ticker_rollups", "rollup_authors", "comentions", "author_sketches"):
+            self._execute(conn, f"DELETE FROM {table}")
+        self._fold_rollups(conn, "mentions", "id")
+        self._execute(conn, f"INSERT INTO comentions (ticker, bucket, other, n, w) "
+                            f"SELECT x, bx, y, n, w FROM ({self._comention_pairs_sql('TRUE')}) p")
+        rows = self._execute(conn, f"SELECT {', '.join(_MENTION_COLUMNS)} FROM mentions").fetchall()
+        self._merge_sketches(conn, db._build_sketches(rows))
+
+    def write_rows(self, mention_rows=(), option_rows=(), replace_post_ids=None, chunk_size=None):
+        """db.write_rows: one transaction per chunk, each an INSERT ... SELECT
+        per table from staged rows plus the rollup, co-mention and author-sketch
+        updates. Writers take turns, so the staged rows left after dropping
+        stored ones are exactly the rows inserted."""
+        chunk_size = chunk_size or db.WRITE_CHUNK_SIZE
+        mention_iter, option_iter = iter(mention_rows), iter(option_rows)
+        stats = {"mentions_inserted": 0, "mentions_duplicates": 0,
+                 "options_inserted": 0, "options_duplicates": 0, "transactions": 0, "lock_seconds": 0.0}
+        mentions_sql, options_sql = ", ".join(_MENTION_COLUMNS), ", ".join(_OPTION_COLUMNS)
+        option_key = " AND ".join(f"o.{c} IS NOT DISTINCT FROM s.{c}"
+                                  for c in ("strike", "option_type", "expiry_category"))
+        with metrics.timed("wsb_db_query_seconds", query="write_rows"):
+            with self._write_lock, self._transaction() as conn:
+                self._begin_write(conn)
+                horizon = int(time.time()) // _BUCKET - db.ROLLUP_AUTHOR_RETENTION_HOURS
+                self._execute(conn, "DELETE FROM rollup_authors WHERE bucket < ?", (horizon,))
+            replace_pending = replace_post_ids is not None
+            while True:
+                mention_chunk = list(islice(mention_iter, chunk_size))
+                option_chunk = list(islice(option_iter, chunk_size))
+                if not mention_chunk and not option_chunk and not replace_pending:
+                    break
+                sketches = db._build_sketches(mention_chunk)
+                started = time.perf_counter()
+                with self._write_lock, self._transaction() as conn:
+                    self._begin_write(conn)
+                    rebuild_range = None
+                    if replace_pending:
+                        rebuild_range = self._delete_posts(conn, replace_post_ids, mention_chunk)
+                        replace_pending = False
+                    self._stage(conn, "stage_mentions", _MENTION_COLUMNS, mention_chunk)
+                    self._stage(conn, "stage_options", _OPTION_COLUMNS, option_chunk)
+                    # Keep only what will be inserted: the first row per key, if not already stored
+                    self._execute(conn, """
+                        DELETE FROM stage_mentions
+                        WHERE seq NOT IN (SELECT MIN(seq) FROM stage_mentions GROUP BY ticker, post_id)
+                           OR EXISTS (SELECT 1 FROM mentions m
+                                      WHERE m.ticker = stage_mentions.ticker AND m.post_id = stage_mentions.post_id)
+                    """)
+                    self._fold_comentions(conn)
+                    # seq order, so ids follow input order like SQLite's (authors mode counts the lowest id)
+                    mentions = self._inserted(self._execute(conn, f"""
+                        INSERT INTO mentions ({mentions_sql})
+                        SELECT {mentions_sql} FROM stage_mentions ORDER BY seq
+                        ON CONFLICT DO NOTHING
+                    """))
+                    # NULL strikes/types never conflict in the unique key; like SQLite's
+                    # stage prefilter, match them with IS NOT DISTINCT FROM instead
+                    options = self._inserted(self._execute(conn, f"""
+                        INSERT INTO options_flow ({options_sql})
+                        SELECT {options_sql} FROM (
+                            SELECT *, ROW_NUMBER() OVER (
+                                PARTITION BY ticker, strike, option_type, expiry_category, post_id ORDER BY seq) AS k
+                            FROM stage_options
+                        ) s
+                        WHERE k = 1 AND NOT EXISTS (
+                            SELECT 1 FROM options_flow o
+                            WHERE o.ticker = s.ticker AND o.post_id = s.post_id AND {option_key})
+                        ORDER BY seq
+                        ON CONFLICT DO NOTHING
+                    """))
+                    if rebuild_range:
+                        self._rebuild_rollups(conn, *rebuild_range)
+                    else:
+                        self._fold_rollups(conn, "stage_mentions", "seq")
+                    self._merge_sketches(conn, sketches)
+                stats["lock_seconds"] += time.perf_counter() - started
+                stats["transactions"] += 1
+                stats["mentions_inserted"] += mentions
+                stats["mentions_duplicates"] += len(mention_chunk) - mentions
+                stats["options_inserted"] += options
+                stats["options_duplicates"] += len(option_chunk) - options
+        stats["lock_seconds"] = round(stats["lock_seconds"], 4)
+        return stats
+
+    def _delete_posts(self, conn, post_ids, mention_chunk):
+        """Delete the stored rows of `post_ids` and take their pairs out of
+        comentions. Returns the (lo, hi) timestamps whose rollups need
+        rebuilding (authors-mode firsts can't be subtracted), or None."""
+        self._stage(conn, "stage_post_ids", ["post_id"], [(p,) for p in post_ids])
+        in_posts = "a.post_id IN (SELECT post_id FROM stage_post_ids)"
+        timestamps = [ts for ts in self._execute(
+            conn, f"SELECT MIN(timestamp), MAX(timestamp) FROM mentions a WHERE {in_posts}").fetchone()
+            if ts is not None]
+        timestamps += [row[3] for row in mention_chunk]
+        self._execute(conn, f"""
+            UPDATE comentions SET n = comentions.n - p.n, w = comentions.w - p.w
+            FROM ({self._comention_pairs_sql(in_posts)}) p
+            WHERE comentions.ticker = p.x AND comentions.bucket = p.bx AND comentions.other = p.y
+        """)
+        self._execute(conn, "DELETE FROM comentions WHERE n <= 0")
+        for table in ("mentions", "options_flow"):
+            self._execute(conn, f"DELETE FROM {table} WHERE post_id IN (SELECT post_id FROM stage_post_ids)")
+        return (min(timestamps), max(timestamps)) if timestamps else None
+
+    def get_top_tickers(self, hours=24, limit=25, exact=False, weight="none", source=None):
+        """db.get_top_tickers: hourly ticker_rollups plus the raw rows of the
+        partial hour at the window's start; unique_authors from author_sketches
+        unless exact=True or source is set."""
+        p = db.WEIGHT_MODES[weight]
+        cutoff = _cutoff(hours)
+        cutoff_bucket = cutoff // _BUCKET
+        source_sql = "AND source = ?" if source else ""
+        source_params = (source,) if source else ()
+        rows = self._query(f"get_top_tickers:{weight}" + (":source" if source else ""), f"""
+            WITH edge AS (
+                SELECT id, ticker, source, author, sentiment_score AS s, upvotes, timestamp,
+                       weight AS w, weight * {_UPVOTE_WEIGHT} AS uw
+                FROM mentions
+                WHERE timestamp >= ? AND timestamp < ? {source_sql}
+            ),
+            parts AS (
+                SELECT ticker, n, max_upvotes, latest, w, {p}w AS mw, {p}ws AS mws, {p}wss AS mwss, {p}ww AS mww
+                FROM ticker_rollups
+                WHERE bucket > ? {source_sql}
+                UNION ALL
+                SELECT ticker, COUNT(*), MAX(upvotes), MAX(timestamp), SUM(w),
+                       SUM({p}w), SUM({p}w * s), SUM({p}w * s * s), SUM({p}w * {p}w)
+                FROM (
+                    SELECT *, CASE WHEN author IS NOT NULL AND id = MIN(id) OVER (PARTITION BY ticker, source, author)
+                                   THEN w ELSE 0 END AS aw
+                    FROM edge
+                ) e
+                GROUP BY ticker
+            )
+            SELECT
+                ticker,
+                CAST(SUM(n) AS BIGINT) AS mention_count,
+                {self._round("SUM(w)", 2)} AS weighted_mentions,
+                SUM(mw) AS mw, SUM(mws) AS mws, SUM(mwss) AS mwss, SUM(mww) AS mww,
+                MAX(max_upvotes) AS top_upvotes,
+                MAX(latest) AS latest_mention
+            FROM parts
+            GROUP BY ticker
+            HAVING SUM(n) > 5
+            ORDER BY weighted_mentions DESC, mention_count DESC
+            LIMIT ?
+        """, (cutoff, (cutoff_bucket + 1) * _BUCKET, *source_params, cutoff_bucket, *source_params, limit))
+        keys = [r["ticker"] for r in rows]
+        if exact or source:
+            authors = self._exact_author_counts(keys, cutoff, source)
+        elif keys:
+            authors = hll.estimate_many((r["key"], bytes(r["registers"])) for r in self._query(
+                "sketches:mentions", *db._sketch_sql("mentions", keys, cutoff)))
+        else:
+            authors = {}
+        result = []
+        for r in rows:
+            avg, ci_low, ci_high = db._sentiment_stats(r["mw"], r["mws"], r["mwss"], r["mww"])
+            result.append({
+                "ticker": r["ticker"],
+                "mention_count": r["mention_count"],
+                "weighted_mentions": r["weighted_mentions"],
+                "avg_sentiment": avg,
+                "sentiment_ci_low": ci_low,
+                "sentiment_ci_high": ci_high,
+                "top_upvotes": r["top_upvotes"],
+                "latest_mention": r["latest_mention"],
+                # An author can't be counted more often than they mentioned the ticker
+                "unique_authors": min(authors.get(r["ticker"], 0), r["mention_count"]),
+            })
+        return result
+
+    def _exact_author_counts(self, keys, cutoff, source=None):
+        if not keys:
+            return {}
+        source_sql = "AND source = ?" if source else ""
+        return {r["ticker"]: r["n"] for r in self._query(
+            "get_top_tickers:exact_authors",
+            f"SELECT ticker, COUNT(DISTINCT author) AS n FROM mentions "
+            f"WHERE ticker IN {_in(keys)} AND timestamp >= ? {source_sql} GROUP BY ticker",
+            (*keys, cutoff, *((source,) if source else ())))}
+
+    def get_ticker_detail(self, symbol, hours=24, source=None):
+        source_sql = "AND source = ?" if source else ""
+        return self._query("get_ticker_detail", f"""
+            SELECT id, {", ".join(_MENTION_COLUMNS)} FROM mentions
+            WHERE ticker = ? AND timestamp >= ? {source_sql}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT 100
+        """, (symbol.upper(), _cutoff(hours), *((source,) if source else ())))
+
+    def _mention_counts(self, tickers, cutoff_bucket):
+        """Mentions per ticker since `cutoff_bucket` (whole hours), from ticker_rollups."""
+        if not tickers:
+            return {}
+        return {r["ticker"]: r["n"] for r in self._query(
+            "comentions:counts",
+            f"SELECT ticker, CAST(SUM(n) AS BIGINT) AS n FROM ticker_rollups "
+            f"WHERE bucket >= ? AND ticker IN {_in(tickers)} GROUP BY ticker", (cutoff_bucket, *tickers))}
+
+    def get_related_tickers(self, symbol, hours=24, limit=10):
+        """db.get_related_tickers, from comentions."""
+        symbol = symbol.upper()
+        cutoff_bucket = _cutoff(hours) // _BUCKET
+        rows = self._query("get_related_tickers", f"""
+            SELECT other, CAST(SUM(n) AS BIGINT) AS together, {self._round("SUM(w)", 2)} AS weighted
+            FROM comentions
+            WHERE ticker = ? AND bucket >= ?
+            GROUP BY other
+            ORDER BY weighted DESC, together DESC
+            LIMIT ?
+        """, (symbol, cutoff_bucket, limit))
+        counts = self._mention_counts([symbol] + [r["other"] for r in rows], cutoff_bucket)
+        return [{
+            "ticker": r["other"],
+            "together": r["together"],
+            "weighted": r["weighted"],
+            "jaccard": db._jaccard(r["together"], counts.get(symbol, 0), counts.get(r["other"], 0)),
+        } for r in rows]
+
+    def get_comention_graph(self, counts, hours=24, min_together=1):
+        """db.get_comention_graph, from comentions."""
+        tickers = list(counts)
+        if len(tickers) < 2:
+            return []
+        rows = self._query("get_comention_graph", f"""
+            SELECT ticker, other, CAST(SUM(n) AS BIGINT) AS together, {self._round("SUM(w)", 2)} AS weighted
+            FROM comentions
+            WHERE ticker IN {_in(tickers)} AND bucket >= ? AND other IN {_in(tickers)} AND ticker < other
+            GROUP BY ticker, other
+            HAVING SUM(n) >= ?
+            ORDER BY weighted DESC
+        """, (*tickers, _cutoff(hours) // _BUCKET, *tickers, min_together))
+        return [{
+            "a": r["ticker"],
+            "b": r["other"],
+            "together": r["together"],
+            "weighted": r["weighted"],
+            "jaccard": db._jaccard(r["together"], counts[r["ticker"]], counts[r["other"]]),
+        } for r in rows]
+
+    def get_options_flow(self, hours=24, limit=50, exact=False, source=None):
+        source_sql = "AND source = ?" if source else ""
+        return self._query("get_options_flow", f"""
+            SELECT
+                ticker,
+                option_type,
+                COUNT(*) as count,
+                {self._round("SUM(weight)", 2)} as weighted_count,
+                {self._round("AVG(strike)", 2)} as avg_strike,
+                MIN(strike) as min_strike,
+                MAX(strike) as max_strike,
+                {self._round("SUM(weight * sentiment_score) / NULLIF(SUM(weight), 0)", 4)} as avg_sentiment,
+                {self._round("AVG(dte)", 1)} as avg_dte,
+                {self._round(db._AVG_OTM_PCT_SQL, 2)} as avg_otm_pct,
+                COUNT(DISTINCT author) as unique_authors,
+                string_agg(DISTINCT expiry_category, ',') as expiry_categories
+            FROM options_flow
+            WHERE timestamp >= ? AND option_type IS NOT NULL {source_sql}
+            GROUP BY ticker, option_type
+            ORDER BY weighted_count DESC, count DESC
+            LIMIT ?
+        """, (_cutoff(hours), *((source,) if source else ()), limit))
+
+    def get_options_summary(self, hours=24, source=None):
+        source_sql = "AND source = ?" if source else ""
+        params = (_cutoff(hours), *((source,) if source else ()))
+        counts = self._query("get_options_summary:counts", f"""
+            SELECT COUNT(*) AS total,
+                   COUNT(*) FILTER (WHERE option_type = 'call') AS calls,
+                   COUNT(*) FILTER (WHERE option_type = 'put') AS puts
+            FROM options_flow WHERE timestamp >= ? {source_sql}
+        """, params)[0]
+        top = {}
+        for option_type in ("call", "put"):
+            top[option_type] = self._query(f"get_options_summary:top_{option_type}s", f"""
+                SELECT ticker, strike, expiry, expiry_category, raw_match, upvotes, expiry_date, dte, underlying, otm_pct
+                FROM options_flow
+                WHERE timestamp >= ? AND option_type = '{option_type}' {source_sql}
+                ORDER BY upvotes DESC LIMIT 5
+            """, params)
+        return {
+            "total_options": counts["total"],
+            "calls": counts["calls"],
+            "puts": counts["puts"],
+            "call_put_ratio": round(counts["calls"] / max(counts["puts"], 1), 2),
+            "top_calls": top["call"],
+            "top_puts": top["put"],
+        }
+
+    def get_options_buckets(self, hours=24, source=None):
+        rows = self._query("get_options_buckets", db._options_buckets_sql("AND source = ?" if source else ""),
+                           (_cutoff(hours), *((source,) if source else ())))
+        return db._fold_option_buckets(rows)
+
+    def iter_export(self, table, since, until, tickers=None, source=None, batch_size=10000):
+        columns = db.EXPORT_TABLES[table]  # KeyError for anything else: the name goes into the SQL
+        where = ["timestamp >= ?", "timestamp < ?"]
+        params = [since, until]
+        if tickers:
+            where.append(f"ticker IN {_in(tickers)}")
+            params += [t.upper() for t in tickers]
+        if source:
+            where.append("source = ?")
+            params.append(source)
+        with self._connection() as conn:
+            yield from self._stream(
+                conn, f"SELECT {', '.join(columns)} FROM {table} WHERE {' AND '.join(where)} ORDER BY timestamp",
+                params, batch_size)
+
+    def get_db_stats(self):
+        r = self._query("get_db_stats", """
+            SELECT COUNT(*) AS total, COUNT(DISTINCT ticker) AS tickers, MAX(timestamp) AS latest FROM mentions
+        """)[0]
+        return {"total_mentions": r["total"], "unique_tickers": r["tickers"], "latest_timestamp": r["latest"]}
+
+    def get_dashboard(self, hours=24, limit=50):
+        with self._snapshot():
+            return {
+                "tickers": self.get_top_tickers(hours=hours, limit=limit),
+                "options": {
+                    "summary": self.get_options_summary(hours=hours),
+                    "flow": self.get_options_flow(hours=hours),
+                    "buckets": self.get_options_buckets(hours=hours),
+                },
+                "stats": self.get_db_stats(),
+            }
+
+    # ---------------------------------------------------------- alerts
+
+    def get_hour_totals(self, keys):
+        """db.get_hour_totals: ticker_rollups summed over sources, one primary-key probe per key."""
+        keys = list(keys)
+        out = {}
+        for i in range(0, len(keys), 5000):
+            chunk = keys[i:i + 5000]
+            values = ", ".join(["(CAST(? AS BIGINT), CAST(? AS TEXT))"] * len(chunk))
+            rows = self._query("alerts:hour_totals", f"""
+                WITH k(bucket, ticker) AS (VALUES {values})
+                SELECT r.bucket, r.ticker, CAST(SUM(r.n) AS BIGINT) AS n, SUM(r.w) AS w, SUM(r.ws) AS ws,
+                       SUM(r.wss) AS wss
+                FROM k JOIN ticker_rollups r ON r.bucket = k.bucket AND r.ticker = k.ticker
+                GROUP BY r.bucket, r.ticker
+            """, [v for key in chunk for v in key])
+            out.update({(r["bucket"], r["ticker"]): (r["n"], r["w"], r["ws"], r["wss"]) for r in rows})
+        return out
+
+    def get_first_bucket(self):
+        return self._query("alerts:first_bucket", "SELECT MIN(bucket) AS bucket FROM ticker_rollups")[0]["bucket"]
+
+    def iter_hour_totals(self, batch_size=10000):
+        with self._connection() as conn:
+            for rows in self._stream(conn, """
+                SELECT ticker, bucket, CAST(SUM(n) AS BIGINT), SUM(w), SUM(ws), SUM(wss)
+                FROM ticker_rollups GROUP BY ticker, bucket ORDER BY ticker, bucket
+            """, (), batch_size):
+                yield from (tuple(r) for r in rows)
+
+    def load_alert_baselines(self):
+        return [tuple(r.values()) for r in self._query(
+            "alerts:baselines", f"SELECT {', '.join(db._BASELINE_COLUMNS)} FROM alert_baselines")]
+
+    def save_alert_baselines(self, rows):
+        columns = list(db._BASELINE_COLUMNS)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns[1:])
+        with self._transaction() as conn:
+            self._stage(conn, "stage_baselines", columns, rows)
+            self._execute(conn, f"""
+                INSERT INTO alert_baselines ({', '.join(columns)})
+                SELECT {', '.join(columns)} FROM stage_baselines
+                ON CONFLICT (ticker) DO UPDATE SET {updates}
+            """)
+
+    def insert_alerts(self, alerts):
+        columns = db.ALERT_COLUMNS[1:]
+        inserted = []
+        with self._transaction() as conn:
+            for alert in alerts:
+                row = self._execute(conn, f"""
+                    INSERT INTO alerts ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})
+                    ON CONFLICT DO NOTHING RETURNING id
+                """, [alert[c] for c in columns]).fetchone()
+                if row:
+                    inserted.append({"id": row[0], **alert})
+        return inserted
+
+    def get_alerts(self, since_id=0, hours=24, limit=50, ticker=None, oldest_first=False):
+        ticker_sql = "AND ticker = ?" if ticker else ""
+        return self._query("get_alerts", f"""
+            SELECT {', '.join(db.ALERT_COLUMNS)} FROM alerts
+            WHERE id > ? AND created_at >= ? {ticker_sql}
+            ORDER BY id {"ASC" if oldest_first else "DESC"} LIMIT ?
+        """, (since_id, int(time.time()) - hours * 3600, *((ticker.upper(),) if ticker else ()), limit))
+
+    # ---------------------------------------------------------- leases
+
+    def acquire_lease(self, name, holder, ttl):
+        """db.acquire_lease as one conditional upsert, atomic without a table lock."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = self._execute(conn, """
+                INSERT INTO leases (name, holder, generation, acquired_at, expires_at) VALUES (?, ?, 1, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, generation = leases.generation + 1,
+                    acquired_at = excluded.acquired_at, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at <= ?
+                RETURNING generation
+            """, (name, holder, int(now), now + ttl, now)).fetchone()
+        if row:
+            return row[0], None
+        return None, self.get_lease(name)
+
+    def renew_lease(self, name, holder, generation, ttl):
+        with self._transaction() as conn:
+            return bool(self._execute(
+                conn, "UPDATE leases SET expires_at = ? WHERE name = ? AND holder = ? AND generation = ? "
+                      "RETURNING name", (time.time() + ttl, name, holder, generation)).fetchall())
+
+    def release_lease(self, name, holder, generation):
+        with self._transaction() as conn:
+            self._execute(conn, "UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ? AND generation = ?",
+                          (name, holder, generation))
+
+    def get_lease(self, name):
+        rows = self._query("get_lease", "SELECT name, holder, generation, acquired_at, expires_at FROM leases "
+                                        "WHERE name = ?", (name,))
+        return rows[0] if rows else None
+
+
+class DuckDBStorage(SQLStorage):
+    """One DuckDB database per process, a cursor (DuckDB's per-thread handle) per thread."""
+
+    name = "duckdb"
+    # No PRIMARY KEY on id: sequence values are unique anyway, and every ART
+    # index slows bulk inserts; range scans use DuckDB's zone maps instead
+    ID = "BIGINT NOT NULL DEFAULT nextval('{table}_id')"
+    BLOB = "BLOB"
+    DIV = "//"
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path or DUCKDB_PATH
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _cursor(self):
+        if self._pid != os.getpid():
+            import duckdb  # deferred: optional
+            with self._lock:
+                if self._pid != os.getpid():
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    self._db = duckdb.connect(self.path)
+                    self._pid = os.getpid()
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None or self._local.db is not self._db:
+            cursor = self._local.cursor = self._db.cursor()
+            self._local.db = self._db
+        return cursor
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+            self._db = self._pid = None
+
+    def _ddl(self):
+        return ([f"CREATE SEQUENCE IF NOT EXISTS {table}_id" for table in ("mentions", "options_flow", "alerts")]
+                + super()._ddl())
+
+    @contextmanager
+    def _connection(self):
+        yield self._cursor()
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._cursor()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _stage(self, conn, table, columns, rows):
+        columns = ["seq", *columns]
+        conn.execute(f"CREATE OR REPLACE TEMP TABLE {table} "
+                     f"({', '.join(f'{c} {self._type(c)}' for c in columns)})")
+        rows = list(rows)
+        if rows:
+            # One list parameter per column: orders of magnitude faster than executemany
+            values = [list(range(len(rows))), *map(list, zip(*rows))]
+            conn.execute(f"INSERT INTO {table} SELECT "
+                         + ", ".join(f"unnest(CAST(? AS {self._type(c)}[]))" for c in columns), values)
+
+    def _inserted(self, cur):
+        return cur.fetchone()[0]
+
+    def _round(self, expr, digits):
+        # DuckDB rounds the binary double (ROUND(1.005, 2) = 1.0); SQLite and
+        # Postgres' NUMERIC round its shortest decimal form (1.01), so go through that
+        return f"CAST(ROUND(CAST(CAST({expr} AS VARCHAR) AS DECIMAL(38, 17)), {digits}) AS DOUBLE)"
+
+    def _stream(self, conn, sql, params, batch_size):
+        # Own cursor: a streaming response may resume the generator on another thread
+        self._cursor()
+        cur = self._db.cursor()
+        try:
+            cur.execute(sql, params)
+            while rows := cur.fetchmany(batch_size):
+                yield rows
+        finally:
+            cur.close()
+
+
+class PostgresStorage(SQLStorage):
+    """A psycopg connection pool per process (created on first use, so after any fork)."""
+
+    name = "postgres"
+    ID = "BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY"
+    BLOB = "BYTEA"
+    INDEXES = (
+        "CREATE INDEX IF NOT EXISTS idx_ticker_timestamp ON mentions(ticker, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_timestamp ON mentions(timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_post_id ON mentions(post_id)",
+        "CREATE INDEX IF NOT EXISTS idx_options_timestamp ON options_flow(timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_options_post_id ON options_flow(post_id)",
+        f"CREATE INDEX IF NOT EXISTS idx_options_buckets ON options_flow({db._OPTION_BUCKET_INDEX})",
+        "CREATE INDEX IF NOT EXISTS idx_alerts_created ON alerts(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_rollups_ticker ON ticker_rollups(ticker, bucket)",
+    )
+
+    def __init__(self, url=None, pool_size=None):
+        super().__init__()
+        self.url = url or DATABASE_URL
+        if not self.url:
+            raise RuntimeError("WSB_STORAGE=postgres needs WSB_DATABASE_URL")
+        self.pool_size = pool_size or PG_POOL_SIZE
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pid != os.getpid():
+            from psycopg_pool import ConnectionPool  # deferred: optional
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = ConnectionPool(self.url, min_size=1, max_size=self.pool_size, open=True,
+                                                name="wsb")
+                    self._pid = os.getpid()
+        return self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.close()
+            self._pool = self._pid = None
+
+    @contextmanager
+    def _connection(self):
+        with self._get_pool().connection() as conn:
+            yield conn
+
+    _transaction = _connection  # the pool commits on a clean exit and rolls back on an exception
+
+    def _execute(self, conn, sql, params=()):
+        return conn.execute(sql.replace("?", "%s"), params or None)
+
+    def _round(self, expr, digits):
+        return f"CAST(ROUND(CAST({expr} AS NUMERIC), {digits}) AS DOUBLE PRECISION)"
+
+    def _begin_write(self, conn):
+        # Held until the transaction ends; other processes' writers wait here
+        conn.execute("SELECT pg_advisory_xact_lock(%s)", (_WRITE_LOCK_KEY,))
+
+    def _begin_snapshot(self, conn):
+        # READ COMMITTED (the default) takes a new snapshot per statement
+        conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+
+    def _stage(self, conn, table, columns, rows):
+        columns = ["seq", *columns]
+        conn.execute(f"CREATE TEMP TABLE {table} ({', '.join(f'{c} {self._type(c)}' for c in columns)}) "
+                     f"ON COMMIT DROP")
+        with conn.cursor() as cur, cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+            for seq, row in enumerate(rows):
+                copy.write_row((seq, *row))
+
+    def _inserted(self, cur):
+        return cur.rowcount
+
+    def _stream(self, conn, sql, params, batch_size):
+        # Server-side cursor: rows come over in batches instead of all at once
+        with conn.cursor(name="wsb_stream") as cur:
+            cur.execute(sql.replace("?", "%s"), params or None)
+            while rows := cur.fetchmany(batch_size):
+                yield rows
+
+
+BACKENDS = {"duckdb": DuckDBStorage, "postgres": PostgresStorage}
+
+
+def open_storage(name, **kwargs):
+    """The backend called `name` (WSB_STORAGE). Connects lazily, on first use."""
+    try:
+        return BACKENDS[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"unknown WSB_STORAGE {name!r} (sqlite, {', '.join(BACKENDS)})") from None
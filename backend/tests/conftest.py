@@ -0,0 +1,29 @@
+"""Shared fixtures. Run from backend/: python -m pytest -q
+
+Tests use a throwaway SQLite file, the bench's stubbed SEC ticker list, fake
+Reddit server and stubbed yfinance — no network, no shared state.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import fake_yfinance  # noqa: E402
+
+fake_yfinance.install()
+
+import db  # noqa: E402
+import tickers  # noqa: E402
+from bench.corpus import TICKERS  # noqa: E402
+
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """db.py pointed at an empty SQLite file for the test."""
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(tickers, "_sec_tickers", set(TICKERS))
+    db.init_db()
+    return db.DB_PATH
@@ -0,0 +1,76 @@
+import pytest
+
+import scraper
+from bench.fake_reddit import FakeReddit, serve
+from expander import expand_comments
+
+
+@pytest.fixture
+def reddit(monkeypatch):
+    """The fake Reddit with deep comment trees, and the request paths it served."""
+    fake = FakeReddit(seed=11, posts_per_listing=8, deep_trees=True)
+    paths = []
+    route = fake.route
+
+    def recording(path, query):
+        paths.append(path)
+        return route(path, query)
+
+    fake.route = recording
+    with serve(fake) as base:
+        monkeypatch.setattr(scraper, "BASE", base)
+        monkeypatch.setattr(scraper, "REQUEST_DELAY", 0)
+        posts = scraper.fetch_posts()
+        paths.clear()
+        yield fake, posts, paths
+
+
+def _live_ids(fake, post_id):
+    _, index = fake._tree(post_id)
+    return {f"{post_id}_{cid}" for cid, node in index.items()
+            if node["data"].get("body") not in (None, "", "[deleted]", "[removed]")}
+
+
+def test_requests_stay_within_budget(reddit):
+    fake, posts, paths = reddit
+    comments, rows, summary = expand_comments(posts, budget=12)
+    assert summary["requests"] == len(paths) == 12
+    assert sum(r["requests"] for r in rows) == 12
+    ids = [c["id"] for c in comments]
+    assert len(ids) == len(set(ids)) == summary["comments"]
+
+
+def test_more_stubs_expand_to_the_whole_tree(reddit):
+    fake, posts, paths = reddit
+    post = max(posts, key=lambda p: p["num_comments"])
+    assert post["num_comments"] > 1000  # a megathread: its first page leaves `more` stubs
+    comments, rows, summary = expand_comments([post], budget=500)
+    assert {c["id"] for c in comments} == _live_ids(fake, post["id"])
+    assert summary["requests"] < 500 and rows[0]["pending_more"] == ""
+    assert paths.count("/api/morechildren.json") == len(paths) - 1
+
+
+def test_unexpanded_ids_carry_over(reddit):
+    fake, posts, paths = reddit
+    post = max(posts, key=lambda p: p["num_comments"])
+    first, rows, _ = expand_comments([post], budget=3)
+    pending = rows[0]["pending_more"].split(",")
+    assert pending != [""] and rows[0]["num_comments"] == post["num_comments"]
+
+    # Nothing new on Reddit: the next run only expands what the last one left
+    paths.clear()
+    history = {r["post_id"]: r for r in rows}
+    second, rows, summary = expand_comments([post], budget=2, history=history)
+    assert summary["requests"] == 2 and set(paths) == {"/api/morechildren.json"}
+    assert second and not {c["id"] for c in first} & {c["id"] for c in second}
+    # The first batch is the oldest carried-over ids (deleted comments come back empty)
+    live = _live_ids(fake, post["id"])
+    assert {c["id"] for c in second} >= {f"{post['id']}_{i}" for i in pending[:100]} & live
+
+    # Given the budget, later runs reach the rest of the tree without refetching the first page
+    seen = {c["id"] for c in first + second}
+    while rows and rows[0]["pending_more"]:
+        history = {r["post_id"]: r for r in rows}
+        more, rows, _ = expand_comments([post], budget=50, history=history)
+        seen |= {c["id"] for c in more}
+    assert seen == live
@@ -0,0 +1,52 @@
+import math
+import time
+
+import pytest
+
+import db
+import hll
+from bench.corpus import CorpusGenerator
+
+# HyperLogLog's standard error is 1.04 / sqrt(M); allow four of them
+BOUND = 4 * 1.04 / math.sqrt(hll.M)
+
+
+def _sketch(values):
+    sk = hll.HyperLogLog()
+    for v in values:
+        sk.add(v)
+    return sk
+
+
+@pytest.mark.parametrize("n", [10, 100, 1000, 10_000, 100_000])
+def test_estimate_within_error_bound(n):
+    estimate = _sketch(f"ape{i}" for i in range(n)).count()
+    assert abs(estimate - n) <= max(1, BOUND * n)
+
+
+def test_merge_is_the_union():
+    a, b = [f"a{i}" for i in range(50)], [f"b{i}" for i in range(5000)]
+    whole = _sketch(a + b + a).to_bytes()
+    # Sparse into dense, dense into sparse, and serialized blobs
+    assert _sketch(a).merge(_sketch(b)).to_bytes() == whole
+    assert _sketch(b).merge(_sketch(a).to_bytes()).to_bytes() == whole
+    assert hll.estimate([_sketch(a).to_bytes(), _sketch(b).to_bytes()]) == hll.estimate([whole])
+
+
+def test_estimate_many_matches_estimate():
+    blobs = {key: [_sketch(f"{key}{i}" for i in range(lo, lo + n)).to_bytes() for lo in (0, n // 2)]
+             for key, n in (("GME", 3), ("AMC", 400), ("TSLA", 20_000))}
+    keyed = [(key, blob) for key, group in blobs.items() for blob in group]
+    assert hll.estimate_many(keyed) == {key: hll.estimate(group) for key, group in blobs.items()}
+    assert hll.estimate_many([]) == {}
+
+
+def test_top_tickers_unique_authors_close_to_exact(tmp_db):
+    gen = CorpusGenerator(7, now=int(time.time()))
+    db.write_rows(gen.mention_rows(20_000))
+    for hours in (1, 24, 168):
+        approx = {r["ticker"]: r["unique_authors"] for r in db.get_top_tickers(hours=hours, limit=50)}
+        exact = {r["ticker"]: r["unique_authors"] for r in db.get_top_tickers(hours=hours, limit=50, exact=True)}
+        assert approx.keys() == exact.keys() and exact
+        for ticker, truth in exact.items():
+            assert abs(approx[ticker] - truth) <= max(2, BOUND * truth), (hours, ticker)
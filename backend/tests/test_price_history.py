@@ -0,0 +1,97 @@
+from datetime import timedelta
+
+import pytest
+
+import db
+import earnings
+from bench.fake_yfinance import Ticker, TODAY
+
+
+class Counting(Ticker):
+    """The stub, recording each history() call's arguments and row count."""
+
+    def __init__(self, symbol, today=TODAY, calls=None):
+        super().__init__(symbol, today=today)
+        self.calls = [] if calls is None else calls
+
+    def history(self, *args, **kwargs):
+        frame = super().history(*args, **kwargs)
+        self.calls.append((kwargs, len(frame)))
+        return frame
+
+
+class Offline(Ticker):
+    def history(self, *args, **kwargs):
+        raise ConnectionError("offline")
+
+
+def _closes(frame):
+    return [round(float(c), 4) for c in frame["Close"]]
+
+
+def _full(symbol, day):
+    """The 5y window straight from the stub, tz-naive like the store."""
+    frame = Ticker(symbol, today=day).history(period="5y")
+    return frame.set_axis(frame.index.tz_localize(None))
+
+
+@pytest.mark.usefixtures("tmp_db")
+def test_refreshes_append_only_new_bars():
+    calls = []
+    first = earnings._price_history(Counting("GME", calls=calls), "GME", today=TODAY.date())
+    assert calls == [({"period": "5y"}, len(first))]
+    assert _closes(first) == _closes(_full("GME", TODAY)[lambda f: f.index >= first.index[0]])
+
+    # Same day: served from the store, no download
+    again = earnings._price_history(Counting("GME", calls=calls), "GME", today=TODAY.date())
+    assert len(calls) == 1 and _closes(again) == _closes(first)
+
+    # Days later: only the bars since the last stored date (which is re-fetched)
+    day = TODAY + timedelta(days=4)
+    later = earnings._price_history(Counting("GME", today=day, calls=calls), "GME", today=day.date())
+    (kwargs, rows), = calls[1:]
+    assert kwargs == {"start": first.index[-1].strftime("%Y-%m-%d")} and rows <= 4
+    full = _full("GME", day)
+    assert _closes(later[later.index >= full.index[0]]) == _closes(full)
+
+
+@pytest.mark.usefixtures("tmp_db")
+def test_resent_date_overwrites_intraday_bar():
+    earnings._price_history(Ticker("AMC"), "AMC", today=TODAY.date())
+    last = db.get_price_history("AMC")[-1]
+    db.append_price_history("AMC", [(last["date"], None, None, None, 1.0, None)], TODAY.date().isoformat())
+    day = TODAY + timedelta(days=1)
+    earnings._price_history(Ticker("AMC", today=day), "AMC", today=day.date())
+    assert [r for r in db.get_price_history("AMC", since=last["date"]) if r["date"] == last["date"]] == [last]
+
+
+@pytest.mark.usefixtures("tmp_db")
+def test_failed_download_keeps_stored_bars():
+    stored = earnings._price_history(Ticker("TSLA"), "TSLA", today=TODAY.date())
+    day = TODAY + timedelta(days=1)
+    offline = earnings._price_history(Offline("TSLA", today=day), "TSLA", today=day.date())
+    assert _closes(offline) == _closes(stored[stored.index >= offline.index[0]])
+    # Not marked as checked, so the next call retries
+    assert db.get_price_coverage("TSLA")[0] == TODAY.date().isoformat()
+
+    assert earnings._price_history(Offline("NOPE"), "NOPE", today=TODAY.date()) is None
+
+
+
+@pytest.mark.usefixtures("tmp_db")
+def test_option_enrichment_reads_only_stored_closes(monkeypatch):
+    import options
+    calls = []
+    refresh = earnings.refresh_price_history
+    monkeypatch.setattr(earnings, "refresh_price_history",
+                        lambda symbol, *args, **kwargs: calls.append(symbol) or refresh(symbol, *args, **kwargs))
+    posted = (TODAY - timedelta(days=7)).timestamp()
+    rows = [("GME", 30.0, "call", None, None, "GME 30c", "p1", 0.1, posted, "a", 1, 1.0, "wsb")] * 2 + \
+           [("AMC", 5.0, "put", None, None, "AMC 5p", "p2", 0.1, posted, "b", 1, 1.0, "wsb")]
+    assert [row[-2] for row in options.enrich_option_rows(rows)] == [None] * 3 and calls == []
+
+    # Most optioned first, up to the limit; a symbol refreshed today isn't downloaded again
+    assert options.refresh_option_prices(options.optioned_tickers(rows), TODAY.date(), limit=1) == ["GME"]
+    assert options.refresh_option_prices(["GME", "AMC"], TODAY.date(), limit=None) == ["AMC"]
+    assert calls == ["GME", "AMC"]
+    assert None not in [row[-2] for row in options.enrich_option_rows(rows)] and len(calls) == 2
@@ -0,0 +1,98 @@
+"""Every storage backend installed here gives SQLite's answers (WSB_STORAGE)."""
+
+import importlib.util
+import os
+import time
+import types
+
+import pytest
+
+import db
+from bench.run import _close_enough, _storage_outputs, _storage_rows
+
+_TABLES = ("mentions, options_flow, alert_baselines, alerts, leases, "
+           "ticker_rollups, rollup_authors, comentions, author_sketches")
+
+
+@pytest.fixture(scope="session")
+def database_url(tmp_path_factory):
+    """WSB_TEST_DATABASE_URL (a scratch database: tables are dropped), or a
+    throwaway pgserver instance."""
+    if not importlib.util.find_spec("psycopg_pool"):
+        pytest.skip("psycopg[pool] not installed")
+    url = os.environ.get("WSB_TEST_DATABASE_URL")
+    if url:
+        yield url
+        return
+    if not importlib.util.find_spec("pgserver"):
+        pytest.skip("no WSB_TEST_DATABASE_URL and pgserver not installed")
+    import pgserver
+    server = pgserver.get_server(str(tmp_path_factory.mktemp("pg")), cleanup_mode="stop")
+    yield server.get_uri()
+    server.cleanup()
+
+
+@pytest.fixture(params=["duckdb", "postgres"])
+def backend(request, tmp_path):
+    import storage
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb")
+        s = storage.DuckDBStorage(str(tmp_path / "test.duckdb"))
+    else:
+        s = storage.PostgresStorage(request.getfixturevalue("database_url"))
+        with s._transaction() as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {_TABLES}")
+    s.init_db()
+    yield s
+    s.close()
+
+
+@pytest.fixture
+def corpus():
+    now = int(time.time())
+    mentions, options = _storage_rows(types.SimpleNamespace(seed=5, n=lambda base: base // 50), now)
+    # Mixed weights within an item, so co-mention weights depend on which row is lighter
+    mentions = [row[:8] + (row[8] * (0.5 if i % 3 == 0 else 1.0),) + row[9:] for i, row in enumerate(mentions)]
+    return now, mentions, options
+
+
+def _write(s, mentions, options):
+    """Fresh rows in chunks that split items (their rows pair across transactions),
+    the same rows again in reverse, then a replay of some posts."""
+    replaced = sorted({row[1] for row in mentions[::50]})
+    replacement = [row[:2] + (0.9,) + row[3:] for row in mentions if row[1] in set(replaced)][::2]
+    stats = [s.write_rows(mentions, options, chunk_size=37), s.write_rows(mentions[::-1], options),
+             s.write_rows(replacement, (), replace_post_ids=replaced, chunk_size=1 << 30)]
+    return [{k: v for k, v in st.items() if k not in ("transactions", "lock_seconds")} for st in stats], replaced
+
+
+@pytest.mark.usefixtures("tmp_db")
+def test_backend_matches_sqlite(backend, corpus):
+    now, mentions, options = corpus
+    reference = db.SQLiteStorage()
+    expected_stats, replaced = _write(reference, mentions, options)
+    assert _write(backend, mentions, options) == (expected_stats, replaced)
+    # Hour-aligned windows move with the clock: compare within one hour
+    while True:
+        hour = int(time.time()) // 3600
+        expected = _storage_outputs(reference, now, set(replaced))
+        actual = _storage_outputs(backend, now, set(replaced))
+        if int(time.time()) // 3600 == hour:
+            break
+    assert [k for k in expected if not _close_enough(expected[k], actual[k])] == []
+
+
+def test_init_db_fills_derived_tables(backend, corpus):
+    now, mentions, options = corpus
+    backend.write_rows(mentions, options)
+
+    def reads():
+        related = backend.get_related_tickers(mentions[0][0], hours=168, limit=1000)
+        return backend.get_top_tickers(hours=168, limit=50), sorted(related, key=lambda t: t["ticker"])
+
+    before = reads()
+    with backend._transaction() as conn:
+        for table in ("ticker_rollups", "rollup_authors", "comentions", "author_sketches"):
+            backend._execute(conn, f"DELETE FROM {table}")
+    backend.init_db()
+    assert _close_enough(before, reads())
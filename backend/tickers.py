@@ -1,9 +1,23 @@
 import re
 import os
 import json
+import bisect
+import mmap
+import struct
+import threading
+import time
 import urllib.request
 
 CACHE_PATH = os.path.join(os.path.dirname(__file__), "data", "sec_tickers.json")
+BIN_PATH = os.path.join(os.path.dirname(__file__), "data", "sec_tickers.bin")
+SEC_URL = "https://www.sec.gov/files/company_tickers.json"
+
+# Refresh the SEC list in the background once it's older than this
+SEC_TICKERS_TTL = int(os.environ.get("WSB_SEC_TICKERS_TTL", str(7 * 86400)))
+# After a failed download, wait this long before trying again
+_RETRY_AFTER = 900
+# How often a process re-stats BIN_PATH to pick up a refresh made by another worker
+_RECHECK_INTERVAL = 60
 
 # Common English words, WSB slang, and abbreviations that look like tickers
 BLOCKLIST = {
@@ -61,40 +75,218 @@ BLOCKLIST = {
     "CASH", "FEES", "COST", "FREE", "PAID", "SAVE", "SPEND",
 }
 
+# Artifact layout: header, then `count` sorted records of `width` NUL-padded ASCII bytes
+_MAGIC = b"WSBT"
+_HEADER = struct.Struct("<4sBBIQ")  # magic, version, width, count, built_at
+
+
+class _Records:
+    """Sequence view over the fixed-width records so `bisect` can search the mmap directly."""
+
+    def __init__(self, buf, width, count):
+        self.buf = buf
+        self.width = width
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        off = _HEADER.size + i * self.width
+        return self.buf[off:off + self.width]
+
+
+class TickerSet:
+    """Read-only ticker set backed by a memory-mapped sorted array.
+
+    Opening is an mmap + header parse; pages are shared between every worker
+    process mapping the same file. Lookups binary-search the array and are
+    memoized, since WSB text repeats the same few hundred words.
+    """
+
+    def __init__(self, path=None, built_at=0, mm=None, width=0, count=0):
+        self.path = path
+        self.built_at = built_at
+        self._mm = mm
+        self._records = _Records(mm, width, count) if mm is not None else None
+        self._width = width
+        self._count = count
+        self._memo = {}
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, width, count, built_at = _HEADER.unpack_from(mm, 0)
+        if magic != _MAGIC or version != 1 or len(mm) < _HEADER.size + width * count:
+            mm.close()
+            raise ValueError(f"{path} is not a valid ticker artifact")
+        return cls(path, built_at, mm, width, count)
+
+    @classmethod
+    def empty(cls):
+        """No ticker list at all — `available` is False so callers can tighten their filters."""
+        return cls()
+
+    @property
+    def available(self):
+        return self._count > 0
+
+    @property
+    def age(self):
+        return time.time() - self.built_at
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __contains__(self, ticker):
+        hit = self._memo.get(ticker)
+        if hit is not None:
+            return hit
+        if not self._count:
+            return False
+        key = ticker.encode("ascii", "ignore")
+        found = False
+        if len(key) <= self._width:
+            key = key.ljust(self._width, b"\0")
+            i = bisect.bisect_left(self._records, key)
+            found = i < self._count and self._records[i] == key
+        if len(self._memo) < 50000:
+            self._memo[ticker] = found
+        return found
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._records[i].rstrip(b"\0").decode()
+
+
+def build_ticker_artifact(tickers, path=None):
+    """Write a sorted fixed-width ticker array to `path` atomically.
+
+    Uses write-to-temp + rename, so processes that already mapped the old file
+    keep a valid view until they reopen.
+    """
+    path = path or BIN_PATH
+    encoded = sorted({t.upper().encode("ascii", "ignore") for t in tickers if t})
+    width = max((len(t) for t in encoded), default=1)
+    tmp = f"{path}.tmp{os.getpid()}"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, 1, width, len(encoded), int(time.time())))
+        for t in encoded:
+            f.write(t.ljust(width, b"\0"))
+    os.replace(tmp, path)
+    return path
+
+
+def _download_sec_tickers():
+    """Fetch the current ticker list from SEC EDGAR. Raises on failure."""
+    headers = {"User-Agent": "wsb-sentiment-tracker admin@example.com"}
+    req = urllib.request.Request(SEC_URL, headers=headers)
+    with urllib.request.urlopen(req, timeout=15) as resp:
+        data = json.loads(resp.read().decode())
+    tickers = {entry["ticker"].upper() for entry in data.values()}
+    if not tickers:
+        raise ValueError("SEC returned an empty ticker list")
+    return tickers
+
+
 _sec_tickers = None
+_refresh_lock = threading.Lock()
+_refreshing = False
+_last_refresh_attempt = 0.0
+_last_recheck = 0.0
 
 
-def load_sec_tickers():
-    """Load valid ticker symbols from SEC EDGAR (cached locally)."""
-    global _sec_tickers
-    if _sec_tickers is not None:
-        return _sec_tickers
+def _refresh_sec_tickers():
+    """Download + rebuild the artifact. On failure the last-known-good list stays in place."""
+    global _sec_tickers, _refreshing
+    try:
+        tickers = _download_sec_tickers()
+        build_ticker_artifact(tickers)
+        _sec_tickers = TickerSet.open(BIN_PATH)
+        print(f"[tickers] Cached {len(tickers)} SEC tickers")
+    except Exception as e:
+        kept = len(_sec_tickers) if _sec_tickers else 0
+        print(f"[tickers] Warning: Could not refresh SEC tickers ({e}); keeping last-known-good list ({kept})")
+    finally:
+        _refreshing = False
+
 
-    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+def _schedule_refresh():
+    """Kick off a background refresh unless one is running or failed recently."""
+    global _refreshing, _last_refresh_attempt
+    with _refresh_lock:
+        if _refreshing or time.time() - _last_refresh_attempt < _RETRY_AFTER:
+            return
+        _refreshing = True
+        _last_refresh_attempt = time.time()
+    threading.Thread(target=_refresh_sec_tickers, name="sec-tickers-refresh", daemon=True).start()
 
+
+def _open_cached():
+    """Best local copy: the binary artifact, else the legacy JSON cache converted once."""
+    if os.path.exists(BIN_PATH):
+        try:
+            return TickerSet.open(BIN_PATH)
+        except (OSError, ValueError) as e:
+            print(f"[tickers] Warning: {e}")
     if os.path.exists(CACHE_PATH):
         with open(CACHE_PATH, "r") as f:
-            _sec_tickers = set(json.load(f))
-        return _sec_tickers
+            build_ticker_artifact(json.load(f))
+        return TickerSet.open(BIN_PATH)
+    return None
 
-    # Download from SEC EDGAR
-    url = "https://www.sec.gov/files/company_tickers.json"
-    headers = {"User-Agent": "wsb-sentiment-tracker admin@example.com"}
-    req = urllib.request.Request(url, headers=headers)
+
+def _maybe_reload():
+    """Pick up an artifact rebuilt by another process; refresh if ours is stale."""
+    global _sec_tickers, _last_recheck
+    now = time.time()
+    if now - _last_recheck < _RECHECK_INTERVAL:
+        return
+    _last_recheck = now
     try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            data = json.loads(resp.read().decode())
-        tickers = {entry["ticker"].upper() for entry in data.values()}
-        with open(CACHE_PATH, "w") as f:
-            json.dump(sorted(tickers), f)
-        _sec_tickers = tickers
-        print(f"[tickers] Cached {len(tickers)} SEC tickers")
+        with open(BIN_PATH, "rb") as f:
+            on_disk = _HEADER.unpack(f.read(_HEADER.size))[4]
+    except (OSError, struct.error):
+        on_disk = 0
+    if on_disk > _sec_tickers.built_at:
+        _sec_tickers = TickerSet.open(BIN_PATH)
+    if not _sec_tickers.available or _sec_tickers.age > SEC_TICKERS_TTL:
+        _schedule_refresh()
+
+
+def load_sec_tickers():
+    """Load valid ticker symbols from SEC EDGAR (cached locally as an mmap'd artifact).
+
+    Returns a TickerSet. A stale list is refreshed in the background; if no
+    list exists yet the first call downloads synchronously, and if that fails
+    an empty, unavailable set is returned (extract_tickers then only trusts
+    $-prefixed symbols) while retries continue in the background.
+    """
+    global _sec_tickers, _last_recheck, _last_refresh_attempt
+    if _sec_tickers is not None:
+        if isinstance(_sec_tickers, TickerSet):
+            _maybe_reload()
         return _sec_tickers
-    except Exception as e:
-        print(f"[tickers] Warning: Could not fetch SEC tickers: {e}")
-        _sec_tickers = set()
+
+    _last_recheck = time.time()
+    cached = _open_cached()
+    if cached is not None:
+        _sec_tickers = cached
+        if cached.age > SEC_TICKERS_TTL:
+            _schedule_refresh()
         return _sec_tickers
 
+    # Nothing on disk — first run must download before we can filter
+    _sec_tickers = TickerSet.empty()
+    _last_refresh_attempt = time.time()
+    _refresh_sec_tickers()
+    return _sec_tickers
+
 
 def extract_tickers(text):
     """Extract stock tickers from text. Returns set of uppercase ticker strings."""
@@ -103,20 +295,44 @@ def extract_tickers(text):
 
     found = set()
     sec_tickers = load_sec_tickers()
+    # Without any ticker list, bare uppercase words are almost all noise
+    have_list = bool(sec_tickers)
 
     # Pattern 1: $TICKER — high confidence, skip blocklist
     dollar_pattern = re.findall(r'\$([A-Z]{1,5})\b', text.upper())
     for t in dollar_pattern:
-        if len(t) >= 2 and (not sec_tickers or t in sec_tickers):
+        if len(t) >= 2 and (not have_list or t in sec_tickers):
             found.add(t)
 
     # Pattern 2: Bare uppercase words — filtered against blocklist + SEC list
+    if not have_list:
+        return found
     bare_pattern = re.findall(r'\b([A-Z]{2,5})\b', text)
     for t in bare_pattern:
         if t in BLOCKLIST:
             continue
-        if sec_tickers and t not in sec_tickers:
+        if t not in sec_tickers:
             continue
         found.add(t)
 
     return found
+
+
+# Anything extract_tickers/extract_options can match against a real ticker list
+# needs a '$', two uppercase letters in a row, or a one-letter symbol followed
+# by a strike or expiry keyword ("F 12c", "T weeklies").
+_CANDIDATE_RE = re.compile(r"\$|[A-Z]{2}|[A-Z]\s+(?:\d|(?i:0dte|week|dail|fd|month|leap))")
+
+
+def may_mention_ticker(text):
+    """Cheap pre-check: False only for text that can't yield a ticker mention or
+    options position, so it can skip sentiment scoring and extraction entirely.
+
+    Without a ticker list the options patterns accept lowercase symbols too, so
+    everything passes.
+    """
+    if not text:
+        return False
+    if _CANDIDATE_RE.search(text) is not None:
+        return True
+    return not load_sec_tickers()
@@ -0,0 +1,121 @@
+"""Background earnings warmer.
+
+After each scrape, the symbols at the top of the leaderboard get their
+earnings oracle result fetched (or refreshed before it expires) so the first
+click in the Earnings Oracle is served from SQLite instead of a live
+yfinance call. Fetches run on a small thread pool, submitted in leaderboard
+rank order so the top names land first.
+
+WSB_EARNINGS_WARM_TOP   how many leaderboard symbols to keep warm (0 disables)
+WSB_EARNINGS_WARM_WORKERS  concurrent fetches
+WSB_EARNINGS_WARM_AGE   refresh stored results older than this many seconds
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from db import store, get_earnings_summaries, save_earnings
+
+WARM_TOP_N = int(os.environ.get("WSB_EARNINGS_WARM_TOP", "25"))
+WARM_WORKERS = int(os.environ.get("WSB_EARNINGS_WARM_WORKERS", "4"))
+# Half the 24h TTL: a symbol that stays trending is refreshed before users can hit an expired row
+WARM_MAX_AGE = int(os.environ.get("WSB_EARNINGS_WARM_AGE", str(12 * 3600)))
+# Symbols yfinance had nothing for aren't retried on every scrape
+_FAILURE_BACKOFF = 6 * 3600
+
+metrics.describe("wsb_earnings_warm_total", "Earnings warmer outcomes per leaderboard symbol")
+metrics.describe("wsb_earnings_warm_fetch_seconds", "Time per earnings fetch made by the warmer")
+
+_lock = threading.Lock()
+_running = False
+_failed = {}  # symbol → time of the last failed fetch
+
+
+def _fetch(symbol):
+    from earnings import fetch_earnings_data  # deferred: yfinance + pandas
+
+    start = time.perf_counter()
+    try:
+        result = fetch_earnings_data(symbol)
+    finally:
+        metrics.observe("wsb_earnings_warm_fetch_seconds", time.perf_counter() - start)
+    if result.get("error") is not None:
+        _failed[symbol] = time.time()
+        metrics.inc("wsb_earnings_warm_total", result="error")
+        return False
+    save_earnings(result)
+    _failed.pop(symbol, None)
+    metrics.inc("wsb_earnings_warm_total", result="fetched")
+    return True
+
+
+def warm_earnings(top_n=None, workers=None, hours=24):
+    """Fetch earnings for the top `top_n` leaderboard symbols that have no
+    stored result, or one older than WARM_MAX_AGE. Blocks until done.
+
+    Returns a summary dict: fetched / fresh / skipped / failed counts.
+    """
+    from earnings import _ROASTS
+
+    top_n = WARM_TOP_N if top_n is None else top_n
+    workers = workers or WARM_WORKERS
+    start = time.time()
+    ranked = [t["ticker"] for t in store.get_top_tickers(hours=hours, limit=top_n)] if top_n > 0 else []
+    cutoff = start - WARM_MAX_AGE
+    fresh = {r["symbol"] for r in get_earnings_summaries(ranked) if r["fetched_at"] >= cutoff}
+
+    todo, skipped = [], 0
+    for symbol in ranked:
+        if symbol in fresh:
+            continue
+        # _ROASTS maps ETFs etc. to a joke; None entries do have earnings
+        if _ROASTS.get(symbol) is not None or start - _failed.get(symbol, 0) < _FAILURE_BACKOFF:
+            skipped += 1
+            continue
+        todo.append(symbol)
+    metrics.inc("wsb_earnings_warm_total", len(fresh), result="fresh")
+    metrics.inc("wsb_earnings_warm_total", skipped, result="skipped")
+
+    fetched = 0
+    if todo:
+        # The executor's queue is FIFO, so submitting in rank order fetches the top names first
+        with ThreadPoolExecutor(max_workers=min(workers, len(todo)), thread_name_prefix="earnings-warm") as pool:
+            fetched = sum(pool.map(_fetch, todo))
+    summary = {
+        "symbols": len(ranked),
+        "fresh": len(fresh),
+        "skipped": skipped,
+        "fetched": fetched,
+        "failed": len(todo) - fetched,
+        "seconds": round(time.time() - start, 2),
+    }
+    print(f"[warmer] {fetched}/{len(todo)} earnings fetched for the top {len(ranked)} "
+          f"({len(fresh)} already fresh, {skipped} skipped) in {summary['seconds']}s")
+    return summary
+
+
+def _run():
+    global _running
+    try:
+        warm_earnings()
+    except Exception as e:
+        print(f"[warmer] Warning: earnings warm-up failed ({e})")
+    finally:
+        _running = False
+
+
+def schedule_warm():
+    """Start warm_earnings() on a background thread unless one is already running.
+    Returns True if a run was started."""
+    global _running
+    if WARM_TOP_N <= 0:
+        return False
+    with _lock:
+        if _running:
+            return False
+        _running = True
+    threading.Thread(target=_run, name="earnings-warmer", daemon=True).start()
+    return True
@@ -7,6 +7,13 @@ import OptionsFlow from './components/OptionsFlow'
 
 const REFRESH_INTERVAL = 5 * 60 * 1000
 
+// /api/dashboard sends lists column-wise ({key: [values]}); back to a list of objects
+function rows(columns) {
+  const keys = Object.keys(columns)
+  const n = keys.length ? columns[keys[0]].length : 0
+  return Array.from({ length: n }, (_, i) => Object.fromEntries(keys.map(k => [k, columns[k][i]])))
+}
+
 const WSB_WISDOM = [
   "positions or ban",
   "buy high, sell low — this is the way",
@@ -43,6 +50,7 @@ const WSB_WISDOM = [
 export default function App() {
   const [hours, setHours] = useState(24)
   const [tickers, setTickers] = useState([])
+  const [options, setOptions] = useState(null)
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
   const [scraping, setScraping] = useState(false)
@@ -57,13 +65,19 @@ export default function App() {
     return () => clearInterval(timer)
   }, [])
 
-  const fetchTickers = useCallback(async () => {
+  // One request for the whole first view: tickers, options and status from one DB snapshot
+  const fetchDashboard = useCallback(async () => {
     try {
       setError(null)
-      const res = await fetch(`/api/tickers?hours=${hours}&limit=50`)
+      const res = await fetch(`/api/dashboard?hours=${hours}&limit=50`)
       if (!res.ok) throw new Error(`API returned ${res.status}`)
       const data = await res.json()
-      setTickers(data.tickers)
+      const { summary, flow } = data.options
+      setTickers(rows(data.tickers))
+      setOptions({
+        summary: { ...summary, top_calls: rows(summary.top_calls), top_puts: rows(summary.top_puts) },
+        flow: rows(flow),
+      })
       setLastUpdated(new Date())
     } catch (err) {
       setError(err.message)
@@ -74,17 +88,17 @@ export default function App() {
 
   useEffect(() => {
     setLoading(true)
-    fetchTickers()
-    const interval = setInterval(fetchTickers, REFRESH_INTERVAL)
+    fetchDashboard()
+    const interval = setInterval(fetchDashboard, REFRESH_INTERVAL)
     return () => clearInterval(interval)
-  }, [fetchTickers])
+  }, [fetchDashboard])
 
   async function handleScrape() {
     setScraping(true)
     try {
       const res = await fetch('/api/scrape', { method: 'POST' })
       if (!res.ok) throw new Error(`Scrape failed: ${res.status}`)
-      await fetchTickers()
+      await fetchDashboard()
     } catch (err) {
       setError(err.message)
     } finally {
@@ -187,7 +201,7 @@ export default function App() {
         </>
       )}
 
-      <OptionsFlow hours={hours} />
+      <OptionsFlow data={options} />
 
       <div className="footer">
         <div className="wisdom" key={wisdomIdx}>{WSB_WISDOM[wisdomIdx]}</div>
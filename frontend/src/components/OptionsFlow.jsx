@@ -1,18 +1,4 @@
-import { useState, useEffect } from 'react'
-
-export default function OptionsFlow({ hours }) {
-  const [data, setData] = useState(null)
-  const [loading, setLoading] = useState(true)
-
-  useEffect(() => {
-    setLoading(true)
-    fetch(`/api/options?hours=${hours}`)
-      .then(r => r.json())
-      .then(d => { setData(d); setLoading(false) })
-      .catch(() => setLoading(false))
-  }, [hours])
-
-  if (loading) return null
+export default function OptionsFlow({ data }) {
   if (!data || !data.summary || data.summary.total_options === 0) return null
 
   const { summary, flow } = data